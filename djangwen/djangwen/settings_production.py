@@ -0,0 +1,60 @@
+"""
+production profile of the djangwen settings, selected with
+DJANGO_SETTINGS_MODULE=djangwen.settings_production: persistent
+connections, SQLite tuned for concurrent readers and writers, and catalogue
+reads routed to a read-only connection of the same database (or to a
+replica, by pointing the replica alias elsewhere)
+"""
+import os
+import pathlib
+from djangwen.settings import *  # noqa: F401,F403
+from djangwen.settings import BASE_DIR, SECRET_KEY
+
+DEBUG = False
+
+SECRET_KEY = os.environ.get('DJANGWEN_SECRET_KEY', SECRET_KEY)
+
+ALLOWED_HOSTS = os.environ.get('DJANGWEN_ALLOWED_HOSTS', 'localhost').split(',')
+
+DATABASE_PATH = os.environ.get('DJANGWEN_DATABASE', os.path.join(BASE_DIR, 'db.sqlite3'))
+
+# pragmas run on every new connection; the backend is Django's SQLite
+# backend plus the pragmas and immediate options
+SQLITE_PRAGMAS = {
+    # WAL stays consistent without a sync on every commit
+    'synchronous': 'NORMAL',
+    'busy_timeout': 20000,
+    'mmap_size': 256 * 1024 * 1024,
+    # negative: KiB rather than pages
+    'cache_size': -64 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'flashcards.backends.sqlite3',
+        'NAME': DATABASE_PATH,
+        'CONN_MAX_AGE': 600,
+        'OPTIONS': {
+            # seconds a writer waits for the lock before "database is locked"
+            'timeout': 20,
+            # readers no longer wait for the review writers, nor they for
+            # readers; WAL is a property of the file, so set it here
+            'pragmas': dict(SQLITE_PRAGMAS, journal_mode='WAL'),
+            'immediate': True,
+        },
+    },
+    'replica': {
+        'ENGINE': 'flashcards.backends.sqlite3',
+        'NAME': pathlib.Path(os.path.abspath(DATABASE_PATH)).as_uri() + '?mode=ro',
+        'CONN_MAX_AGE': 600,
+        'OPTIONS': {'timeout': 20, 'pragmas': SQLITE_PRAGMAS},
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+
+DATABASE_ROUTERS = ['flashcards.routers.ReadReplicaRouter']
+
+FLASHCARDS_READ_DATABASE = 'replica'
+
+FLASHCARDS_METRICS = True
@@ -22,5 +22,15 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('accounts/', include('django.contrib.auth.urls')),
     path('', views.DeckListView.as_view(), name='deck-list'),
+    path('decks.json', views.DeckCatalogueView.as_view(), name='deck-catalogue'),
+    path('decks/new', views.DeckCreateView.as_view(), name='deck-create'),
+    path('decks/<int:deck_id>/status.json', views.DeckStatusView.as_view(), name='deck-status'),
+    path('decks/coverage.json', views.DeckCoverageView.as_view(), name='deck-coverage'),
+    path('search.json', views.SearchView.as_view(), name='search'),
+    path('metrics', views.MetricsView.as_view(), name='metrics'),
     path('deck-words/<int:deck_id>', views.DeckWordsListView.as_view(), name='deck-word-list'),
+    path('user-decks/<int:user_deck_id>/outcomes', views.UserDeckOutcomesView.as_view(), name='user-deck-outcomes'),
+    path('user-decks/<int:user_deck_id>/sort', views.UserDeckOutcomesView.as_view(sorting=True), name='user-deck-sort'),
+    path('user-decks/<int:user_deck_id>/session.json', views.UserDeckSessionView.as_view(), name='user-deck-session'),
+    path('user-decks/<int:user_deck_id>/play', views.UserDeckPlayView.as_view(), name='user-deck-play'),
 ]
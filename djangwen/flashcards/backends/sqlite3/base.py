@@ -0,0 +1,26 @@
+"""
+the SQLite backend with two more OPTIONS: pragmas, run on every new
+connection, and immediate, which starts transactions with BEGIN IMMEDIATE.
+In WAL mode a transaction that reads before it writes fails with "database
+is locked", without waiting, once another writer has committed since its
+read; taking the write lock at BEGIN makes it wait its turn instead.
+"""
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        self.pragmas = params.pop('pragmas', {})
+        self.immediate = params.pop('immediate', False)
+        return params
+
+    def get_new_connection(self, conn_params):
+        connection = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            connection.execute('PRAGMA {} = {}'.format(name, value))
+        return connection
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN IMMEDIATE' if self.immediate else 'BEGIN')
@@ -0,0 +1,256 @@
+"""
+synthetic data at a given scale and timings of the paths that matter on it,
+for the benchmark command, which runs them in a throwaway test database
+and test environment. generate() is seeded, so two runs at the same
+scale and seed build the same users, decks and card states and their
+timings can be compared.
+"""
+import itertools
+import platform
+import random
+import statistics
+import time
+from datetime import timedelta
+import django
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import Client
+from django.utils import timezone
+from flashcards.bulk import bulk_create_inherited, chunked, insert_rows
+from flashcards.management.commands.populate import load_deck
+from flashcards.metrics import QueryCounter
+from flashcards.models import ClipDeck, Deck, Profile, UserCard, UserDeck
+
+SCALES = {'1k': 1000, '100k': 100000, '1m': 1000000}
+HANZI = [chr(c) for c in range(0x4e00, 0x4e00 + 3000)]
+CARD_COLUMNS = [
+    'ease', 'last_time', 'priority', 'learning', 'sorted', 'to_study', 'due_at',
+    'card', 'user', 'user_deck',
+]
+
+
+def plan(user_cards):
+    """
+    how the user cards split into decks and users: decks of at most 2500
+    cards, the size of HSK 6, and at least two catalogue decks
+    """
+    deck_size = min(user_cards, 2500)
+    users = max(1, user_cards // deck_size)
+    return {
+        'user_cards': deck_size * users,
+        'deck_size': deck_size,
+        'decks': max(2, min(users, 20)),
+        'users': users,
+        'clips': max(1, users // 10),
+    }
+
+
+def hanzi(i):
+    """
+    a word of its own for every i: i written in base len(HANZI)
+    """
+    word = ''
+    while True:
+        i, digit = divmod(i, len(HANZI))
+        word = HANZI[digit] + word
+        if not i:
+            return word
+
+
+def make_words(rng, n, start):
+    for i in range(start, start + n):
+        zi = hanzi(i)
+        yield {
+            'zi_simp': zi,
+            'zi_trad': zi,
+            'pinyin_number': 'zi{}'.format(rng.randint(1, 4)),
+            'pinyin_tone': 'zi',
+            'english': 'word {}'.format(i),
+            'hsk': rng.randint(1, 6),
+        }
+
+
+def card_state(rng, progress, position, deck_size, now):
+    """
+    one card of a learner who has seen the first progress share of the
+    deck: eases double with every right answer and the higher the ease the
+    longer ago the card was seen
+    """
+    if position >= progress * deck_size:
+        return (1, None, False, False, rng.random() < 0.2, True, None)
+    ease = 2 ** min(int(rng.expovariate(0.5)), 9)
+    last_time = now - timedelta(days=rng.uniform(0, ease))
+    to_study = ease < 64 or rng.random() < 0.5
+    return (
+        ease, last_time, rng.random() < 0.1, False, True, to_study,
+        last_time + timedelta(days=ease),
+    )
+
+
+def generate(user_cards, seed=0, batch_size=2000, progress=None):
+    """
+    creates the catalogue decks, clip decks, users and user decks of a
+    scale of user_cards; returns what was created
+    """
+    rng = random.Random(seed)
+    shape = plan(user_cards)
+    now = timezone.now()
+    decks = []
+    for d in range(shape['decks']):
+        rows = list(make_words(rng, shape['deck_size'], d * shape['deck_size']))
+        decks.append(load_deck('Benchmark {}'.format(d + 1), rows, batch_size=batch_size))
+    deck_cards = {
+        d.id: list(d.cards.order_by('id').values_list('id', flat=True)) for d in decks
+    }
+
+    total = shape['decks'] * shape['deck_size']
+    clips = [
+        ClipDeck(type='clip', name='Clip {}'.format(i + 1), text='。'.join(
+            ''.join(hanzi(rng.randrange(total)) for _ in range(10)) for _ in range(30)
+        ))
+        for i in range(shape['clips'])
+    ]
+    with transaction.atomic():
+        bulk_create_inherited(ClipDeck, clips, batch_size)
+
+    users = [User(username='bench-{}'.format(i)) for i in range(shape['users'])]
+    for user in users:
+        user.set_unusable_password()
+    User.objects.bulk_create(users, batch_size)
+    users = list(User.objects.filter(username__startswith='bench-').order_by('id'))
+    # what the post_save receivers would have made
+    Profile.objects.bulk_create([Profile(user=u) for u in users], batch_size)
+    user_decks = []
+    for i, user in enumerate(users):
+        deck = decks[i % len(decks)]
+        user_decks.append(UserDeck(user=user, deck=deck, name=deck.name))
+    UserDeck.objects.bulk_create(user_decks, batch_size)
+    user_decks = list(UserDeck.objects.filter(user__in=users).order_by('id'))
+
+    def rows():
+        for user_deck in user_decks:
+            share = rng.betavariate(2, 3)
+            for position, card_id in enumerate(deck_cards[user_deck.deck_id]):
+                state = card_state(rng, share, position, shape['deck_size'], now)
+                yield state + (card_id, user_deck.user_id, user_deck.id)
+
+    for n, batch in enumerate(chunked(rows(), batch_size * 10)):
+        insert_rows(UserCard, CARD_COLUMNS, batch, batch_size)
+        if progress:
+            progress((n + 1) * batch_size * 10)
+    for batch in chunked([d.id for d in user_decks], 200):
+        UserDeck.prebuild(batch)
+    return dict(shape, deck_ids=[d.id for d in decks], user_deck_ids=[d.id for d in user_decks])
+
+
+def measure(run, setup=None, repeat=5):
+    """
+    times repeat calls of run(target), each on a fresh target from setup(i)
+    with a cold cache; returns the median and best seconds and the queries
+    of a run
+    """
+    timings, queries = [], []
+    for i in range(repeat):
+        target = setup(i) if setup else None
+        cache.clear()
+        counter = QueryCounter()
+        start = time.perf_counter()
+        with connection.execute_wrapper(counter):
+            run(target)
+        timings.append(time.perf_counter() - start)
+        queries.append(counter.count)
+    return {
+        'seconds': statistics.median(timings),
+        'best': min(timings),
+        'queries': max(queries),
+        'runs': repeat,
+    }
+
+
+def benchmarks(data, rng):
+    """
+    (name, run, setup) of every benchmark over the data generate() made
+    """
+    deck = Deck.objects.get(id=data['deck_ids'][0])
+    user_decks = data['user_deck_ids']
+    new_users = itertools.count()
+
+    def new_user(i):
+        user = User(username='bench-new-{}'.format(next(new_users)))
+        user.save()
+        return UserDeck(user=user)
+
+    def user_deck(i):
+        return UserDeck.objects.get(id=user_decks[i % len(user_decks)])
+
+    def grown_user_deck(i):
+        # cards added to its deck since the user deck was populated
+        ud = user_deck(i)
+        other = Deck.objects.filter(id__in=data['deck_ids']).exclude(id=ud.deck_id).first()
+        owned = UserCard.objects.filter(user_id=ud.user_id).values('card_id')
+        ud.deck.cards.add(*other.cards.exclude(id__in=owned)[:50])
+        return ud
+
+    def stale_user_deck(i):
+        ud = user_deck(i)
+        ud.last_date = None
+        return ud
+
+    def outcomes(i):
+        ud = user_deck(i)
+        cards = ud.get_flash_cards()[:20]
+        return ud, {
+            str(n): {'id': c['id'], 'result': rng.choice('zx')} for n, c in enumerate(cards, 1)
+        }
+
+    client = Client()
+    client.force_login(UserDeck.objects.get(id=user_decks[0]).user)
+
+    return [
+        ('populate', lambda ud: ud.populate(deck), new_user),
+        ('populate_incremental', lambda ud: ud.populate(), grown_user_deck),
+        ('shuffle', lambda ud: ud.shuffle(), stale_user_deck),
+        ('prebuild', lambda ids: UserDeck.prebuild(ids), lambda i: user_decks[:200]),
+        ('ingest_outcomes', lambda args: args[0].ingest_outcomes(args[1]), outcomes),
+        ('stats', lambda ud: ud.get_stats(), user_deck),
+        ('deck_list', lambda _: client.get('/'), None),
+        ('deck_words', lambda _: client.get('/deck-words/{}'.format(deck.id)), None),
+    ]
+
+
+def run_benchmarks(data, repeat=5, only=None, seed=0):
+    rng = random.Random(seed)
+    results = {}
+    for name, run, setup in benchmarks(data, rng):
+        if not only or name in only:
+            results[name] = measure(run, setup, repeat)
+    return {
+        'scale': data['user_cards'],
+        'seed': seed,
+        'environment': {
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+        },
+        'data': {k: v for k, v in data.items() if not k.endswith('_ids')},
+        'results': results,
+    }
+
+
+def compare(current, baseline):
+    """
+    (name, baseline seconds, seconds, speedup, query change) of every
+    benchmark in both; speedup above 1 is faster than the baseline
+    """
+    rows = []
+    for name, result in current['results'].items():
+        base = baseline['results'].get(name)
+        if base is None:
+            continue
+        rows.append((
+            name, base['seconds'], result['seconds'],
+            base['seconds'] / max(result['seconds'], 1e-9),
+            result['queries'] - base['queries'],
+        ))
+    return rows
@@ -0,0 +1,44 @@
+"""
+bitsets over card ids: bit n of a bitset is bit n % 8 of byte n // 8, so
+a bitset reads as a little-endian int and popcounts are int operations
+"""
+
+
+def from_ids(ids):
+    ids = list(ids)
+    if not ids:
+        return b''
+    bits = bytearray(max(ids) // 8 + 1)
+    for i in ids:
+        bits[i >> 3] |= 1 << (i & 7)
+    return bytes(bits)
+
+
+def to_int(bits):
+    return int.from_bytes(bits or b'', 'little')
+
+
+def from_int(n):
+    return n.to_bytes((n.bit_length() + 7) // 8, 'little')
+
+
+def update(bits, add=(), remove=()):
+    """
+    returns bits with the ids in add set and the ids in remove cleared
+    """
+    n = to_int(bits)
+    n |= to_int(from_ids(add))
+    n &= ~to_int(from_ids(remove))
+    return from_int(n)
+
+
+def count(n):
+    return bin(n).count('1')
+
+
+def ids(bits):
+    return [
+        i * 8 + j
+        for i, byte in enumerate(bits or b'') if byte
+        for j in range(8) if byte >> j & 1
+    ]
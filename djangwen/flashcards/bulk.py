@@ -0,0 +1,147 @@
+from django.core.management.color import no_style
+from django.db import connections, router
+
+
+def chunked(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def allocate_ids(model, objs, db):
+    """
+    sets primary keys on objs that no other writer can take: drawn from the
+    sequence on PostgreSQL, elsewhere the ones after the largest id, read
+    under a lock held to the end of the transaction (SELECT ... FOR UPDATE,
+    or on SQLite the write lock taken by BEGIN IMMEDIATE)
+    """
+    connection = connections[db]
+    pk = model._meta.pk
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)',
+                [model._meta.db_table, pk.column, len(objs)],
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+    else:
+        last = model._base_manager.using(db).select_for_update().order_by(
+            '-pk'
+        ).values_list('pk', flat=True).first() or 0
+        ids = range(last + 1, last + 1 + len(objs))
+    for obj, i in zip(objs, ids):
+        setattr(obj, pk.attname, i)
+        obj._state.adding = False
+        obj._state.db = db
+
+
+def reset_sequence(model, connection):
+    # the ids came from the sequence on PostgreSQL, and setting it back to
+    # the largest committed id would hand out the ones other writers hold
+    if connection.vendor != 'postgresql':
+        with connection.cursor() as cursor:
+            for statement in connection.ops.sequence_reset_sql(no_style(), [model]):
+                cursor.execute(statement)
+
+
+def bulk_create_with_ids(model, objs, batch_size=500):
+    """
+    bulk_create that sets the primary keys of objs on every backend, where
+    SQLite would leave them empty; call it inside a transaction
+    """
+    objs = list(objs)
+    if not objs:
+        return objs
+    db = router.db_for_write(model)
+    allocate_ids(model, objs, db)
+    model._base_manager.using(db).bulk_create(objs, batch_size=batch_size)
+    reset_sequence(model, connections[db])
+    return objs
+
+
+def bulk_create_inherited(model, objs, batch_size=500):
+    """
+    bulk_create for multi-table inheritance children such as Word or
+    ArticleDeck, which Django's bulk_create refuses. Primary keys are
+    allocated up front so the parent and child rows can be inserted in
+    batches; call it inside a transaction.
+    """
+    objs = list(objs)
+    if not objs:
+        return objs
+    parent = next(iter(model._meta.parents))
+    link = model._meta.parents[parent]
+    db = router.db_for_write(model)
+    connection = connections[db]
+
+    allocate_ids(parent, objs, db)
+    for obj in objs:
+        setattr(obj, link.attname, getattr(obj, parent._meta.pk.attname))
+
+    parents = []
+    for obj in objs:
+        fields = {f.attname: getattr(obj, f.attname) for f in parent._meta.concrete_fields}
+        parents.append(parent(**fields))
+    parent._base_manager.using(db).bulk_create(parents, batch_size=batch_size)
+
+    qn = connection.ops.quote_name
+    fields = model._meta.local_concrete_fields
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        qn(model._meta.db_table),
+        ', '.join(qn(f.column) for f in fields),
+        ', '.join(['%s'] * len(fields)),
+    )
+    with connection.cursor() as cursor:
+        for batch in chunked(objs, batch_size):
+            cursor.executemany(sql, [
+                [f.get_db_prep_save(getattr(obj, f.attname), connection) for f in fields]
+                for obj in batch
+            ])
+    reset_sequence(parent, connection)
+    return objs
+
+
+def insert_rows(model, fields, rows, batch_size=2000):
+    """
+    inserts plain tuples of column values with executemany, skipping the
+    per-object work of bulk_create for narrow tables such as an index
+    """
+    db = router.db_for_write(model)
+    connection = connections[db]
+    qn = connection.ops.quote_name
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        qn(model._meta.db_table),
+        ', '.join(qn(model._meta.get_field(f).column) for f in fields),
+        ', '.join(['%s'] * len(fields)),
+    )
+    with connection.cursor() as cursor:
+        for batch in chunked(rows, batch_size):
+            cursor.executemany(sql, batch)
+
+
+def insert_select(model, queryset, **columns):
+    """
+    INSERT INTO model's table the rows selected by queryset, one column per
+    keyword argument, in a single statement:
+
+        insert_select(UserCard, through, card=F('card_id'), ease=Value(1))
+    """
+    aliases = {'_insert_{}'.format(name): expression for name, expression in columns.items()}
+    queryset = queryset.annotate(**aliases).values(*aliases)
+    db = router.db_for_write(model)
+    connection = connections[db]
+    select, params = queryset.query.get_compiler(using=db).as_sql()
+    qn = connection.ops.quote_name
+    sql = 'INSERT INTO {} ({}) {}'.format(
+        qn(model._meta.db_table),
+        ', '.join(qn(model._meta.get_field(name).column) for name in columns),
+        select,
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.rowcount
@@ -0,0 +1,87 @@
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.http import quote_etag
+
+CATALOGUE_VERSION = 'catalogue:version'
+DECK_VERSION = 'deck:{}:version'
+DECK_BITS = 'deck:{}:bits:{}'
+USER_DECK_SESSION = 'user-deck:{}:session-state'
+SESSION_PAYLOAD = 'user-deck:{}:session:{}:{}:{}:{}'
+
+
+def get_catalogue_version():
+    """
+    the time the catalogue last changed, used both as the cache version
+    and as the Last-Modified of the pages built from it
+    """
+    version = cache.get(CATALOGUE_VERSION)
+    if version is None:
+        version = timezone.now().replace(microsecond=0)
+        if not cache.add(CATALOGUE_VERSION, version, None):
+            version = cache.get(CATALOGUE_VERSION, version)
+    return version
+
+
+def bump_catalogue():
+    cache.set(CATALOGUE_VERSION, timezone.now(), None)
+
+
+def catalogue_etag(request, *args, **kwargs):
+    return quote_etag('catalogue-{}'.format(get_catalogue_version().timestamp()))
+
+
+def deck_list_etag(request, *args, **kwargs):
+    # the deck list adds a Known column for logged in users
+    return quote_etag('deck-list-{}-{}'.format(
+        get_catalogue_version().timestamp(), int(request.user.is_authenticated)
+    ))
+
+
+def catalogue_last_modified(request, *args, **kwargs):
+    return get_catalogue_version()
+
+
+def get_deck_version(deck_id):
+    key = DECK_VERSION.format(deck_id)
+    version = cache.get(key)
+    if version is None:
+        version = timezone.now()
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def get_deck_versions(deck_ids):
+    keys = {DECK_VERSION.format(deck_id): deck_id for deck_id in deck_ids}
+    versions = {keys[k]: v for k, v in cache.get_many(keys).items()}
+    for deck_id in set(keys.values()) - set(versions):
+        versions[deck_id] = get_deck_version(deck_id)
+    return versions
+
+
+def bump_decks(deck_ids):
+    now = timezone.now()
+    cache.set_many({DECK_VERSION.format(deck_id): now for deck_id in deck_ids}, None)
+
+
+def deck_bits_key(deck_id, version):
+    return DECK_BITS.format(deck_id, version.timestamp())
+
+
+def get_user_deck_session(user_deck_id):
+    return cache.get(USER_DECK_SESSION.format(user_deck_id))
+
+
+def set_user_deck_session(user_deck):
+    # the day tells the session view when the deck is due a new session
+    state = (user_deck.user_id, user_deck.session, user_deck.last_date)
+    cache.set(USER_DECK_SESSION.format(user_deck.id), state, None)
+    return state
+
+
+def clear_user_deck_sessions(user_deck_ids):
+    cache.delete_many([USER_DECK_SESSION.format(i) for i in user_deck_ids])
+
+
+def session_payload_key(user_deck_id, session, day, sorting, page=''):
+    return SESSION_PAYLOAD.format(user_deck_id, session, day.isoformat(), int(sorting), page)
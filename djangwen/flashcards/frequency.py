@@ -0,0 +1,91 @@
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from django.db import transaction
+from flashcards.bulk import chunked
+from flashcards.caching import bump_decks
+from flashcards.models import ArticleDeck, Card, ClipDeck, Deck
+from flashcards.segmenter import get_segmenter
+
+COUNTED_MODELS = (ArticleDeck, ClipDeck)
+
+_worker_segmenter = None
+
+
+def init_worker(segmenter):
+    global _worker_segmenter
+    _worker_segmenter = segmenter
+
+
+def count_shard(texts, segmenter=None):
+    """
+    segments {key: text} into {key: Counter of words}; in worker processes
+    the segmenter comes from init_worker
+    """
+    segmenter = segmenter or _worker_segmenter
+    return {
+        key: Counter(segmenter.segment_chunks(text[i:i + 65536] for i in range(0, len(text), 65536)))
+        for key, text in texts.items()
+    }
+
+
+def count_texts(texts, jobs=1, shard_size=20):
+    segmenter = get_segmenter()
+    if jobs <= 1 or len(texts) <= shard_size:
+        return count_shard(texts, segmenter)
+    shards = [dict(shard) for shard in chunked(texts.items(), shard_size)]
+    counts = {}
+    with ProcessPoolExecutor(jobs, initializer=init_worker, initargs=(segmenter,)) as executor:
+        for result in executor.map(count_shard, shards):
+            counts.update(result)
+    return counts
+
+
+def count_frequencies(batch_size=100, jobs=1, shard_size=20):
+    """
+    adds the words of every ArticleDeck and ClipDeck not counted yet to
+    Card.frequency and flips their counted flag, batch_size decks per
+    transaction. A deck is only counted by the run that flips its flag, so
+    the stage can be interrupted, rerun or run twice at once without
+    counting any text twice. Returns the number of decks counted.
+    """
+    total = 0
+    for model in COUNTED_MODELS:
+        last_id = 0
+        while True:
+            decks = list(
+                model.objects.filter(counted=False, id__gt=last_id)
+                .order_by('id').values_list('id', 'text')[:batch_size]
+            )
+            if not decks:
+                break
+            last_id = decks[-1][0]
+            deck_words = count_texts(dict(decks), jobs=jobs, shard_size=shard_size)
+            total += add_deck_words(model, deck_words)
+    return total
+
+
+def add_deck_words(model, deck_words):
+    """
+    adds {deck_id: Counter of words} to Card.frequency for the decks whose
+    counted flag this call flips, in one transaction, then bumps the decks
+    holding the counted cards, whose word pages sort by frequency; returns
+    how many
+    """
+    card_ids = Card.match_words(w for words in deck_words.values() for w in words)
+    total = 0
+    with transaction.atomic():
+        counts = Counter()
+        for deck_id, words in deck_words.items():
+            if model.objects.filter(id=deck_id, counted=False).update(counted=True):
+                counts.update({card_ids[w]: n for w, n in words.items() if w in card_ids})
+                total += 1
+        Card.add_frequencies(counts)
+
+    through = Deck.cards.through
+    deck_ids = set()
+    for batch in chunked(counts, 500):
+        deck_ids.update(
+            through.objects.filter(card_id__in=batch).values_list('deck_id', flat=True).distinct()
+        )
+    bump_decks(deck_ids)
+    return total
@@ -4,4 +4,17 @@ import re
 def get_chinese(context):
     filter = re.compile(u'[^\u4E00-\u9FA5]')  # non-Chinese unicode range
     context = filter.sub(r'', context)  # remove all non-Chinese characters
-    return context
\ No newline at end of file
+    return context
+
+
+def get_outcomes(outcomes):
+    """
+    flattens the outcomes posted by flash.js into (card_id, result) pairs
+    in the order the cards were played, skipping keys such as 'deck_id'
+    """
+    rows = []
+    for key, row in outcomes.items():
+        if str(key).isdigit() and isinstance(row, dict):
+            rows.append((int(key), int(row.get('id')), row.get('result')))
+    rows.sort()
+    return [(card_id, result) for _, card_id, result in rows]
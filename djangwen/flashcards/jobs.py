@@ -0,0 +1,207 @@
+"""
+a job queue kept in the Job table, so it needs no broker: saving an
+ArticleDeck or ClipDeck only inserts its rows and a queued Job, and the
+run_jobs command segments, links and counts the deck in the background.
+Workers claim jobs with a conditional UPDATE, so several can share the
+table; a failed job is retried with a growing delay up to max_attempts,
+and a deck is counted only by the job that flips its counted flag, so
+running a job again never counts a text twice.
+"""
+import os
+import socket
+import threading
+import traceback
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections, connections
+from django.db.models import F
+from django.utils import timezone
+from flashcards.caching import bump_catalogue, bump_decks
+from flashcards.frequency import add_deck_words, count_texts
+from flashcards.metrics import span
+from flashcards.models import ArticleDeck, Card, ClipDeck, Deck, Job
+from flashcards.scraper import scrape
+
+HANDLERS = {}
+
+
+class JobError(Exception):
+    pass
+
+
+def handler(kind):
+    def decorator(func):
+        HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+def link_words(deck_id, words, batch_size=500):
+    card_ids = Card.match_words(words)
+    through = Deck.cards.through
+    through.objects.bulk_create([
+        through(deck_id=deck_id, card_id=card_ids[w]) for w in words if w in card_ids
+    ], batch_size=batch_size, ignore_conflicts=True)
+    bump_catalogue()
+    bump_decks([deck_id])
+
+
+@handler('clipdeck')
+def process_clip_deck(job):
+    deck = ClipDeck.objects.get(id=job.deck_id)
+    words = count_texts({deck.id: deck.text})[deck.id]
+    link_words(deck.id, words)
+    add_deck_words(ClipDeck, {deck.id: words})
+
+
+@handler('articledeck')
+def process_article_deck(job):
+    deck = ArticleDeck.objects.get(id=job.deck_id)
+    if deck.text:
+        words = count_texts({deck.id: deck.text})[deck.id]
+        link_words(deck.id, words)
+    else:
+        scrapers, errors = scrape([deck.url], public_only=True)
+        if not scrapers:
+            raise JobError(errors.get(deck.url, 'Could not scrape {}'.format(deck.url)))
+        # other decks may have the same url
+        ArticleDeck.save_scrapers(scrapers, decks=[deck])
+        words = scrapers[0].words
+    add_deck_words(ArticleDeck, {deck.id: words})
+
+
+DECK_MODELS = {'articledeck': ArticleDeck, 'clipdeck': ClipDeck}
+
+
+def set_deck_status(job, status):
+    model = DECK_MODELS.get(job.kind)
+    if model is not None and job.deck_id is not None:
+        model.objects.filter(id=job.deck_id).update(status=status)
+
+
+def enqueue(kind, deck=None, **kwargs):
+    if kind not in HANDLERS:
+        raise ValueError('No handler for {} jobs'.format(kind))
+    return Job.objects.create(kind=kind, deck=deck, **kwargs)
+
+
+def worker_name():
+    return '{}:{}:{}'.format(socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+
+
+def release_stale(stale_after):
+    """
+    requeues the jobs of workers that died while running them, or fails
+    them when they are out of attempts
+    """
+    stale = Job.objects.filter(status=Job.RUNNING, started_at__lt=timezone.now() - stale_after)
+    for job in stale.filter(attempts__gte=F('max_attempts')):
+        if Job.objects.filter(id=job.id, status=Job.RUNNING).update(
+            status=Job.FAILED, finished_at=timezone.now(), error='Worker lost'
+        ):
+            set_deck_status(job, 'failed')
+    return stale.update(status=Job.QUEUED)
+
+
+def claim(worker, limit):
+    """
+    marks up to limit due jobs as running under worker and returns them;
+    a job another worker claimed first is skipped
+    """
+    now = timezone.now()
+    ids = list(Job.objects.filter(
+        status=Job.QUEUED, run_after__lte=now
+    ).order_by('run_after', 'id').values_list('id', flat=True)[:limit])
+    if not ids:
+        return []
+    Job.objects.filter(id__in=ids, status=Job.QUEUED).update(
+        status=Job.RUNNING, worker=worker, started_at=now, attempts=F('attempts') + 1
+    )
+    return list(Job.objects.filter(id__in=ids, status=Job.RUNNING, worker=worker, started_at=now))
+
+
+def retry_delay(attempts):
+    return timedelta(seconds=getattr(settings, 'FLASHCARDS_JOB_RETRY_SECONDS', 30) * 2 ** (attempts - 1))
+
+
+def run_job(job):
+    """
+    runs a claimed job and records how it went; returns its status
+    """
+    try:
+        set_deck_status(job, 'processing')
+        with span('job.' + job.kind):
+            HANDLERS[job.kind](job)
+    except Exception:
+        error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            status = Job.QUEUED
+            Job.objects.filter(id=job.id).update(
+                status=status, error=error, run_after=timezone.now() + retry_delay(job.attempts)
+            )
+            set_deck_status(job, 'queued')
+        else:
+            status = Job.FAILED
+            Job.objects.filter(id=job.id).update(status=status, error=error, finished_at=timezone.now())
+            set_deck_status(job, 'failed')
+    else:
+        status = Job.DONE
+        Job.objects.filter(id=job.id).update(status=status, error='', finished_at=timezone.now())
+        set_deck_status(job, 'ready')
+    return status
+
+
+def run_job_in_thread(job):
+    # each pool thread keeps its own connection from job to job, as a
+    # server thread does from request to request
+    close_old_connections()
+    try:
+        return run_job(job)
+    finally:
+        close_old_connections()
+
+
+def init_worker():
+    # the forked workers must not share the parent's connection
+    connections.close_all()
+
+
+def run_worker(workers=1, processes=False, once=False, poll=1.0, batch_size=None,
+               stale_after=timedelta(minutes=30), stop=None, progress=None):
+    """
+    claims and runs jobs in batches of batch_size (workers by default) in
+    workers threads, or processes; with once it returns when no job is due,
+    otherwise it polls every poll seconds until stop is set. Calls
+    progress(job, status) after each job and returns {status: n}.
+    """
+    name = worker_name()
+    stop = stop or threading.Event()
+    batch_size = batch_size or workers
+    totals = {}
+    executor, run = None, run_job
+    if workers > 1:
+        if processes:
+            connections.close_all()
+            executor = ProcessPoolExecutor(workers, initializer=init_worker)
+        else:
+            executor, run = ThreadPoolExecutor(workers), run_job_in_thread
+    try:
+        while not stop.is_set():
+            release_stale(stale_after)
+            jobs = claim(name, batch_size)
+            if not jobs:
+                if once:
+                    break
+                stop.wait(poll)
+                continue
+            statuses = executor.map(run, jobs) if executor else map(run, jobs)
+            for job, status in zip(jobs, statuses):
+                totals[status] = totals.get(status, 0) + 1
+                if progress is not None:
+                    progress(job, status)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return totals
@@ -0,0 +1,175 @@
+"""
+the Word and Character tables compiled into one read-only file that every
+process maps into memory, so lookups need neither queries nor a load step.
+
+layout, little-endian:
+    header    MAGIC, version, entry count, then the offsets of the sections
+    entries   one fixed-width RECORD per entry, sorted by simplified hanzi:
+              (offset, length) into the strings of zi_simp, zi_trad,
+              pinyin_number, pinyin_tone and english, then card id,
+              frequency and hsk
+    trad      entry numbers (u32) sorted by traditional hanzi
+    strings   every string, UTF-8, each stored once
+"""
+import mmap
+import os
+import struct
+from collections import namedtuple
+from django.conf import settings
+
+MAGIC = b'DJLX'
+VERSION = 1
+HEADER = struct.Struct('<4sIIIII')
+RECORD = struct.Struct('<' + 'IH' * 5 + 'IiB3x')
+INDEX = struct.Struct('<I')
+STRING_FIELDS = ('zi_simp', 'zi_trad', 'pinyin_number', 'pinyin_tone', 'english')
+
+Entry = namedtuple('Entry', STRING_FIELDS + ('card_id', 'frequency', 'hsk'))
+
+
+def build_lexicon(path, entries):
+    """
+    writes entries (Entry tuples) to path, replacing it atomically so that
+    processes that have the old file mapped keep a consistent copy
+    """
+    entries = sorted(entries, key=lambda e: (e.zi_simp, e.hsk or 99, e.card_id))
+    strings = bytearray()
+    positions = {}
+
+    def intern(s):
+        if s not in positions:
+            data = s.encode('utf-8')
+            positions[s] = (len(strings), len(data))
+            strings.extend(data)
+        return positions[s]
+
+    records = bytearray()
+    for e in entries:
+        fields = []
+        for name in STRING_FIELDS:
+            fields.extend(intern(getattr(e, name)))
+        records.extend(RECORD.pack(*fields, e.card_id, e.frequency, e.hsk))
+    trad = sorted(range(len(entries)), key=lambda i: (entries[i].zi_trad, i))
+
+    entries_at = HEADER.size
+    trad_at = entries_at + len(records)
+    strings_at = trad_at + INDEX.size * len(trad)
+    tmp = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(entries), entries_at, trad_at, strings_at))
+        f.write(records)
+        f.write(b''.join(INDEX.pack(i) for i in trad))
+        f.write(strings)
+    os.replace(tmp, path)
+    return len(entries)
+
+
+class Lexicon():
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.count, self.entries_at, self.trad_at, self.strings_at = (
+            HEADER.unpack_from(self.buf)
+        )
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('{} is not a version {} lexicon'.format(path, VERSION))
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, word):
+        return bool(self.lookup(word))
+
+    def close(self):
+        self.buf.close()
+
+    def _record(self, i):
+        return RECORD.unpack_from(self.buf, self.entries_at + i * RECORD.size)
+
+    def _string(self, offset, length):
+        start = self.strings_at + offset
+        return self.buf[start:start + length]
+
+    def _trad(self, i):
+        return INDEX.unpack_from(self.buf, self.trad_at + i * INDEX.size)[0]
+
+    def entry(self, i):
+        record = self._record(i)
+        strings = [
+            self._string(record[n], record[n + 1]).decode('utf-8')
+            for n in range(0, 2 * len(STRING_FIELDS), 2)
+        ]
+        return Entry(*strings, *record[-3:])
+
+    def _range(self, key, field, position=lambda i: i):
+        """
+        the entries whose field equals key, by binary search over position
+        """
+        n = 2 * STRING_FIELDS.index(field)
+
+        def value(i):
+            record = self._record(position(i))
+            return self._string(record[n], record[n + 1])
+
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if value(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        matches = []
+        while lo < self.count and value(lo) == key:
+            matches.append(position(lo))
+            lo += 1
+        return matches
+
+    def lookup(self, word):
+        """
+        the entries of a simplified word, lowest HSK level first
+        """
+        return [self.entry(i) for i in self._range(word.encode('utf-8'), 'zi_simp')]
+
+    def lookup_traditional(self, word):
+        return [
+            self.entry(i) for i in self._range(word.encode('utf-8'), 'zi_trad', self._trad)
+        ]
+
+    def words(self):
+        """
+        (zi_simp, frequency) of every entry, for the Segmenter
+        """
+        for i in range(self.count):
+            record = self._record(i)
+            yield self._string(record[0], record[1]).decode('utf-8'), record[-2]
+
+
+def entries_from_db():
+    from flashcards.models import Character, Word
+    for model in (Word, Character):
+        rows = model.objects.values_list(*STRING_FIELDS, 'id', 'frequency', 'hsk')
+        for *strings, card_id, frequency, hsk in rows.iterator():
+            yield Entry(*strings, card_id, frequency, hsk)
+
+
+_lexicon = None
+
+
+def get_lexicon():
+    """
+    the process-wide lexicon at FLASHCARDS_LEXICON_PATH, or None when no
+    lexicon has been built
+    """
+    global _lexicon
+    path = getattr(settings, 'FLASHCARDS_LEXICON_PATH', None)
+    if _lexicon is None and path and os.path.exists(path):
+        _lexicon = Lexicon(path)
+    return _lexicon
+
+
+def reset_lexicon():
+    global _lexicon
+    if _lexicon is not None:
+        _lexicon.close()
+    _lexicon = None
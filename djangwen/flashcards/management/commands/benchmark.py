@@ -0,0 +1,84 @@
+import json
+import time
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from flashcards.benchmark import SCALES, compare, generate, run_benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        'Times populate, shuffle, outcome ingestion, deck stats and the list views '
+        'on synthetic data in a throwaway test database'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scale', choices=sorted(SCALES), default='1k',
+            help='Number of user cards to generate',
+        )
+        parser.add_argument('--user-cards', type=int, help='Overrides --scale')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument(
+            '--only', action='append',
+            help='Only this benchmark, may be repeated',
+        )
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+        parser.add_argument('--baseline', help='Compare with the results in this JSON file')
+        parser.add_argument(
+            '--max-slowdown', type=float,
+            help='Fail when a benchmark is this many times slower than the baseline',
+        )
+        parser.add_argument(
+            '--keepdb', action='store_true',
+            help='Keep the test database, as manage.py test --keepdb does',
+        )
+
+    def handle(self, **options):
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as f:
+                baseline = json.load(f)
+        user_cards = options['user_cards'] or SCALES[options['scale']]
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False, keepdb=options['keepdb']
+        )
+        try:
+            start = time.monotonic()
+            data = generate(user_cards, seed=options['seed'])
+            self.stdout.write('{} user cards in {} decks of {} users generated in {:.1f}s.'.format(
+                data['user_cards'], data['decks'], data['users'], time.monotonic() - start
+            ))
+            results = run_benchmarks(
+                data, repeat=options['repeat'], only=options['only'], seed=options['seed']
+            )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+        for name, result in results['results'].items():
+            self.stdout.write('{:<22} {:>9.2f}ms {:>9.2f}ms best {:>5} queries'.format(
+                name, result['seconds'] * 1000, result['best'] * 1000, result['queries']
+            ))
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2)
+
+        if baseline is not None:
+            if baseline['scale'] != results['scale']:
+                self.stderr.write('The baseline was run at a scale of {} user cards.'.format(
+                    baseline['scale']
+                ))
+            self.stdout.write('')
+            slower = []
+            for name, before, after, speedup, queries in compare(results, baseline):
+                self.stdout.write('{:<22} {:>9.2f}ms -> {:>9.2f}ms {:>6.2f}x {:+d} queries'.format(
+                    name, before * 1000, after * 1000, speedup, queries
+                ))
+                if options['max_slowdown'] and 1 / speedup > options['max_slowdown']:
+                    slower.append(name)
+            if slower:
+                raise CommandError('Slower than the baseline: {}'.format(', '.join(slower)))
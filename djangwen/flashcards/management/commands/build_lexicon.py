@@ -0,0 +1,24 @@
+import time
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+from flashcards.lexicon import build_lexicon, entries_from_db
+
+
+class Command(BaseCommand):
+    help = 'Compiles the Word and Character tables into the memory-mapped lexicon file'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'output', nargs='?',
+            help='Path of the file to write, FLASHCARDS_LEXICON_PATH by default',
+        )
+
+    def handle(self, **options):
+        output = options['output'] or getattr(settings, 'FLASHCARDS_LEXICON_PATH', None)
+        if not output:
+            raise CommandError('No output path given and FLASHCARDS_LEXICON_PATH is not set')
+        start = time.monotonic()
+        count = build_lexicon(output, entries_from_db())
+        self.stdout.write('{} entries written to "{}" in {:.1f}s.'.format(
+            count, output, time.monotonic() - start
+        ))
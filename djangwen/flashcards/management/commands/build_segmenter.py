@@ -0,0 +1,16 @@
+from django.core.management import BaseCommand
+from flashcards.segmenter import Segmenter
+
+
+class Command(BaseCommand):
+    help = 'Writes the segmenter dictionary built from the Word and Character tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='Path of the file to write')
+
+    def handle(self, **options):
+        segmenter = Segmenter.from_db()
+        segmenter.save(options['output'])
+        self.stdout.write('{} words written to "{}".'.format(
+            len(segmenter), options['output']
+        ))
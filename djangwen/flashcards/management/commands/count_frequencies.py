@@ -0,0 +1,26 @@
+import time
+from django.core.management import BaseCommand
+from flashcards.frequency import count_frequencies
+
+
+class Command(BaseCommand):
+    help = 'Adds the words of uncounted ArticleDecks and ClipDecks to Card.frequency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument(
+            '--jobs', type=int, default=1,
+            help='Segment the texts in this many processes',
+        )
+        parser.add_argument('--shard-size', type=int, default=20)
+
+    def handle(self, **options):
+        start = time.monotonic()
+        total = count_frequencies(
+            batch_size=options['batch_size'],
+            jobs=options['jobs'],
+            shard_size=options['shard_size'],
+        )
+        self.stdout.write('{} decks counted in {:.1f}s.'.format(
+            total, time.monotonic() - start
+        ))
@@ -0,0 +1,24 @@
+import time
+from django.core.management import BaseCommand
+from flashcards.transfer import export_user_decks, open_stream
+
+
+class Command(BaseCommand):
+    help = 'Streams user decks and the state of their cards to a JSON lines file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='Path of the file to write, - for stdout; .gz is gzipped')
+        parser.add_argument(
+            '--user', action='append', dest='users',
+            help='Only the decks of this user, may be repeated',
+        )
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, **options):
+        start = time.monotonic()
+        with open_stream(options['output'], 'w') as out:
+            decks, cards = export_user_decks(out, options['users'], options['chunk_size'])
+        if options['output'] != '-':
+            self.stdout.write('{} decks, {} cards written in {:.1f}s.'.format(
+                decks, cards, time.monotonic() - start
+            ))
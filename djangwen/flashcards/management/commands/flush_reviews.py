@@ -0,0 +1,25 @@
+import time
+from django.core.management import BaseCommand
+from flashcards import reviews
+
+
+class Command(BaseCommand):
+    help = 'Writes the review events waiting in the FLASHCARDS_REVIEW_SPOOL file'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--every', type=float, default=0,
+            help='Keep flushing, waiting this many seconds between flushes',
+        )
+
+    def handle(self, **options):
+        while True:
+            start = time.monotonic()
+            total = reviews.flush()
+            if total or not options['every']:
+                self.stdout.write('{} review events written in {:.1f}s.'.format(
+                    total, time.monotonic() - start
+                ))
+            if not options['every']:
+                return
+            time.sleep(options['every'])
@@ -0,0 +1,39 @@
+import time
+from django.core.management import BaseCommand, CommandError
+from flashcards.frequency import count_frequencies
+from flashcards.models import ArticleDeck
+from flashcards.scraper import scrape
+
+
+class Command(BaseCommand):
+    help = 'Fetches articles and creates or refreshes their ArticleDecks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('urls', nargs='*')
+        parser.add_argument('--file', help='File with one url per line')
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--per-host', type=int, default=4)
+        parser.add_argument('--processors', type=int, default=4)
+
+    def handle(self, **options):
+        urls = list(options['urls'])
+        if options['file']:
+            with open(options['file'], encoding='utf-8') as f:
+                urls.extend(l.strip() for l in f if l.strip())
+        if not urls:
+            raise CommandError('No urls given')
+
+        start = time.monotonic()
+        scrapers, errors = scrape(
+            urls,
+            concurrency=options['concurrency'],
+            per_host=options['per_host'],
+            processors=options['processors'],
+        )
+        decks = ArticleDeck.save_scrapers(scrapers)
+        count_frequencies()
+        for url, error in errors.items():
+            self.stderr.write('{}: {}'.format(url, error))
+        self.stdout.write('{} articles imported, {} failed in {:.1f}s.'.format(
+            len(decks), len(errors), time.monotonic() - start
+        ))
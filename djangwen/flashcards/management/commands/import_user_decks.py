@@ -0,0 +1,36 @@
+import time
+from django.core.management import BaseCommand, CommandError
+from flashcards.transfer import import_user_decks, open_stream
+
+
+class Command(BaseCommand):
+    help = 'Loads user decks written by export_user_decks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help='Path of the file to read, - for stdin; .gz is gunzipped')
+        parser.add_argument(
+            '--batch-size', type=int, default=2000,
+            help='Lines loaded per transaction',
+        )
+        parser.add_argument(
+            '--overwrite', action='store_true',
+            help='Also give the cards the user keeps in other decks the exported state',
+        )
+
+    def handle(self, **options):
+        start = time.monotonic()
+        try:
+            with open_stream(options['input'], 'r') as f:
+                decks, cards, skipped = import_user_decks(
+                    f, options['batch_size'], options['overwrite']
+                )
+        except ValueError as e:
+            raise CommandError(e)
+        self.stdout.write('{} decks, {} cards loaded in {:.1f}s.'.format(
+            decks, cards, time.monotonic() - start
+        ))
+        if skipped:
+            self.stdout.write(
+                '{} cards not found in this database, or held by another deck of '
+                'the user, were skipped.'.format(skipped)
+            )
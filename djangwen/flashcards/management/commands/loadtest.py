@@ -0,0 +1,217 @@
+import http.client
+import json
+import os
+import pathlib
+import random
+import shutil
+import signal
+import statistics
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from wsgiref.simple_server import WSGIRequestHandler, make_server
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.core.wsgi import get_wsgi_application
+from django.db import connections
+from django.http import HttpRequest
+from django.middleware.csrf import get_token
+from django.test import Client
+from django.test.utils import override_settings
+from flashcards.benchmark import generate
+from flashcards.models import UserDeck
+
+
+class QuietHandler(WSGIRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+
+def use_test_database(path):
+    """
+    points the default alias, and a read-only alias of it, at a fresh
+    database file and returns the name to restore
+    """
+    default = connections['default']
+    default.settings_dict['TEST']['NAME'] = path
+    old_name = default.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    replica = getattr(settings, 'FLASHCARDS_READ_DATABASE', None)
+    if replica:
+        connections[replica].close()
+        if connections[replica].vendor == 'sqlite':
+            connections[replica].settings_dict['NAME'] = pathlib.Path(path).as_uri() + '?mode=ro'
+        else:
+            connections[replica].creation.set_as_test_mirror(default.settings_dict)
+    return old_name
+
+
+class VirtualUser(threading.Thread):
+    """
+    studies one user deck in a loop: a session page, a batch of answers,
+    and now and then the catalogue or the words of a deck
+    """
+
+    def __init__(self, port, user_deck, deck_id, deadline, seed):
+        super().__init__(daemon=True)
+        self.port = port
+        self.user_deck = user_deck
+        self.deck_id = deck_id
+        self.deadline = deadline
+        self.rng = random.Random(seed)
+        self.timings = defaultdict(list)
+        self.errors = Counter()
+
+        client = Client()
+        client.force_login(user_deck.user)
+        request = HttpRequest()
+        self.csrf_token = get_token(request)
+        self.cookie = '{}={}; {}={}'.format(
+            settings.SESSION_COOKIE_NAME, client.cookies[settings.SESSION_COOKIE_NAME].value,
+            settings.CSRF_COOKIE_NAME, request.META['CSRF_COOKIE'],
+        )
+
+    def request(self, kind, method, path, body=None):
+        headers = {'Host': 'localhost', 'Cookie': self.cookie}
+        if body is not None:
+            headers.update({'Content-Type': 'application/json', 'X-CSRFToken': self.csrf_token})
+        start = time.perf_counter()
+        connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+        try:
+            connection.request(method, path, body, headers)
+            response = connection.getresponse()
+            content = response.read()
+        except (OSError, http.client.HTTPException) as e:
+            self.errors[type(e).__name__] += 1
+            return None
+        finally:
+            connection.close()
+        self.timings[kind].append(time.perf_counter() - start)
+        if response.status != 200:
+            self.errors['{} {}'.format(kind, response.status)] += 1
+            return None
+        return content
+
+    def run(self):
+        base = '/user-decks/{}/'.format(self.user_deck.id)
+        seq = 0
+        while time.monotonic() < self.deadline:
+            roll = self.rng.random()
+            if roll < 0.15:
+                self.request('catalogue', 'GET', '/decks.json')
+            elif roll < 0.3:
+                self.request('deck_words', 'GET', '/deck-words/{}'.format(self.deck_id))
+            else:
+                content = self.request('session', 'GET', base + 'session.json?limit=5')
+                if not content:
+                    continue
+                cards = json.loads(content)['cards']
+                if not cards:
+                    continue
+                seq += 1
+                self.request('outcomes', 'POST', base + 'outcomes', json.dumps({
+                    'run': self.name, 'seq': seq, 'outcomes': {
+                        str(n): {'id': c['id'], 'result': self.rng.choice('zx')}
+                        for n, c in enumerate(cards, 1)
+                    },
+                }))
+
+
+class Command(BaseCommand):
+    help = (
+        'Serves the app from several forked WSGI workers on a throwaway copy of '
+        'the database and measures throughput under concurrent users; run it '
+        'under each settings profile to compare them'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--users', type=int, default=16, help='Concurrent virtual users')
+        parser.add_argument('--duration', type=float, default=10, help='Seconds')
+        parser.add_argument('--user-cards', type=int, default=20000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+
+    def handle(self, **options):
+        directory = tempfile.mkdtemp()
+        old_name = use_test_database(os.path.join(directory, 'loadtest.sqlite3'))
+        pids = []
+        try:
+            data = generate(options['user_cards'], seed=options['seed'])
+            user_decks = list(UserDeck.objects.filter(
+                id__in=data['user_deck_ids']
+            ).select_related('user'))
+
+            with override_settings(ALLOWED_HOSTS=list(settings.ALLOWED_HOSTS) + ['localhost']):
+                users = [
+                    VirtualUser(
+                        None, user_decks[i % len(user_decks)],
+                        data['deck_ids'][i % len(data['deck_ids'])], None, options['seed'] + i,
+                    )
+                    for i in range(options['users'])
+                ]
+                server = make_server('127.0.0.1', 0, get_wsgi_application(), handler_class=QuietHandler)
+                # every worker opens its own connections
+                connections.close_all()
+                for _ in range(options['workers']):
+                    pid = os.fork()
+                    if pid == 0:
+                        try:
+                            server.serve_forever()
+                        finally:
+                            os._exit(0)
+                    pids.append(pid)
+                server.socket.close()
+
+                deadline = time.monotonic() + options['duration']
+                for user in users:
+                    user.port = server.server_port
+                    user.deadline = deadline
+                start = time.monotonic()
+                for user in users:
+                    user.start()
+                for user in users:
+                    user.join()
+                elapsed = time.monotonic() - start
+        finally:
+            for pid in pids:
+                os.kill(pid, signal.SIGTERM)
+                os.waitpid(pid, 0)
+            connections['default'].creation.destroy_test_db(old_name, verbosity=0)
+            shutil.rmtree(directory, ignore_errors=True)
+
+        timings = defaultdict(list)
+        for user in users:
+            for kind, values in user.timings.items():
+                timings[kind].extend(values)
+        total = sum(len(v) for v in timings.values())
+        results = {
+            'settings': os.environ.get('DJANGO_SETTINGS_MODULE'),
+            'workers': options['workers'],
+            'users': options['users'],
+            'seconds': elapsed,
+            'requests': total,
+            'errors': dict(sum((u.errors for u in users), Counter())),
+            'requests_per_second': total / elapsed,
+            'kinds': {
+                kind: {
+                    'requests': len(values),
+                    'p50_ms': statistics.median(values) * 1000,
+                    'p95_ms': sorted(values)[int(len(values) * 0.95)] * 1000,
+                }
+                for kind, values in sorted(timings.items())
+            },
+        }
+        self.stdout.write('{} requests in {:.1f}s, {:.1f}/s'.format(
+            total, elapsed, results['requests_per_second']
+        ))
+        for error, n in sorted(results['errors'].items()):
+            self.stdout.write('{} x {}'.format(n, error))
+        for kind, stats in results['kinds'].items():
+            self.stdout.write('{:<12} {:>7} {:>9.1f}ms p50 {:>9.1f}ms p95'.format(
+                kind, stats['requests'], stats['p50_ms'], stats['p95_ms']
+            ))
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2)
@@ -1,46 +1,130 @@
 import os
 import re
-from django.core.management import BaseCommand
+from concurrent.futures import ProcessPoolExecutor
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
 from djangwen import settings
+from flashcards.bulk import bulk_create_inherited, chunked
+from flashcards.caching import bump_catalogue, bump_decks
 from flashcards.helpers import get_chinese
 from flashcards.models import (
+    CardFace,
     Deck,
+    SearchTerm,
     Word
 )
 
+WORD_FIELDS = ['zi_simp', 'zi_trad', 'pinyin_number', 'pinyin_tone', 'english']
+
+
+def read_hsk_file(file_path):
+    hsk = int(re.findall(r'\d+', os.path.basename(file_path))[0])
+    with open(file_path, encoding='utf-8') as f:
+        for n, l in enumerate(f, 1):
+            l = l.rstrip('\r\n')
+            if not l:
+                continue
+            data = l.split('\t')
+            if len(data) != 5:
+                raise CommandError('{} line {}: expected 5 fields, got {}'.format(
+                    file_path, n, len(data)
+                ))
+            yield {
+                'zi_simp': get_chinese(data[0]),
+                'zi_trad': get_chinese(data[1]),
+                'pinyin_number': data[2],
+                'pinyin_tone': data[3],
+                'english': data[4],
+                'hsk': hsk,
+            }
+
+
+def parse_hsk_file(file_path):
+    return file_path, list(read_hsk_file(file_path))
+
+
+def load_deck(deck_name, rows, upsert=False, batch_size=500):
+    with transaction.atomic():
+        deck, _ = Deck.objects.get_or_create(name=deck_name)
+        through = Deck.cards.through
+        existing = {}
+        if upsert:
+            existing = {w.zi_simp: w for w in Word.objects.filter(deck=deck)}
+
+        for batch in chunked(rows, batch_size):
+            new_words = []
+            changed = []
+            for fields in batch:
+                w = existing.get(fields['zi_simp'])
+                if w is None:
+                    new_words.append(Word(**fields))
+                elif any(getattr(w, f) != fields[f] for f in WORD_FIELDS):
+                    for f in WORD_FIELDS:
+                        setattr(w, f, fields[f])
+                    changed.append(w)
+            bulk_create_inherited(Word, new_words, batch_size)
+            Word.objects.bulk_update(changed, WORD_FIELDS, batch_size)
+            for sync in (CardFace.bulk_sync, SearchTerm.bulk_sync):
+                sync(new_words, batch_size, created=True)
+                sync(changed, batch_size)
+            through.objects.bulk_create(
+                [through(deck_id=deck.id, card_id=w.id) for w in new_words],
+                batch_size=batch_size,
+                ignore_conflicts=True
+            )
+    bump_catalogue()
+    bump_decks([deck.id])
+    return deck
+
 
 class Command(BaseCommand):
-    def handle(self, **kwargs):
+    help = 'Creates the HSK decks from hsk_vocabulary/HSK*.txt'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path', default=os.path.join(settings.BASE_DIR, 'hsk_vocabulary'),
+            help='Directory holding the HSK*.txt files',
+        )
+        parser.add_argument(
+            '--upsert', action='store_true',
+            help='Update the words of existing HSK decks instead of stopping',
+        )
+        parser.add_argument(
+            '--jobs', type=int, default=1,
+            help='Parse the files in this many processes',
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, **options):
         decks = Deck.objects.filter(name__contains='HSK')
-        if len(decks) > 0:
+        if decks.exists() and not options['upsert']:
             self.stdout.write('HSK decks already exist')
             return
 
-        path = settings.BASE_DIR + '/hsk_vocabulary/'
-        full_path = os.path.abspath(path)
-        for filename in os.listdir(full_path):
-            file_path = os.path.join(full_path, filename)
-            assert os.path.isabs(file_path)
-            hsk = int(re.findall(r'\d+', filename)[0])
-            deck_name = 'HSK {}'.format(hsk)
-            deck = Deck(name=deck_name)
-            deck.save()
-            with open(file_path, encoding='utf-8') as f:
-                raw = f.read()
-                lines = raw.split('\n')
-                structures = set(len(l.split('\t')) for l in lines)
-                assert len(structures) == 1
-                for l in lines:
-                    data = l.split('\t')
-                    fields = {
-                        'zi_simp': get_chinese(data[0]),
-                        'zi_trad': get_chinese(data[1]),
-                        'pinyin_number': data[2],
-                        'pinyin_tone': data[3],
-                        'english': data[4],
-                        'hsk': hsk,
-                    }
-                    w = Word(**fields)
-                    w.save()
-                    deck.cards.add(w)
-            self.stdout.write('File "%s" processed.' % (filename))
+        full_path = os.path.abspath(options['path'])
+        file_paths = [
+            os.path.join(full_path, filename)
+            for filename in sorted(os.listdir(full_path))
+            if re.match(r'HSK\d+\.txt$', filename)
+        ]
+
+        if options['jobs'] > 1:
+            executor = ProcessPoolExecutor(max_workers=options['jobs'])
+            parsed = executor.map(parse_hsk_file, file_paths)
+        else:
+            executor = None
+            parsed = ((p, read_hsk_file(p)) for p in file_paths)
+
+        try:
+            for file_path, rows in parsed:
+                filename = os.path.basename(file_path)
+                hsk = int(re.findall(r'\d+', filename)[0])
+                load_deck(
+                    'HSK {}'.format(hsk), rows,
+                    upsert=options['upsert'],
+                    batch_size=options['batch_size'],
+                )
+                self.stdout.write('File "%s" processed.' % (filename))
+        finally:
+            if executor is not None:
+                executor.shutdown()
@@ -0,0 +1,37 @@
+import time
+from django.core.management import BaseCommand
+from flashcards.prebuild import prebuild_sessions
+
+
+class Command(BaseCommand):
+    help = "Builds today's session of every UserDeck ahead of the first request"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--jobs', type=int, default=1,
+            help='Build the sessions in this many processes',
+        )
+        parser.add_argument('--chunk-size', type=int, default=200)
+        parser.add_argument(
+            '--active-days', type=int,
+            help='Only decks answered in this many days',
+        )
+
+    def handle(self, **options):
+        start = time.monotonic()
+
+        def progress(decks, cards):
+            elapsed = time.monotonic() - start
+            self.stdout.write('{} decks, {} cards ({:.0f} decks/s)'.format(
+                decks, cards, decks / max(elapsed, 1e-6)
+            ))
+
+        decks, cards = prebuild_sessions(
+            jobs=options['jobs'],
+            chunk_size=options['chunk_size'],
+            active_days=options['active_days'],
+            progress=progress,
+        )
+        self.stdout.write('{} sessions built, {} cards changed in {:.1f}s.'.format(
+            decks, cards, time.monotonic() - start
+        ))
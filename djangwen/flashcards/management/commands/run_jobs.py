@@ -0,0 +1,50 @@
+import signal
+import threading
+import time
+from django.core.management import BaseCommand
+from flashcards.jobs import run_worker
+
+
+class Command(BaseCommand):
+    help = (
+        'Works through the queued jobs, such as the segmenting and counting of '
+        'new ArticleDecks and ClipDecks, until stopped'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1)
+        parser.add_argument(
+            '--processes', action='store_true',
+            help='Run the jobs in worker processes rather than threads',
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Stop when no job is due instead of polling',
+        )
+        parser.add_argument('--poll', type=float, default=1.0, help='Seconds between polls')
+        parser.add_argument('--batch-size', type=int, help='Jobs claimed at a time, --workers by default')
+
+    def handle(self, **options):
+        start = time.monotonic()
+        stop = threading.Event()
+        if threading.current_thread() is threading.main_thread():
+            # finish the jobs in hand before stopping
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                signal.signal(signum, lambda *args: stop.set())
+
+        def progress(job, status):
+            self.stdout.write('{} job {} for deck {}: {}'.format(job.kind, job.id, job.deck_id, status))
+
+        totals = run_worker(
+            workers=options['workers'],
+            processes=options['processes'],
+            once=options['once'],
+            poll=options['poll'],
+            batch_size=options['batch_size'],
+            stop=stop,
+            progress=progress if options['verbosity'] > 1 else None,
+        )
+        self.stdout.write('{} jobs done, {} to retry, {} failed in {:.1f}s.'.format(
+            totals.get('done', 0), totals.get('queued', 0), totals.get('failed', 0),
+            time.monotonic() - start
+        ))
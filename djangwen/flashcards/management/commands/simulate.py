@@ -0,0 +1,82 @@
+import json
+import time
+from django.core.management import BaseCommand, CommandError
+from django.utils import timezone
+from flashcards.models import UserDeck
+
+
+def days(delta):
+    return delta.total_seconds() / (24 * 60 * 60)
+
+
+def user_deck_rows(user_decks):
+    now = timezone.now()
+    rows = []
+    for user_deck in user_decks:
+        cards = user_deck.cards.order_by('id').values_list(
+            'ease', 'priority', 'learning', 'to_study', 'last_time', 'due_at'
+        )
+        rows.append([
+            (
+                ease, priority, learning, to_study,
+                None if last_time is None else round(days(now - last_time)),
+                None if due_at is None else round(days(due_at - now)),
+            )
+            for ease, priority, learning, to_study, last_time, due_at in cards
+        ])
+    return [r for r in rows if r]
+
+
+class Command(BaseCommand):
+    help = 'Simulates the scheduler for every combination of the given UserDeck settings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--multiplier', type=int, nargs='+', default=[2])
+        parser.add_argument('--entry-interval', type=int, nargs='+', default=[5])
+        parser.add_argument('--card-number', type=int, nargs='+', default=[20])
+        parser.add_argument('--new-card-number', type=int, nargs='+', default=[10])
+        parser.add_argument('--learners', type=int, default=1000)
+        parser.add_argument('--cards', type=int, default=2000)
+        parser.add_argument('--days', type=int, default=90)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--jobs', type=int, default=1,
+            help='Run the combinations in this many processes',
+        )
+        parser.add_argument(
+            '--from-decks', action='store_true',
+            help='Start from the cards of the existing UserDecks, one learner per deck',
+        )
+        parser.add_argument('--output', help='Write the results with their daily curves to this JSON file')
+
+    def handle(self, **options):
+        try:
+            from flashcards import simulator
+        except ImportError:
+            raise CommandError('The simulator needs numpy')
+
+        kwargs = {'days': options['days'], 'seed': options['seed']}
+        if options['from_decks']:
+            rows = user_deck_rows(UserDeck.objects.all())
+            if not rows:
+                raise CommandError('No UserDeck has any cards')
+            kwargs['state'] = simulator.Learners.from_user_cards(rows, 0, seed=options['seed'])
+        else:
+            kwargs.update(learners=options['learners'], cards=options['cards'])
+
+        start = time.monotonic()
+        results = simulator.sweep({
+            p: options[p] for p in simulator.PARAMETERS
+        }, jobs=options['jobs'], **kwargs)
+
+        self.stdout.write('multiplier entry_interval card_number new_card_number  workload retention seen')
+        for r in results:
+            self.stdout.write('{multiplier:10} {entry_interval:14} {card_number:11} {new_card_number:15}'.format(
+                **r['params']
+            ) + '  {:8.1f} {:9.3f} {:4.0f}'.format(r['workload'], r['retention'], r['seen']))
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f)
+        self.stdout.write('{} combinations simulated in {:.1f}s.'.format(
+            len(results), time.monotonic() - start
+        ))
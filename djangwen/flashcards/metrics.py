@@ -0,0 +1,236 @@
+"""
+opt-in instrumentation, on when FLASHCARDS_METRICS is set: MetricsMiddleware
+times every view and counts its queries, timed() does the same for the model
+hot paths, and MetricsView serves the totals as Prometheus text or JSON.
+The totals live in the process, so each worker of a server is scraped on its
+own. When FLASHCARDS_METRICS is off the middleware removes itself and
+timed() only checks the setting.
+"""
+import functools
+import heapq
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LABELS = {'request': 'view', 'span': 'span'}
+
+
+def enabled():
+    return getattr(settings, 'FLASHCARDS_METRICS', False)
+
+
+class QueryCounter():
+    """
+    a connection.execute_wrapper that counts queries and their time, and
+    keeps the keep slowest
+    """
+
+    def __init__(self, keep=0):
+        self.count = 0
+        self.time = 0.0
+        self.keep = keep
+        self.slowest = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.count += 1
+            self.time += elapsed
+            if self.keep:
+                entry = (elapsed, sql[:300])
+                if len(self.slowest) < self.keep:
+                    heapq.heappush(self.slowest, entry)
+                else:
+                    heapq.heappushpop(self.slowest, entry)
+
+
+class Stat():
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+        self.max = 0.0
+        self.queries = 0
+        self.query_time = 0.0
+        self.buckets = [0] * len(BUCKETS)
+
+    def add(self, seconds, queries):
+        self.count += 1
+        self.time += seconds
+        self.max = max(self.max, seconds)
+        self.queries += queries.count
+        self.query_time += queries.time
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'seconds': self.time,
+            'max_seconds': self.max,
+            'queries': self.queries,
+            'query_seconds': self.query_time,
+        }
+
+
+class Metrics():
+    """
+    timings of requests by view and of spans by name, plus a sample of the
+    slowest recent requests
+    """
+
+    def __init__(self, slow_samples=50):
+        self.lock = threading.Lock()
+        self.stats = {kind: {} for kind in LABELS}
+        self.slow = deque(maxlen=slow_samples)
+
+    def record(self, kind, name, seconds, queries, sample=None):
+        with self.lock:
+            stats = self.stats[kind]
+            if name not in stats:
+                stats[name] = Stat()
+            stats[name].add(seconds, queries)
+            if sample is not None:
+                self.slow.append(sample)
+
+    def snapshot(self):
+        with self.lock:
+            result = {
+                kind + 's': {name: stat.as_dict() for name, stat in sorted(stats.items())}
+                for kind, stats in self.stats.items()
+            }
+            result['slow_requests'] = list(self.slow)
+        return result
+
+    def prometheus(self):
+        lines = []
+        with self.lock:
+            for kind, label in LABELS.items():
+                metric = 'flashcards_{}'.format(kind)
+                stats = [
+                    ('{}="{}"'.format(label, name.replace('\\', '\\\\').replace('"', '\\"')), stat)
+                    for name, stat in sorted(self.stats[kind].items())
+                ]
+                lines.append('# TYPE {}_seconds histogram'.format(metric))
+                for labels, stat in stats:
+                    for bound, n in zip(BUCKETS, stat.buckets):
+                        lines.append('{}_seconds_bucket{{{},le="{}"}} {}'.format(metric, labels, bound, n))
+                    lines.append('{}_seconds_bucket{{{},le="+Inf"}} {}'.format(metric, labels, stat.count))
+                    lines.append('{}_seconds_sum{{{}}} {}'.format(metric, labels, stat.time))
+                    lines.append('{}_seconds_count{{{}}} {}'.format(metric, labels, stat.count))
+                for suffix, attr in (('queries_total', 'queries'), ('query_seconds_total', 'query_time')):
+                    lines.append('# TYPE {}_{} counter'.format(metric, suffix))
+                    for labels, stat in stats:
+                        lines.append('{}_{}{{{}}} {}'.format(metric, suffix, labels, getattr(stat, attr)))
+        return '\n'.join(lines) + '\n'
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics():
+    global _metrics
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                _metrics = Metrics(getattr(settings, 'FLASHCARDS_METRICS_SLOW_SAMPLES', 50))
+    return _metrics
+
+
+def reset_metrics():
+    global _metrics
+    _metrics = None
+
+
+@contextmanager
+def span(name, sql=True):
+    """
+    times the block as the span name, counting its queries unless sql is
+    False (for threads that never touch the database)
+    """
+    if not enabled():
+        yield
+        return
+    queries = QueryCounter()
+    start = time.perf_counter()
+    try:
+        if sql:
+            with connection.execute_wrapper(queries):
+                yield
+        else:
+            yield
+    finally:
+        get_metrics().record('span', name, time.perf_counter() - start, queries)
+
+
+def timed(name):
+    """
+    decorator form of span()
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled():
+                return func(*args, **kwargs)
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    view_class = getattr(match.func, 'view_class', None)
+    return view_class.__name__ if view_class else match.func.__name__
+
+
+class MetricsMiddleware():
+    """
+    records the time and queries of every request; requests slower than
+    FLASHCARDS_METRICS_SLOW_SECONDS are kept as samples with their
+    slowest queries
+    """
+
+    def __init__(self, get_response):
+        if not enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.slow = getattr(settings, 'FLASHCARDS_METRICS_SLOW_SECONDS', 1.0)
+
+    def __call__(self, request):
+        queries = QueryCounter(keep=5)
+        start = time.perf_counter()
+        with connection.execute_wrapper(queries):
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - start
+
+        view = view_name(request)
+        sample = None
+        if elapsed >= self.slow:
+            sample = {
+                'at': time.time(),
+                'method': request.method,
+                'path': request.path,
+                'view': view,
+                'status': response.status_code,
+                'seconds': elapsed,
+                'queries': queries.count,
+                'query_seconds': queries.time,
+                'slowest_queries': [
+                    {'seconds': s, 'sql': sql} for s, sql in sorted(queries.slowest, reverse=True)
+                ],
+            }
+        get_metrics().record('request', view, elapsed, queries, sample)
+        return response
@@ -0,0 +1,116 @@
+# Generated by Django 3.1.14 on 2026-10-18 14:00
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('flashcards', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Character',
+            fields=[
+                ('card_ptr', models.OneToOneField(auto_created=True, on_delete=django.db.models.deletion.CASCADE, parent_link=True, primary_key=True, serialize=False, to='flashcards.card')),
+                ('zi_simp', models.CharField(max_length=1)),
+                ('zi_trad', models.CharField(max_length=1)),
+                ('pinyin_number', models.CharField(max_length=8)),
+                ('pinyin_tone', models.CharField(max_length=8)),
+                ('english', models.CharField(max_length=256)),
+                ('hsk', models.IntegerField(default=0)),
+            ],
+            bases=('flashcards.card',),
+        ),
+        migrations.CreateModel(
+            name='Deck',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.CharField(max_length=64)),
+                ('name', models.CharField(max_length=64)),
+                ('cards', models.ManyToManyField(to='flashcards.Card')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Sentence',
+            fields=[
+                ('card_ptr', models.OneToOneField(auto_created=True, on_delete=django.db.models.deletion.CASCADE, parent_link=True, primary_key=True, serialize=False, to='flashcards.card')),
+                ('zi_simp', models.CharField(max_length=256)),
+                ('zi_trad', models.CharField(max_length=256)),
+                ('pinyin_number', models.CharField(max_length=1024)),
+                ('pinyin_tone', models.CharField(max_length=1024)),
+                ('english', models.CharField(max_length=1024)),
+            ],
+            bases=('flashcards.card',),
+        ),
+        migrations.CreateModel(
+            name='Word',
+            fields=[
+                ('card_ptr', models.OneToOneField(auto_created=True, on_delete=django.db.models.deletion.CASCADE, parent_link=True, primary_key=True, serialize=False, to='flashcards.card')),
+                ('zi_simp', models.CharField(max_length=16)),
+                ('zi_trad', models.CharField(max_length=16)),
+                ('pinyin_number', models.CharField(max_length=128)),
+                ('pinyin_tone', models.CharField(max_length=128)),
+                ('english', models.CharField(max_length=256)),
+                ('hsk', models.IntegerField(default=0)),
+            ],
+            bases=('flashcards.card',),
+        ),
+        migrations.AlterField(
+            model_name='usercard',
+            name='last_time',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='usercard',
+            name='learning',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AlterField(
+            model_name='usercard',
+            name='priority',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AlterField(
+            model_name='usercard',
+            name='sorted',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='ArticleDeck',
+            fields=[
+                ('deck_ptr', models.OneToOneField(auto_created=True, on_delete=django.db.models.deletion.CASCADE, parent_link=True, primary_key=True, serialize=False, to='flashcards.deck')),
+                ('url', models.CharField(max_length=64)),
+                ('counted', models.BooleanField(default=False)),
+            ],
+            bases=('flashcards.deck',),
+        ),
+        migrations.CreateModel(
+            name='ClipDeck',
+            fields=[
+                ('deck_ptr', models.OneToOneField(auto_created=True, on_delete=django.db.models.deletion.CASCADE, parent_link=True, primary_key=True, serialize=False, to='flashcards.deck')),
+                ('text', models.TextField()),
+                ('counted', models.BooleanField(default=False)),
+            ],
+            bases=('flashcards.deck',),
+        ),
+        migrations.CreateModel(
+            name='UserDeck',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64)),
+                ('card_number', models.IntegerField(default=20)),
+                ('new_card_number', models.IntegerField(default=10)),
+                ('card_counter', models.IntegerField(default=0)),
+                ('multiplier', models.IntegerField(default=2)),
+                ('entry_interval', models.IntegerField(default=5)),
+                ('last_date', models.DateField(null=True)),
+                ('cards', models.ManyToManyField(to='flashcards.UserCard')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 3.1.14 on 2026-10-18 14:00
+
+from datetime import timedelta
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def schedule_seen_cards(apps, schema_editor):
+    UserCard = apps.get_model('flashcards', 'UserCard')
+    cards = UserCard.objects.filter(last_time__isnull=False).only('ease', 'last_time')
+    batch = []
+    for c in cards.iterator(chunk_size=2000):
+        c.due_at = c.last_time + timedelta(days=c.ease)
+        batch.append(c)
+        if len(batch) == 2000:
+            UserCard.objects.bulk_update(batch, ['due_at'])
+            batch = []
+    UserCard.objects.bulk_update(batch, ['due_at'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('flashcards', '0002_deck_word_userdeck'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usercard',
+            name='due_at',
+            field=models.DateTimeField(db_index=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='usercard',
+            name='card',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='flashcards.card'),
+        ),
+        migrations.AlterField(
+            model_name='usercard',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(schedule_seen_cards, migrations.RunPython.noop),
+    ]
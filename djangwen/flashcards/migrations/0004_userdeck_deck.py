@@ -0,0 +1,19 @@
+# Generated by Django 3.1.14 on 2026-10-18 14:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flashcards', '0003_usercard_due_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userdeck',
+            name='deck',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='flashcards.deck'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 3.1.14 on 2026-10-18 14:03
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def count_cards(apps, schema_editor):
+    UserDeck = apps.get_model('flashcards', 'UserDeck')
+    for ud in UserDeck.objects.all().iterator():
+        counters = ud.cards.aggregate(
+            total_count=Count('id'),
+            seen_count=Count('id', filter=Q(to_study=False, last_time__isnull=False)),
+            to_study_count=Count('id', filter=Q(to_study=True)),
+            learning_count=Count('id', filter=Q(learning=True)),
+            unsorted_count=Count('id', filter=Q(sorted=False)),
+        )
+        UserDeck.objects.filter(id=ud.id).update(**counters)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flashcards', '0004_userdeck_deck'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userdeck',
+            name='learning_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userdeck',
+            name='seen_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userdeck',
+            name='to_study_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userdeck',
+            name='total_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userdeck',
+            name='unsorted_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(count_cards, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.1.14 on 2026-10-18 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flashcards', '0005_userdeck_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='card',
+            index=models.Index(fields=['-frequency', 'id'], name='flashcards__frequen_afc229_idx'),
+        ),
+    ]
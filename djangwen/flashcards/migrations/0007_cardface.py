@@ -0,0 +1,42 @@
+# Generated by Django 3.1.14 on 2026-10-18 14:06
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def build_faces(apps, schema_editor):
+    CardFace = apps.get_model('flashcards', 'CardFace')
+    for name in ('Word', 'Character', 'Sentence'):
+        model = apps.get_model('flashcards', name)
+        faces = []
+        for c in model.objects.all().iterator(chunk_size=2000):
+            faces.append(CardFace(
+                card_id=c.pk,
+                kind=name.lower(),
+                questions=[c.zi_simp, c.zi_trad],
+                answers=[c.pinyin_tone or c.pinyin_number, c.english],
+            ))
+            if len(faces) == 2000:
+                CardFace.objects.bulk_create(faces)
+                faces = []
+        CardFace.objects.bulk_create(faces)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flashcards', '0006_card_frequency_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CardFace',
+            fields=[
+                ('card', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='face', serialize=False, to='flashcards.card')),
+                ('kind', models.CharField(max_length=16)),
+                ('questions', models.JSONField(default=list)),
+                ('answers', models.JSONField(default=list)),
+            ],
+        ),
+        migrations.RunPython(build_faces, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.14 on 2026-10-18 14:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flashcards', '0007_cardface'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userdeck',
+            name='session',
+            field=models.IntegerField(default=0),
+        ),
+    ]
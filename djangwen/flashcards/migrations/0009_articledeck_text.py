@@ -0,0 +1,23 @@
+# Generated by Django 3.1.14 on 2026-10-18 14:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flashcards', '0008_userdeck_session'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='articledeck',
+            name='text',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AlterField(
+            model_name='articledeck',
+            name='url',
+            field=models.CharField(max_length=512),
+        ),
+    ]
@@ -0,0 +1,108 @@
+# Generated by Django 3.1.14 on 2026-10-18 14:13
+
+import re
+import unicodedata
+from django.db import migrations, models
+import django.db.models.deletion
+
+# a copy of flashcards.search.get_terms as it was when the index was
+# added, so later changes to the app's terms do not change this migration
+HANZI = re.compile(u'[\u4E00-\u9FA5]')
+SYLLABLE = re.compile(r'([a-zv]+)([1-5]?)')
+ENGLISH_WORD = re.compile(r"[a-z0-9']+")
+TERM_LENGTH = 64
+
+
+def strip_tones(pinyin):
+    decomposed = unicodedata.normalize('NFD', pinyin.lower())
+    decomposed = decomposed.replace('u\u0308', 'v')
+    return ''.join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def normalize_pinyin(pinyin):
+    return strip_tones(pinyin).replace('u:', 'v')
+
+
+def normalize_tone_marks(pinyin):
+    return unicodedata.normalize('NFC', pinyin.lower().replace(' ', ''))
+
+
+def pinyin_terms(pinyin_number, pinyin_tone):
+    numbered = normalize_pinyin(pinyin_number).replace(' ', '')
+    syllables = SYLLABLE.findall(numbered)
+    terms = set()
+    for letters, tone in syllables:
+        terms.add(letters)
+        terms.add(letters + tone)
+    terms.add(''.join(letters for letters, _ in syllables))
+    terms.add(''.join(letters + tone for letters, tone in syllables))
+    if pinyin_tone:
+        terms.add(normalize_tone_marks(pinyin_tone))
+    return {'p:' + t for t in terms if t}
+
+
+def hanzi_terms(*texts):
+    terms = set()
+    for text in texts:
+        chars = HANZI.findall(text)
+        terms.update('h:' + c for c in chars)
+        terms.update('h:' + a + b for a, b in zip(chars, chars[1:]))
+    return terms
+
+
+def english_terms(english):
+    return {'e:' + w for w in ENGLISH_WORD.findall(english.lower())}
+
+
+def get_terms(card):
+    terms = hanzi_terms(card.zi_simp, card.zi_trad)
+    terms |= pinyin_terms(card.pinyin_number, card.pinyin_tone)
+    terms |= english_terms(card.english)
+    return {t[:TERM_LENGTH] for t in terms}
+
+
+def index_cards(apps, schema_editor):
+    CardFace = apps.get_model('flashcards', 'CardFace')
+    SearchTerm = apps.get_model('flashcards', 'SearchTerm')
+    for name in ('Word', 'Character', 'Sentence'):
+        model = apps.get_model('flashcards', name)
+        if name != 'Sentence':
+            for hsk in model.objects.values_list('hsk', flat=True).distinct():
+                CardFace.objects.filter(
+                    card_id__in=model.objects.filter(hsk=hsk).values('pk')
+                ).update(hsk=hsk)
+        terms = []
+        for c in model.objects.all().iterator(chunk_size=2000):
+            terms.extend(SearchTerm(term=t, card_id=c.pk) for t in get_terms(c))
+            if len(terms) >= 2000:
+                SearchTerm.objects.bulk_create(terms)
+                terms = []
+        SearchTerm.objects.bulk_create(terms)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flashcards', '0009_articledeck_text'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cardface',
+            name='hsk',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='SearchTerm',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('card', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='flashcards.card')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='searchterm',
+            index=models.Index(fields=['term', 'card'], name='flashcards__term_0f3227_idx'),
+        ),
+        migrations.RunPython(index_cards, migrations.RunPython.noop),
+    ]
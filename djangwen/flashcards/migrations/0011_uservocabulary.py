@@ -0,0 +1,25 @@
+# Generated by Django 3.1.14 on 2026-10-18 14:19
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('flashcards', '0010_searchterm'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserVocabulary',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('known', models.BinaryField(default=b'')),
+                ('learning', models.BinaryField(default=b'')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='vocabulary', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 3.1.14 on 2026-10-18 14:21
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flashcards', '0011_uservocabulary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReviewEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.UUIDField(unique=True)),
+                ('result', models.CharField(max_length=1)),
+                ('sorting', models.BooleanField(default=False)),
+                ('multiplier', models.IntegerField(default=2)),
+                ('ease', models.IntegerField()),
+                ('created_at', models.DateTimeField()),
+                ('user_card', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reviews', to='flashcards.usercard')),
+                ('user_deck', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='flashcards.userdeck')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='reviewevent',
+            index=models.Index(fields=['user_card', 'created_at'], name='flashcards__user_ca_905799_idx'),
+        ),
+    ]
@@ -0,0 +1,77 @@
+from django.db import migrations, models, transaction
+from django.db.models import Count, Min
+import django.db.models.deletion
+
+BATCH_SIZE = 10000
+
+
+def backfill_user_deck(apps, schema_editor):
+    """
+    copies the deck of every UserCard out of the old userdeck_cards table,
+    one id range per transaction so the table is never locked for long
+    """
+    connection = schema_editor.connection
+    qn = connection.ops.quote_name
+    UserCard = apps.get_model('flashcards', 'UserCard')
+    ReviewEvent = apps.get_model('flashcards', 'ReviewEvent')
+    table = qn(UserCard._meta.db_table)
+    sql = (
+        'UPDATE {table} SET {user_deck} = ('
+        'SELECT MIN({userdeck}) FROM {through} WHERE {usercard} = {table}.{id}'
+        ') WHERE {id} > %s AND {id} <= %s'
+    ).format(
+        table=table, through=qn('flashcards_userdeck_cards'), id=qn('id'),
+        user_deck=qn('user_deck_id'), userdeck=qn('userdeck_id'), usercard=qn('usercard_id'),
+    )
+    last = UserCard.objects.aggregate(last=models.Max('id'))['last'] or 0
+    for start in range(0, last, BATCH_SIZE):
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            cursor.execute(sql, [start, start + BATCH_SIZE])
+
+    # (user, card) becomes unique: keep the oldest of any copies
+    duplicates = UserCard.objects.values('user_id', 'card_id').annotate(
+        n=Count('id'), keep=Min('id')
+    ).filter(n__gt=1)
+    for row in duplicates.iterator():
+        with transaction.atomic(using=connection.alias):
+            copies = UserCard.objects.filter(
+                user_id=row['user_id'], card_id=row['card_id']
+            ).exclude(id=row['keep'])
+            ReviewEvent.objects.filter(user_card__in=copies).update(user_card_id=row['keep'])
+            copies.delete()
+
+
+def restore_user_deck_cards(apps, schema_editor):
+    """
+    refills the join table from user_deck; the copies the backfill merged
+    stay merged
+    """
+    qn = schema_editor.connection.ops.quote_name
+    schema_editor.execute(
+        'INSERT INTO {through} ({userdeck}, {usercard}) '
+        'SELECT {user_deck}, {id} FROM {table} WHERE {user_deck} IS NOT NULL'.format(
+            through=qn('flashcards_userdeck_cards'), userdeck=qn('userdeck_id'),
+            usercard=qn('usercard_id'), user_deck=qn('user_deck_id'), id=qn('id'),
+            table=qn(apps.get_model('flashcards', 'UserCard')._meta.db_table),
+        )
+    )
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('flashcards', '0012_reviewevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usercard',
+            name='user_deck',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='cards', to='flashcards.userdeck'),
+        ),
+        migrations.RunPython(backfill_user_deck, restore_user_deck_cards),
+        # drops the join table once the backfill has read it; unapplied,
+        # it recreates the table for restore_user_deck_cards to fill
+        migrations.RemoveField(model_name='userdeck', name='cards'),
+    ]
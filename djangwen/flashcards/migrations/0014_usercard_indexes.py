@@ -0,0 +1,41 @@
+# Generated by Django 3.1.14 on 2026-10-18 14:35
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('flashcards', '0013_usercard_user_deck'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='userdeck',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='usercard',
+            index=models.Index(fields=['user_deck', 'learning'], name='flashcards__user_de_9839ee_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usercard',
+            index=models.Index(fields=['user_deck', 'to_study', 'last_time'], name='flashcards__user_de_c91785_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usercard',
+            index=models.Index(fields=['user_deck', 'sorted'], name='flashcards__user_de_745a25_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userdeck',
+            index=models.Index(fields=['last_date'], name='flashcards__last_da_b8ae02_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='usercard',
+            constraint=models.UniqueConstraint(fields=('user', 'card'), name='unique_user_card'),
+        ),
+    ]
@@ -1,11 +1,29 @@
 import abc
 import math
-from collections import defaultdict
-from datetime import datetime
-from django.db import models
+import uuid
+from collections import Counter, defaultdict
+from datetime import timedelta
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models import Case, Count, F, Q, Value, When
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
 from django.dispatch import receiver
+from flashcards import bitsets, reviews
+from flashcards.bulk import bulk_create_inherited, chunked, insert_rows, insert_select
+from flashcards.caching import (
+    bump_catalogue,
+    bump_decks,
+    deck_bits_key,
+    get_deck_versions,
+    clear_user_deck_sessions,
+    set_user_deck_session
+)
+from flashcards.helpers import get_chinese, get_outcomes
+from flashcards.metrics import timed
+from flashcards.search import get_query_terms, get_terms
 
 
 class Profile(models.Model):
@@ -30,6 +48,9 @@ class Card(models.Model):
     name = models.CharField(max_length=64)
     frequency = models.IntegerField(default=0)
 
+    class Meta:
+        indexes = [models.Index(fields=['-frequency', 'id'])]
+
     @abc.abstractmethod
     def get_questions(self):
         return
@@ -45,6 +66,34 @@ class Card(models.Model):
             'answers': self.get_answers()
         }
 
+    @classmethod
+    def match_words(cls, words, batch_size=500):
+        """
+        maps each of words to the id of the Word, or failing that the
+        Character, spelled that way
+        """
+        words = set(words)
+        matches = {}
+        for model in (Character, Word):
+            for batch in chunked(words, batch_size):
+                matches.update(
+                    model.objects.filter(zi_simp__in=batch).values_list('zi_simp', 'id')
+                )
+        return matches
+
+    @classmethod
+    def add_frequencies(cls, counts):
+        """
+        adds counts {card_id: n} to Card.frequency with one UPDATE per
+        distinct n rather than one per card
+        """
+        by_count = defaultdict(list)
+        for card_id, n in counts.items():
+            by_count[n].append(card_id)
+        for n, card_ids in by_count.items():
+            for batch in chunked(card_ids, 500):
+                Card.objects.filter(id__in=batch).update(frequency=F('frequency') + n)
+
 
 class Word(Card):
     zi_simp = models.CharField(max_length=16)
@@ -126,6 +175,115 @@ class Sentence(Card):
         return a
 
 
+class CardFace(models.Model):
+    """
+    questions and answers of a Word, Character or Sentence copied out of
+    the child tables, so sessions can be built without knowing which one
+    a card lives in
+    """
+    card = models.OneToOneField(
+        Card, primary_key=True, on_delete=models.CASCADE, related_name='face'
+    )
+    kind = models.CharField(max_length=16)
+    questions = models.JSONField(default=list)
+    answers = models.JSONField(default=list)
+    hsk = models.IntegerField(default=0)
+
+    @classmethod
+    def from_card(cls, card):
+        return cls(
+            card_id=card.id,
+            kind=card._meta.model_name,
+            questions=list(card.get_questions()),
+            answers=list(card.get_answers()),
+            hsk=getattr(card, 'hsk', 0),
+        )
+
+    @classmethod
+    def bulk_sync(cls, cards, batch_size=500, created=False):
+        faces = [cls.from_card(c) for c in cards]
+        with transaction.atomic():
+            for batch in chunked(faces, batch_size):
+                if not created:
+                    cls.objects.filter(card_id__in=[f.card_id for f in batch]).delete()
+                cls.objects.bulk_create(batch, batch_size=batch_size)
+        return faces
+
+
+@receiver(post_save, sender=Word)
+@receiver(post_save, sender=Character)
+@receiver(post_save, sender=Sentence)
+def sync_card_face(sender, instance, raw=False, **kwargs):
+    if not raw:
+        face = CardFace.from_card(instance)
+        CardFace.objects.update_or_create(card_id=face.card_id, defaults={
+            'kind': face.kind,
+            'questions': face.questions,
+            'answers': face.answers,
+            'hsk': face.hsk,
+        })
+
+
+class SearchTerm(models.Model):
+    """
+    inverted index of the hanzi unigrams and bigrams, pinyin syllables and
+    English words of each card, see flashcards.search
+    """
+    term = models.CharField(max_length=64)
+    card = models.ForeignKey(Card, on_delete=models.CASCADE, related_name='search_terms')
+
+    class Meta:
+        indexes = [models.Index(fields=['term', 'card'])]
+
+    @classmethod
+    def bulk_sync(cls, cards, batch_size=500, created=False):
+        with transaction.atomic():
+            for batch in chunked(cards, batch_size):
+                if not created:
+                    cls.objects.filter(card_id__in=[c.id for c in batch]).delete()
+                insert_rows(cls, ['term', 'card'], (
+                    (term, c.id) for c in batch for term in get_terms(c)
+                ))
+
+    @classmethod
+    def search(cls, query, limit=20):
+        """
+        the faces of the cards matching query, most frequent first, then by
+        HSK level
+        """
+        groups = get_query_terms(query)
+        if not groups:
+            return []
+        matches = Q()
+        for group in groups:
+            card_ids = cls.objects.filter(term__in=group).values('card_id').annotate(
+                terms=Count('term', distinct=True)
+            ).filter(terms=len(group)).values('card_id')
+            matches |= Q(card_id__in=card_ids)
+        faces = CardFace.objects.filter(matches).select_related('card').order_by(
+            '-card__frequency',
+            Case(When(hsk=0, then=Value(99)), default=F('hsk')),
+            'card_id',
+        )
+        hanzi = get_chinese(query)
+        results = []
+        for face in faces.iterator():
+            if len(hanzi) > 2 and not any(hanzi in q for q in face.questions):
+                continue
+            results.append(face)
+            if len(results) == limit:
+                break
+        return results
+
+
+@receiver(post_save, sender=Word)
+@receiver(post_save, sender=Character)
+@receiver(post_save, sender=Sentence)
+def sync_search_terms(sender, instance, raw=False, **kwargs):
+    if not raw:
+        SearchTerm.bulk_sync([instance])
+
+
 class Deck(models.Model):
     type = models.CharField(max_length=64)
     name = models.CharField(max_length=64)
@@ -137,30 +295,167 @@ class Deck(models.Model):
 
     @property
     def card_total(self):
-        return len(self.cards.all())
+        return self.cards.count()
+
+    @classmethod
+    def get_catalogue(cls):
+        return Deck.objects.annotate(
+            card_count=Count('cards'),
+            kind=Case(
+                When(articledeck__isnull=False, then=Value('article')),
+                When(clipdeck__isnull=False, then=Value('clip')),
+                default=Value('deck'),
+                output_field=models.CharField(),
+            ),
+            url=F('articledeck__url'),
+        ).order_by('name', 'id')
 
     @classmethod
     def get_all_json(cls, type=None):
-        if type is None:
-            type = cls.type
-        decks = cls.objects.filter_by(type=type)
+        decks = cls.get_catalogue()
+        if type is not None:
+            decks = decks.filter(type=type)
         decks_json = {}
-        for d in decks:
-            if d.language in decks_json:
-                decks_json[d.language].append(d)
-            else:
-                decks_json[d.language] = [d]
+        for d in decks.values('id', 'name', 'type', 'card_count', 'kind', 'url'):
+            decks_json.setdefault(d['kind'], []).append(d)
         return decks_json
 
+    @classmethod
+    def get_bitsets(cls, deck_ids, batch_size=500):
+        """
+        {deck_id: bitset of the ids of its cards}, cached until the deck's
+        version is bumped
+        """
+        keys = {
+            deck_bits_key(deck_id, version): deck_id
+            for deck_id, version in get_deck_versions(deck_ids).items()
+        }
+        bits = {keys[k]: b for k, b in cache.get_many(keys).items()}
+        missing = set(keys.values()) - set(bits)
+        members = defaultdict(list)
+        for batch in chunked(missing, batch_size):
+            rows = cls.cards.through.objects.filter(deck_id__in=batch).values_list('deck_id', 'card_id')
+            for deck_id, card_id in rows.iterator():
+                members[deck_id].append(card_id)
+        computed = {deck_id: bitsets.from_ids(members[deck_id]) for deck_id in missing}
+        cache.set_many({
+            k: computed[deck_id] for k, deck_id in keys.items() if deck_id in computed
+        }, 24 * 60 * 60)
+        bits.update(computed)
+        return bits
+
+
+def deck_changed(sender, instance, **kwargs):
+    if isinstance(instance, Deck):
+        bump_catalogue()
+        bump_decks([instance.id])
+    elif isinstance(instance, Card) and kwargs.get('created') is not True:
+        bump_decks(instance.deck_set.values_list('id', flat=True))
+
+
+@receiver(m2m_changed, sender=Deck.cards.through)
+def deck_cards_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action.startswith('post_'):
+        bump_catalogue()
+        if reverse:
+            bump_decks(pk_set or instance.deck_set.values_list('id', flat=True))
+        else:
+            bump_decks([instance.id])
+
+
+DECK_STATUSES = [(s, s) for s in ('queued', 'processing', 'ready', 'failed')]
+
 
 class ArticleDeck(Deck):
-    url = models.CharField(max_length=64)
+    url = models.CharField(max_length=512)
+    text = models.TextField(blank=True)
     counted = models.BooleanField(default=False)
+    status = models.CharField(max_length=16, choices=DECK_STATUSES, default='ready')
+
+    @classmethod
+    def save_scrapers(cls, scrapers, batch_size=500, decks=None):
+        """
+        creates or refreshes the decks of scraped articles in bulk, linking
+        them to the cards of the words they contain; frequency.count_frequencies
+        counts the new ones. decks, one per scraper, are the rows to refresh,
+        by default the ones with the same url.
+        """
+        scrapers = list(scrapers)
+        card_ids = Card.match_words(w for s in scrapers for w in s.words)
+        through = Deck.cards.through
+        with transaction.atomic():
+            if decks is None:
+                existing = {
+                    d.url: d for d in cls.objects.filter(url__in=[s.url for s in scrapers])
+                }
+                decks = [existing.get(s.url) or cls(url=s.url, type='article') for s in scrapers]
+            refreshed = [d for d in decks if d.pk is not None]
+            for d, s in zip(decks, scrapers):
+                d.name = s.title[:64]
+                d.text = s.text
+            bulk_create_inherited(cls, [d for d in decks if d.pk is None], batch_size)
+            Deck.objects.bulk_update(refreshed, ['name'], batch_size)
+            cls.objects.bulk_update(refreshed, ['text'], batch_size)
+
+            through.objects.filter(deck_id__in=[d.id for d in refreshed]).delete()
+            through.objects.bulk_create([
+                through(deck_id=d.id, card_id=card_ids[w])
+                for d, s in zip(decks, scrapers) for w in s.words if w in card_ids
+            ], batch_size=batch_size, ignore_conflicts=True)
+
+        bump_catalogue()
+        bump_decks([d.id for d in decks])
+        return decks
 
 
 class ClipDeck(Deck):
     text = models.TextField()
     counted = models.BooleanField(default=False)
+    status = models.CharField(max_length=16, choices=DECK_STATUSES, default='ready')
+
+
+for model in (Deck, ArticleDeck, ClipDeck, Card, Word, Character, Sentence):
+    post_save.connect(deck_changed, sender=model)
+    post_delete.connect(deck_changed, sender=model)
+
+
+class Job(models.Model):
+    """
+    a row of the queue flashcards.jobs works through; kind names the
+    handler and deck what it works on
+    """
+    QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+    kind = models.CharField(max_length=32)
+    deck = models.ForeignKey(Deck, null=True, on_delete=models.CASCADE, related_name='jobs')
+    status = models.CharField(max_length=16, default=QUEUED)
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True)
+    finished_at = models.DateTimeField(null=True)
+    worker = models.CharField(max_length=128, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'run_after'])]
+
+
+@receiver(pre_save, sender=ArticleDeck)
+@receiver(pre_save, sender=ClipDeck)
+def queue_deck(sender, instance, raw=False, **kwargs):
+    # decks saved one at a time are processed by run_jobs; the ones made
+    # with bulk_create_inherited, as save_scrapers does, are not
+    if not raw and instance._state.adding and not instance.counted:
+        instance.status = 'queued'
+
+
+@receiver(post_save, sender=ArticleDeck)
+@receiver(post_save, sender=ClipDeck)
+def enqueue_deck(sender, instance, created, raw=False, **kwargs):
+    if created and not raw and instance.status == 'queued':
+        Job.objects.create(kind=sender._meta.model_name, deck=instance)
 
 
 class UserCard(models.Model):
@@ -170,32 +465,165 @@ class UserCard(models.Model):
     learning = models.BooleanField(default=False)  # for reprioritisation
     sorted = models.BooleanField(default=False)
     to_study = models.BooleanField(default=True)
-
-    card = models.OneToOneField(Card, on_delete=models.CASCADE)
-    user = models.OneToOneField(User, on_delete=models.CASCADE)
-
-    def known(self, multiplier):
+    due_at = models.DateTimeField(null=True, db_index=True)
+
+    card = models.ForeignKey(Card, on_delete=models.CASCADE)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    user_deck = models.ForeignKey(
+        'UserDeck', null=True, on_delete=models.CASCADE, related_name='cards'
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'card'], name='unique_user_card'),
+        ]
+        # the filters of shuffle(), the session pages and the browse views
+        indexes = [
+            models.Index(fields=['user_deck', 'learning']),
+            models.Index(fields=['user_deck', 'to_study', 'last_time']),
+            models.Index(fields=['user_deck', 'sorted']),
+        ]
+
+    REVIEW_FIELDS = ['ease', 'priority', 'learning', 'last_time', 'due_at']
+    SORT_FIELDS = ['to_study', 'sorted']
+
+    def known(self, multiplier, at=None):
         self.ease *= multiplier
         if self.priority is True:
             self.priority = False
         else:
             self.learning = False
-        self.last_time = datetime.now()
+        self.last_time = at or timezone.now()
+        self.schedule()
 
-    def unknown(self, multiplier):
+    def unknown(self, multiplier, at=None):
         ease = self.ease / multiplier
         if ease > 1:
             self.ease = math.floor(ease)
         else:
             self.ease = 1
         self.priority = True
-        self.last_time = datetime.now()
+        self.last_time = at or timezone.now()
+        self.schedule()
+
+    def review(self, result, sorting=False, multiplier=2, at=None):
+        """
+        applies one answer: z for known and x for unknown
+        """
+        if sorting:
+            if result == 'z':
+                self.to_study = False
+            elif result == 'x':
+                self.to_study = True
+            self.sorted = True
+        elif result == 'z':
+            self.known(multiplier, at)
+        elif result == 'x':
+            self.unknown(multiplier, at)
+
+    def schedule(self):
+        # a card is due again ease days after it was last seen
+        self.due_at = self.last_time + timedelta(days=self.ease)
 
     def get_questions(self):
-        return self.card.get_questions()
+        return self.card.face.questions
 
     def get_answers(self):
-        return self.card.get_answers()
+        return self.card.face.answers
+
+
+class UserVocabulary(models.Model):
+    """
+    the cards a user knows and the ones they are learning, as bitsets over
+    card ids (see flashcards.bitsets); every other card is unseen. Kept up
+    to date as UserCards change, so the coverage of a deck is a couple of
+    popcounts against its Deck.get_bitsets() entry.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='vocabulary')
+    known = models.BinaryField(default=b'')
+    learning = models.BinaryField(default=b'')
+
+    # four right answers in a row at the default multiplier
+    KNOWN_EASE = 16
+    KNOWN = Q(to_study=False) | Q(ease__gte=KNOWN_EASE)
+    LEARNING = Q(last_time__isnull=False) & ~KNOWN
+
+    @classmethod
+    def get_state(cls, user_card):
+        if not user_card.to_study or user_card.ease >= cls.KNOWN_EASE:
+            return 'known'
+        if user_card.last_time is not None:
+            return 'learning'
+        return 'unseen'
+
+    @classmethod
+    def rebuild(cls, user_id):
+        user_cards = UserCard.objects.filter(user_id=user_id)
+        vocabulary, _ = cls.objects.update_or_create(user_id=user_id, defaults={
+            'known': bitsets.from_ids(
+                user_cards.filter(cls.KNOWN).values_list('card_id', flat=True)
+            ),
+            'learning': bitsets.from_ids(
+                user_cards.filter(cls.LEARNING).values_list('card_id', flat=True)
+            ),
+        })
+        return vocabulary
+
+    @classmethod
+    def for_user(cls, user_id):
+        vocabulary = cls.objects.filter(user_id=user_id).first()
+        if vocabulary is None:
+            vocabulary = cls.rebuild(user_id)
+        return vocabulary
+
+    @classmethod
+    def update_cards(cls, user_id, user_cards):
+        """
+        moves the cards of user_cards to the bitset of their current state
+        """
+        states = defaultdict(list)
+        for c in user_cards:
+            states[cls.get_state(c)].append(c.card_id)
+        with transaction.atomic(savepoint=False):
+            vocabulary = cls.objects.select_for_update().filter(user_id=user_id).first()
+            if vocabulary is None:
+                return cls.rebuild(user_id)
+            vocabulary.known = bitsets.update(
+                vocabulary.known, states['known'], states['learning'] + states['unseen']
+            )
+            vocabulary.learning = bitsets.update(
+                vocabulary.learning, states['learning'], states['known'] + states['unseen']
+            )
+            vocabulary.save(update_fields=['known', 'learning'])
+        return vocabulary
+
+    def coverage(self, deck_ids):
+        """
+        {deck_id: counts of the deck's cards the user knows, is learning and
+        has never seen}
+        """
+        known = bitsets.to_int(self.known)
+        learning = bitsets.to_int(self.learning)
+        coverage = {}
+        for deck_id, bits in Deck.get_bitsets(deck_ids).items():
+            members = bitsets.to_int(bits)
+            total = bitsets.count(members)
+            known_count = bitsets.count(members & known)
+            learning_count = bitsets.count(members & learning)
+            coverage[deck_id] = {
+                'total': total,
+                'known': known_count,
+                'learning': learning_count,
+                'new': total - known_count - learning_count,
+                'percent_known': round(100 * known_count / total, 1) if total else 0,
+            }
+        return coverage
+
+
+@receiver(post_save, sender=UserCard)
+def user_card_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        UserVocabulary.update_cards(instance.user_id, [instance])
 
 
 class UserDeck(models.Model):
@@ -206,21 +634,41 @@ class UserDeck(models.Model):
     multiplier = models.IntegerField(default=2)
     entry_interval = models.IntegerField(default=5)
     last_date = models.DateField(null=True)
-
-    cards = models.ManyToManyField(UserCard)
-    user = models.OneToOneField(User, on_delete=models.CASCADE)
+    session = models.IntegerField(default=0)
+
+    # denormalized get_stats(): recounted by refresh_counters() when cards
+    # are added or shuffled, moved by add_counters() as answers come in
+    total_count = models.IntegerField(default=0)
+    seen_count = models.IntegerField(default=0)
+    to_study_count = models.IntegerField(default=0)
+    learning_count = models.IntegerField(default=0)
+    unsorted_count = models.IntegerField(default=0)
+
+    deck = models.ForeignKey(Deck, null=True, on_delete=models.SET_NULL)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+
+    class Meta:
+        indexes = [models.Index(fields=['last_date'])]
+
+    STATS = {
+        'total': None,
+        'seen': Q(to_study=False, last_time__isnull=False),
+        'to_study': Q(to_study=True),
+        'learning': Q(learning=True),
+        'unsorted': Q(sorted=False),
+    }
 
     @property
     def card_total(self):
-        return len(self.cards.all())
+        return self.cards.count()
 
     @property
     def get_learning_cards(self):
-        cards = self.cards.filter(learning=True).all()
-        if len(cards) == 0:
+        # a new day starts a new session, unless prebuild_sessions built it
+        cards = self.cards.filter(learning=True)
+        if self.last_date != timezone.localdate() or not cards.exists():
             self.shuffle()
-            cards = self.cards.filter(learning=True).all()
-        return cards
+        return cards.all()
 
     @property
     def get_unsorted_cards(self):
@@ -228,60 +676,190 @@ class UserDeck(models.Model):
 
     @property
     def seen_total(self):
-        cards = self.cards.filter(to_study=False, last_time__isnull=False).all()
-        return len(cards)
+        return self.cards.filter(self.STATS['seen']).count()
 
     @property
     def to_study_total(self):
-        return len(self.cards.filter(to_study=True).all())
+        return self.cards.filter(self.STATS['to_study']).count()
 
-    def populate(self, deck):
-        self.deck = deck
-        self.name = deck.name
-        for c in deck.cards:
-            uc = UserCard(card=c)
-            uc.save()
-            self.cards.add(uc)
+    def get_stats(self):
+        return self.cards.aggregate(**{
+            name: Count('id', filter=q) for name, q in self.STATS.items()
+        })
+
+    @staticmethod
+    def card_stats(card):
+        # the STATS a UserCard counts towards, apart from total
+        return {
+            'seen': not card.to_study and card.last_time is not None,
+            'to_study': card.to_study,
+            'learning': card.learning,
+            'unsorted': not card.sorted,
+        }
+
+    def refresh_counters(self, **fields):
+        counters = {
+            '{}_count'.format(name): value
+            for name, value in self.get_stats().items()
+        }
+        fields.update(counters)
+        for name, value in fields.items():
+            setattr(self, name, value)
+        # cards changed state, so cached session payloads are stale too
+        UserDeck.objects.filter(id=self.id).update(session=F('session') + 1, **fields)
+        self.session += 1
+        set_user_deck_session(self)
+
+    def add_counters(self, deltas):
+        """
+        moves the counters by deltas {stat: n} with one UPDATE, for the
+        review paths, which know how their cards changed
+        """
+        fields = {}
+        for name, delta in deltas.items():
+            field = '{}_count'.format(name)
+            if delta:
+                fields[field] = F(field) + delta
+                setattr(self, field, getattr(self, field) + delta)
+        UserDeck.objects.filter(id=self.id).update(session=F('session') + 1, **fields)
+        self.session += 1
+        set_user_deck_session(self)
+
+    @timed('populate')
+    def populate(self, deck=None):
+        """
+        clones the cards of deck the user does not own yet into this deck;
+        called again without a deck it picks up cards added to self.deck since.
+        Cards the user already has in another deck stay there.
+        """
+        if deck is not None:
+            self.deck = deck
+            self.name = deck.name
+            self.save()
+
+        user_cards = UserCard.objects.filter(user_id=self.user_id)
+        defaults = {
+            f.name: Value(f.get_default(), output_field=f)
+            for f in UserCard._meta.concrete_fields
+            if f.name not in ('id', 'card', 'user', 'user_deck')
+        }
+        with transaction.atomic():
+            user_cards.filter(card__deck=self.deck_id, user_deck__isnull=True).update(user_deck=self)
+            insert_select(
+                UserCard,
+                Deck.cards.through.objects.filter(deck_id=self.deck_id).exclude(
+                    card_id__in=user_cards.values('card_id')
+                ),
+                card=F('card_id'),
+                user=Value(self.user_id, output_field=models.IntegerField()),
+                user_deck=Value(self.id, output_field=models.IntegerField()),
+                **defaults
+            )
+            self.refresh_counters()
 
     def organise_cards(self):
         self.seen_cards = self.cards.filter(last_time__isnull=False).all()
         self.unseen_cards = self.cards.filter(last_time__isnull=True).all()
         self.learning_cards = self.cards.filter(learning=True).all()
 
+    @timed('shuffle')
     def shuffle(self):
-        self.organise_cards()
-        if len(self.seen_cards) == 0:
-            card_number = min(self.card_number, self.card_total)
-            for c in self.unseen_cards[0:card_number]:
-                c.learning = True
-            return
-
-        min_time = min(self.seen_cards, key=lambda c: c.last_time).last_time
-        delta_cards = defaultdict(list)
-        for c in self.seen_cards:
-            if c.to_study:
-                delta = (c.last_time - min_time).total_seconds()
-                delta_cards[delta*c.ease].append(c)
-                if not c.priority:
-                    c.learning = False
-
-        counter = 0
-        while counter < self.card_number:
-            for c in delta_cards[min(delta_cards)]:
-                c.learning = True
-                counter += 1
-            del delta_cards[min(delta_cards)]
-            if len(delta_cards) == 0:
-                break
+        to_study = self.cards.filter(to_study=True)
+        seen = to_study.filter(last_time__isnull=False)
+        unseen = self.cards.filter(last_time__isnull=True)
 
-        counter = 0
-        for c in self.unseen_cards:
-            if c.to_study:
-                c.learning = True
-                counter += 1
-                if counter == self.new_card_number:
-                    break
+        with transaction.atomic():
+            if not self.cards.filter(last_time__isnull=False).exists():
+                ids = unseen.order_by('id').values_list('id', flat=True)
+                self._set_learning(ids[:self.card_number])
+                self.refresh_counters(last_date=timezone.localdate())
+                return
 
+            UserCard.objects.filter(
+                id__in=seen.filter(priority=False, learning=True).values('id')
+            ).update(learning=False)
+
+            ids = seen.order_by('due_at', 'id').values_list('id', flat=True)
+            self._set_learning(ids[:self.card_number])
+
+            ids = unseen.filter(to_study=True).order_by('id').values_list('id', flat=True)
+            self._set_learning(ids[:self.new_card_number])
+            self.refresh_counters(last_date=timezone.localdate())
+
+    @classmethod
+    @timed('prebuild')
+    def prebuild(cls, user_deck_ids, today=None):
+        """
+        shuffle() for many decks at once: reads all their cards in one
+        query, picks each session in Python with the same rules and writes
+        the learning flags and counters in bulk. Returns the number of
+        cards whose learning flag changed.
+        """
+        today = today or timezone.localdate()
+        user_decks = cls.objects.in_bulk(user_deck_ids)
+        cards = defaultdict(list)
+        rows = UserCard.objects.filter(user_deck_id__in=user_decks).values_list(
+            'user_deck_id', 'id', 'last_time', 'due_at',
+            'to_study', 'priority', 'learning', 'sorted',
+        ).order_by('id')
+        for user_deck_id, *card in rows.iterator():
+            cards[user_deck_id].append(card)
+
+        on, off = [], []
+        for user_deck in user_decks.values():
+            deck_cards = cards[user_deck.id]
+            learning = user_deck._pick_session(deck_cards)
+            counters = defaultdict(int)
+            for card_id, last_time, due_at, to_study, priority, was_learning, is_sorted in deck_cards:
+                if (card_id in learning) != was_learning:
+                    (on if card_id in learning else off).append(card_id)
+                counters['total_count'] += 1
+                counters['seen_count'] += not to_study and last_time is not None
+                counters['to_study_count'] += to_study
+                counters['learning_count'] += card_id in learning
+                counters['unsorted_count'] += not is_sorted
+            for name in ('total', 'seen', 'to_study', 'learning', 'unsorted'):
+                setattr(user_deck, name + '_count', counters[name + '_count'])
+            user_deck.last_date = today
+
+        with transaction.atomic():
+            for batch in chunked(on, 500):
+                UserCard.objects.filter(id__in=batch).update(learning=True)
+            for batch in chunked(off, 500):
+                UserCard.objects.filter(id__in=batch).update(learning=False)
+            cls.objects.bulk_update(user_decks.values(), [
+                'last_date', 'total_count', 'seen_count', 'to_study_count',
+                'learning_count', 'unsorted_count',
+            ])
+            cls.objects.filter(id__in=user_decks).update(session=F('session') + 1)
+        clear_user_deck_sessions(user_decks)
+        return len(on) + len(off)
+
+    def _pick_session(self, cards):
+        """
+        the ids that shuffle() leaves learning, from (id, last_time, due_at,
+        to_study, priority, learning, sorted) rows in id order
+        """
+        learning = {c[0] for c in cards if c[5]}
+        unseen = [c[0] for c in cards if c[1] is None]
+        if len(unseen) == len(cards):
+            return learning | set(unseen[:self.card_number])
+
+        seen = [c for c in cards if c[3] and c[1] is not None]
+        learning -= {c[0] for c in seen if not c[4]}
+        # the database sorts cards that were never scheduled first
+        seen.sort(key=lambda c: (c[2] is not None, c[2] or 0, c[0]))
+        learning.update(c[0] for c in seen[:self.card_number])
+        new = [c[0] for c in cards if c[1] is None and c[3]]
+        learning.update(new[:self.new_card_number])
+        return learning
+
+    def _set_learning(self, ids):
+        ids = list(ids)
+        if ids:
+            UserCard.objects.filter(id__in=ids).update(learning=True)
+
+    @timed('play_outcomes')
     def play_outcomes(self, outcomes):
         """
         plays as many cards as there are in outcomes
@@ -293,42 +871,85 @@ class UserDeck(models.Model):
         }
 
         """
-        for i in range(0, len(outcomes) - 1):
-            outcome_row = outcomes[str(i+1)]
-            card_id = int(outcome_row.get('id'))
-            card = UserCard.objects.get(card_id)
-            result = outcome_row.get('result')
-            if result == 'z':
-                card.known(self.multiplier)
-            elif result == 'x':
-                card.unknown(self.multiplier)
+        return self.ingest_outcomes(outcomes)
 
     def process_sort(self, outcomes):
-        for i in range(0, len(outcomes) - 1):
-            outcome_row = outcomes[str(i+1)]
-            card_id = int(outcome_row.get('id'))
-            card = UserCard.objects.get(card_id)
-            result = outcome_row.get('result')
-            if result == 'z':
-                card.to_study = False
-            elif result == 'x':
-                card.to_study = True
-            card.sorted = True
+        return self.ingest_outcomes(outcomes, sorting=True)
 
-    def get_flash_cards(self, sorting=False):
-        flash_cards = []
+    @timed('ingest_outcomes')
+    def ingest_outcomes(self, outcomes, sorting=False, batch=None):
+        """
+        records one ReviewEvent per outcome and applies it to its card; with
+        FLASHCARDS_REVIEW_WRITE_BEHIND the events are only buffered, and
+        reviews.flush() writes them and the card state later in batches.
+        batch is the (run, seq) a client numbered its outcomes with: the
+        events of a batch get the same keys every time it is posted, so a
+        retried batch is only applied once.
+        """
+        rows = get_outcomes(outcomes)
+        ids = {card_id for card_id, _ in rows}
+        now = timezone.now()
+        if batch is None:
+            keys = [uuid.uuid4().hex for _ in rows]
+        else:
+            keys = [
+                uuid.uuid5(uuid.NAMESPACE_URL, '{}/{}/{}/{}'.format(self.id, *batch, n)).hex
+                for n in range(len(rows))
+            ]
+        events = [{
+            'key': key,
+            'user_card': card_id,
+            'user_deck': self.id,
+            'result': result,
+            'sorting': sorting,
+            'multiplier': self.multiplier,
+            'created_at': now.isoformat(),
+        } for key, (card_id, result) in zip(keys, rows)]
+
+        if reviews.write_behind():
+            self._check_cards(ids, self.cards.filter(id__in=ids).values_list('id', flat=True))
+            reviews.enqueue(events)
+            return events
+        with transaction.atomic():
+            cards = self.cards.in_bulk(ids)
+            self._check_cards(ids, cards)
+            ReviewEvent.apply(
+                events, cards=cards, user_decks={self.id: self}, skip_recorded=batch is not None
+            )
+        return events
+
+    def _check_cards(self, ids, found):
+        missing = ids - set(found)
+        if missing:
+            raise ValueError('Cards {} are not in deck {}'.format(sorted(missing), self.id))
+
+    @timed('get_flash_cards')
+    def get_flash_cards(self, sorting=False, after=None, limit=None):
+        """
+        the cards of the session in id order; after and limit page through
+        them by card id, so the pages stay put while cards are answered
+        """
         if sorting is False:
-            deck_cards = self.get_learning_cards()
+            deck_cards = self.get_learning_cards
         else:
-            deck_cards = self.get_unsorted_cards()
-        i = 0
-        for c in deck_cards:
-            tc = c.get_dict()
-            tc['i'] = i
-            tc['ease'] = c.ease
-            i += 1
-            flash_cards.append(tc)
-
+            deck_cards = self.get_unsorted_cards
+        if after is not None:
+            deck_cards = deck_cards.filter(id__gt=after)
+        rows = deck_cards.order_by('id').values_list(
+            'id', 'ease', 'card__face__kind', 'card__face__questions', 'card__face__answers'
+        )
+        if limit is not None:
+            rows = rows[:limit]
+        flash_cards = []
+        for i, (card_id, ease, kind, questions, answers) in enumerate(rows):
+            flash_cards.append({
+                'id': card_id,
+                'i': i,
+                'ease': ease,
+                'kind': kind,
+                'questions': questions,
+                'answers': answers,
+            })
         return flash_cards
 
     def get_display_cards(self):
@@ -339,3 +960,88 @@ class UserDeck(models.Model):
             else:
                 cards[2].append(c)
         return cards
+
+
+class ReviewEvent(models.Model):
+    """
+    one answer given to a UserCard, appended and never updated; ease is the
+    card's ease after the answer
+    """
+    key = models.UUIDField(unique=True)
+    user_card = models.ForeignKey(UserCard, on_delete=models.CASCADE, related_name='reviews')
+    user_deck = models.ForeignKey(UserDeck, null=True, on_delete=models.SET_NULL)
+    result = models.CharField(max_length=1)
+    sorting = models.BooleanField(default=False)
+    multiplier = models.IntegerField(default=2)
+    ease = models.IntegerField()
+    created_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [models.Index(fields=['user_card', 'created_at'])]
+
+    @classmethod
+    def apply(cls, events, cards=None, user_decks=None, skip_recorded=False):
+        """
+        replays events (dicts built by UserDeck.ingest_outcomes) in order
+        onto their UserCards, then writes the events, the cards, and the
+        vocabulary and counters they change in one transaction
+        """
+        with transaction.atomic():
+            if skip_recorded:
+                recorded = {
+                    k.hex for k in
+                    cls.objects.filter(key__in=[e['key'] for e in events]).values_list('key', flat=True)
+                }
+                fresh = []
+                for e in events:
+                    # a batch may also have been buffered twice
+                    if e['key'] not in recorded:
+                        recorded.add(e['key'])
+                        fresh.append(e)
+                events = fresh
+            if cards is None:
+                cards = UserCard.objects.in_bulk({e['user_card'] for e in events})
+            if user_decks is None:
+                user_decks = UserDeck.objects.in_bulk({e['user_deck'] for e in events})
+
+            reviewed, before, fields, written = {}, {}, set(), []
+            for e in events:
+                card = cards.get(e['user_card'])
+                if card is None:
+                    # deleted since it was answered
+                    continue
+                before.setdefault(card.id, UserDeck.card_stats(card))
+                created_at = parse_datetime(e['created_at'])
+                card.review(e['result'], e['sorting'], e['multiplier'], created_at)
+                fields.update(UserCard.SORT_FIELDS if e['sorting'] else UserCard.REVIEW_FIELDS)
+                reviewed[card.id] = card
+                written.append(cls(
+                    key=e['key'],
+                    user_card_id=card.id,
+                    user_deck_id=e['user_deck'],
+                    result=e['result'],
+                    sorting=e['sorting'],
+                    multiplier=e['multiplier'],
+                    ease=card.ease,
+                    created_at=created_at,
+                ))
+            cls.objects.bulk_create(written)
+            if reviewed:
+                UserCard.objects.bulk_update(reviewed.values(), sorted(fields))
+            by_user = defaultdict(list)
+            for card in reviewed.values():
+                by_user[card.user_id].append(card)
+            for user_id, user_cards in by_user.items():
+                UserVocabulary.update_cards(user_id, user_cards)
+
+            deltas = defaultdict(Counter)
+            for card in reviewed.values():
+                if card.user_deck_id is not None:
+                    delta = deltas[card.user_deck_id]
+                    for name, now in UserDeck.card_stats(card).items():
+                        delta[name] += now - before[card.id][name]
+            user_decks = dict(user_decks)
+            user_decks.update(UserDeck.objects.in_bulk(set(deltas) - set(user_decks)))
+            for user_deck_id, delta in deltas.items():
+                user_decks[user_deck_id].add_counters(delta)
+        return written
@@ -0,0 +1,59 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import timedelta
+from django.db import connections
+from django.db.models import Q
+from django.utils import timezone
+from flashcards.bulk import chunked
+from flashcards.models import ReviewEvent, UserDeck
+
+
+def init_worker():
+    # the forked workers must not share the parent's connection
+    connections.close_all()
+
+
+def prebuild_chunk(user_deck_ids, today):
+    return len(user_deck_ids), UserDeck.prebuild(user_deck_ids, today)
+
+
+def get_stale_user_decks(today, active_days=None):
+    """
+    the decks whose session is older than today; with active_days only the
+    ones answered in the last active_days days
+    """
+    user_decks = UserDeck.objects.filter(Q(last_date__isnull=True) | Q(last_date__lt=today))
+    if active_days is not None:
+        since = timezone.now() - timedelta(days=active_days)
+        user_decks = user_decks.filter(id__in=ReviewEvent.objects.filter(
+            created_at__gte=since
+        ).values('user_deck_id'))
+    return user_decks.order_by('id').values_list('id', flat=True)
+
+
+def prebuild_sessions(today=None, jobs=1, chunk_size=200, active_days=None, progress=None):
+    """
+    rebuilds today's session of every stale deck, chunk_size decks per
+    transaction, in jobs worker processes; calls progress(decks, cards)
+    after each chunk and returns the totals
+    """
+    today = today or timezone.localdate()
+    chunks = list(chunked(get_stale_user_decks(today, active_days).iterator(), chunk_size))
+    decks = cards = 0
+    if jobs <= 1:
+        results = (prebuild_chunk(chunk, today) for chunk in chunks)
+    else:
+        connections.close_all()
+        executor = ProcessPoolExecutor(jobs, initializer=init_worker)
+        results = (f.result() for f in as_completed(
+            [executor.submit(prebuild_chunk, chunk, today) for chunk in chunks]
+        ))
+    try:
+        for chunk_decks, chunk_cards in results:
+            decks += chunk_decks
+            cards += chunk_cards
+            if progress is not None:
+                progress(decks, cards)
+    finally:
+        if jobs > 1:
+            executor.shutdown()
+    return decks, cards
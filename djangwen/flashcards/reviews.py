@@ -0,0 +1,201 @@
+import atexit
+import fcntl
+import json
+import os
+import threading
+from django.conf import settings
+
+
+class MemoryBuffer():
+    """
+    review events waiting to be flushed, held by this process: the other
+    processes of a server cannot see them, and they are flushed when the
+    process exits but lost if it is killed. Servers with several processes
+    should set FLASHCARDS_REVIEW_SPOOL.
+    """
+
+    def __init__(self):
+        self.events = []
+        self.lock = threading.Lock()
+
+    def pending(self):
+        return bool(self.events)
+
+    def append(self, events):
+        with self.lock:
+            self.events.extend(events)
+            return len(self.events)
+
+    def drain(self):
+        with self.lock:
+            events, self.events = self.events, []
+        return events
+
+    def done(self):
+        pass
+
+    def peek(self, user_deck_id):
+        with self.lock:
+            return [e for e in self.events if e['user_deck'] == user_deck_id]
+
+    def discard(self, keys):
+        with self.lock:
+            self.events = [e for e in self.events if e['key'] not in keys]
+
+
+class SpoolFile():
+    """
+    review events waiting to be flushed, appended as JSON lines to a file
+    every process shares, so they survive a restart. drain() moves the file
+    aside and done() removes it once its events are in the database; a
+    spool left aside by a failed flush is picked up again by the next one.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.draining = path + '.flushing'
+        self.lock = threading.Lock()
+        self.appended = 0
+
+    def pending(self):
+        return os.path.exists(self.path) or os.path.exists(self.draining)
+
+    def append(self, events):
+        """
+        returns how many events this process appended since it last drained
+        """
+        lines = ''.join(json.dumps(e, separators=(',', ':')) + '\n' for e in events)
+        with self.lock:
+            while True:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                    # drain() may have moved the file aside while we waited
+                    if os.path.exists(self.path) and os.path.samestat(
+                        os.fstat(f.fileno()), os.stat(self.path)
+                    ):
+                        f.write(lines)
+                        f.flush()
+                        os.fsync(f.fileno())
+                        break
+            self.appended += len(events)
+            return self.appended
+
+    def drain(self):
+        with self.lock:
+            self.appended = 0
+            if not os.path.exists(self.draining):
+                if not os.path.exists(self.path):
+                    return []
+                with open(self.path, 'a') as f:
+                    # wait for an append in another process to finish
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                    os.replace(self.path, self.draining)
+            with open(self.draining, encoding='utf-8') as f:
+                return [json.loads(l) for l in f if l.strip()]
+
+    def done(self):
+        if os.path.exists(self.draining):
+            os.remove(self.draining)
+
+    def peek(self, user_deck_id):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                fcntl.flock(f, fcntl.LOCK_SH)
+                events = [json.loads(l) for l in f if l.strip()]
+        except FileNotFoundError:
+            return []
+        return [e for e in events if e['user_deck'] == user_deck_id]
+
+    def discard(self, keys):
+        """
+        rewrites the spool without the events of keys, once they are written
+        """
+        with self.lock:
+            try:
+                f = open(self.path, 'r+', encoding='utf-8')
+            except FileNotFoundError:
+                return
+            with f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                if not os.path.exists(self.path) or not os.path.samestat(
+                    os.fstat(f.fileno()), os.stat(self.path)
+                ):
+                    # drained meanwhile; flush() skips the recorded events
+                    return
+                lines = [l for l in f if l.strip() and json.loads(l)['key'] not in keys]
+                f.seek(0)
+                f.write(''.join(lines))
+                f.truncate()
+                f.flush()
+                os.fsync(f.fileno())
+
+
+_buffer = None
+
+
+def write_behind():
+    return getattr(settings, 'FLASHCARDS_REVIEW_WRITE_BEHIND', False)
+
+
+def get_buffer():
+    """
+    the process-wide buffer: the spool file at FLASHCARDS_REVIEW_SPOOL when
+    it is set and memory otherwise
+    """
+    global _buffer
+    if _buffer is None:
+        path = getattr(settings, 'FLASHCARDS_REVIEW_SPOOL', None)
+        _buffer = SpoolFile(path) if path else MemoryBuffer()
+    return _buffer
+
+
+def reset_buffer():
+    global _buffer
+    _buffer = None
+
+
+def enqueue(events):
+    """
+    buffers events, flushing them all once this process has buffered
+    FLASHCARDS_REVIEW_FLUSH_SIZE of them
+    """
+    size = get_buffer().append(events)
+    if size >= getattr(settings, 'FLASHCARDS_REVIEW_FLUSH_SIZE', 1000):
+        flush()
+
+
+def flush():
+    """
+    writes the buffered events and the UserCard state they lead to in one
+    transaction; returns the number of events written
+    """
+    from flashcards.models import ReviewEvent
+    buffer = get_buffer()
+    events = buffer.drain()
+    if not events:
+        return 0
+    written = ReviewEvent.apply(events, skip_recorded=True)
+    buffer.done()
+    return len(written)
+
+
+def flush_user_deck(user_deck_id):
+    """
+    writes the buffered events of one user deck, leaving the others to
+    flush(); they stay buffered until written, and writing them twice is
+    harmless, so a failure or a concurrent flush() loses nothing
+    """
+    from flashcards.models import ReviewEvent
+    buffer = get_buffer()
+    events = buffer.peek(user_deck_id)
+    if not events:
+        return 0
+    written = ReviewEvent.apply(events, skip_recorded=True)
+    buffer.discard({e['key'] for e in events})
+    return len(written)
+
+
+@atexit.register
+def flush_at_exit():
+    if isinstance(_buffer, MemoryBuffer) and _buffer.pending():
+        flush()
@@ -0,0 +1,43 @@
+"""
+the router of the production profile (djangwen.settings_production), which
+sends reads of the catalogue to a read-only alias
+"""
+from django.conf import settings
+from django.db import connections
+
+# the models read far more often than written: the cards, their faces and
+# search terms, which only management commands write, and the decks, which
+# users also submit and the job queue fills in; reads that must see a write
+# just made, as DeckStatusView's, ask for the primary with using('default')
+CATALOGUE_MODELS = {
+    'card', 'word', 'character', 'sentence', 'cardface', 'searchterm',
+    'deck', 'deck_cards', 'articledeck', 'clipdeck',
+}
+
+
+class ReadReplicaRouter():
+    """
+    reads of the catalogue go to the FLASHCARDS_READ_DATABASE alias, unless
+    the primary is inside a transaction that may have written them;
+    everything else, and every write, goes to the primary
+    """
+
+    def __init__(self):
+        self.replica = getattr(settings, 'FLASHCARDS_READ_DATABASE', None)
+
+    def is_catalogue(self, model):
+        return model._meta.app_label == 'flashcards' and model._meta.model_name in CATALOGUE_MODELS
+
+    def db_for_read(self, model, **hints):
+        if self.replica and self.is_catalogue(model) and not connections['default'].in_atomic_block:
+            return self.replica
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != self.replica
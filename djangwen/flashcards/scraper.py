@@ -1,14 +1,246 @@
-import abc
-from collections import Counter
+import asyncio
+import codecs
+import http.client
+import ipaddress
+import socket
+import threading
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urlsplit
+from django.conf import settings
+from flashcards.metrics import span
+from flashcards.segmenter import get_segmenter
+
+
+class ArticleParser(HTMLParser):
+    skip_tags = {'script', 'style', 'noscript', 'template'}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.title = ''
+        self.text = []
+        self.stack = []
+
+    def handle_starttag(self, tag, attrs):
+        self.stack.append(tag)
+
+    def handle_endtag(self, tag):
+        if tag in self.stack:
+            while self.stack.pop() != tag:
+                pass
+
+    def handle_data(self, data):
+        if 'title' in self.stack:
+            self.title += data
+        elif not self.skip_tags.intersection(self.stack):
+            self.text.append(data)
 
 
 class Scraper():
 
-    def __init__(self, url=None):
+    def __init__(self, url=None, segmenter=None):
         self.url = url
         self.title = None
+        self.text = ''
         self.words = Counter()
+        self.segmenter = segmenter
+
+    def count_words(self, text):
+        segmenter = self.segmenter or get_segmenter()
+        if isinstance(text, str):
+            text = [text]
+        self.words.update(segmenter.segment_chunks(text))
+        return self.words
+
+    def process_page(self, html):
+        with span('scraper.parse', sql=False):
+            parser = ArticleParser()
+            parser.feed(html)
+            parser.close()
+        self.title = ' '.join(parser.title.split()) or self.url
+        self.text = '\n'.join(t.strip() for t in parser.text if t.strip())
+        with span('scraper.segment', sql=False):
+            self.count_words(parser.text)
+        return self
+
+
+def is_public(address):
+    ip = ipaddress.ip_address(address)
+    if ip.version == 6 and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+def check_url(url, public_only=False):
+    """
+    raises ValueError unless url is http or https and, with public_only,
+    every address its host resolves to is a public one
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise ValueError('{} is not an http or https url'.format(url))
+    if public_only:
+        try:
+            addresses = {a[4][0] for a in socket.getaddrinfo(parts.hostname, parts.port or 80)}
+        except OSError as e:
+            raise ValueError('{} cannot be resolved: {}'.format(parts.hostname, e))
+        if not all(is_public(a) for a in addresses):
+            raise ValueError('{} is not a public host'.format(parts.hostname))
+
+
+class ConnectionPool():
+    """
+    keep-alive http.client connections, pooled per scheme and host, which
+    the fetch workers borrow from their threads. With public_only every
+    connection, redirects included, must reach a public address, checked
+    on the connected socket so a host cannot resolve differently later;
+    bodies longer than max_bytes are refused.
+    """
+
+    def __init__(self, timeout=10, public_only=False, max_bytes=None):
+        self.timeout = timeout
+        self.public_only = public_only
+        self.max_bytes = max_bytes or getattr(settings, 'FLASHCARDS_SCRAPE_MAX_BYTES', 5 * 1024 * 1024)
+        self.idle = defaultdict(list)
+        self.lock = threading.Lock()
+
+    def get(self, scheme, host):
+        with self.lock:
+            if self.idle[scheme, host]:
+                return self.idle[scheme, host].pop()
+        if scheme == 'https':
+            return http.client.HTTPSConnection(host, timeout=self.timeout)
+        return http.client.HTTPConnection(host, timeout=self.timeout)
+
+    def put(self, scheme, host, connection):
+        with self.lock:
+            self.idle[scheme, host].append(connection)
+
+    def close(self):
+        with self.lock:
+            for connections in self.idle.values():
+                for connection in connections:
+                    connection.close()
+            self.idle.clear()
+
+    def connect(self, connection):
+        connection.connect()
+        peer = connection.sock.getpeername()[0]
+        if not is_public(peer):
+            connection.close()
+            raise ValueError('{} is not a public address'.format(peer))
+
+    def fetch(self, url, redirects=5):
+        check_url(url)
+        parts = urlsplit(url)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        for attempt in range(2):
+            connection = self.get(parts.scheme, parts.netloc)
+            try:
+                if self.public_only and connection.sock is None:
+                    self.connect(connection)
+                connection.request('GET', path, headers={'Connection': 'keep-alive'})
+                response = connection.getresponse()
+                body = response.read(self.max_bytes + 1)
+            except (http.client.HTTPException, ConnectionError):
+                # a pooled connection the server has since closed
+                connection.close()
+                if attempt:
+                    raise
+                continue
+            if len(body) > self.max_bytes:
+                connection.close()
+                raise ValueError('{} is larger than {} bytes'.format(url, self.max_bytes))
+            if response.will_close:
+                connection.close()
+            else:
+                self.put(parts.scheme, parts.netloc, connection)
+            break
+
+        location = response.getheader('Location')
+        if response.status in (301, 302, 303, 307, 308) and location and redirects:
+            return self.fetch(urljoin(url, location), redirects - 1)
+        if response.status != 200:
+            raise http.client.HTTPException('{} returned {}'.format(url, response.status))
+        return body.decode(get_charset(response), errors='replace')
+
+
+def get_charset(response):
+    charset = response.headers.get_content_charset() or 'utf-8'
+    try:
+        codecs.lookup(charset)
+    except LookupError:
+        # a charset Python does not know, most pages are utf-8 anyway
+        return 'utf-8'
+    return charset
+
+
+def scrape(urls, **kwargs):
+    # the segmenter may have to be built from the database, which Django
+    # only allows outside the event loop
+    return asyncio.run(scrape_articles(urls, get_segmenter(), **kwargs))
+
+
+async def scrape_articles(urls, segmenter, concurrency=16, per_host=4,
+                          processors=4, queue_size=32, public_only=False):
+    """
+    fetches urls with at most concurrency requests in flight and per_host
+    of them against any one host, handing the pages through a bounded queue
+    to processors that extract and segment them. Returns the Scrapers of
+    the pages that could be fetched and the errors of the others. With
+    public_only, for urls users submit, only public addresses are fetched.
+    """
+    loop = asyncio.get_running_loop()
+    pool = ConnectionPool(public_only=public_only)
+    executor = ThreadPoolExecutor(max_workers=concurrency + processors)
+    todo = asyncio.Queue()
+    pages = asyncio.Queue(maxsize=queue_size)
+    host_limits = defaultdict(lambda: asyncio.Semaphore(per_host))
+    scrapers, errors = [], {}
+
+    for url in dict.fromkeys(urls):
+        todo.put_nowait(url)
+
+    def fetch(url):
+        with span('scraper.fetch', sql=False):
+            return pool.fetch(url)
+
+    async def fetcher():
+        while True:
+            try:
+                url = todo.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            async with host_limits[urlsplit(url).netloc]:
+                try:
+                    html = await loop.run_in_executor(executor, fetch, url)
+                except (OSError, ValueError, http.client.HTTPException) as e:
+                    errors[url] = str(e)
+                    continue
+            await pages.put((url, html))
+
+    async def processor():
+        while True:
+            url, html = await pages.get()
+            scraper = Scraper(url, segmenter)
+            try:
+                await loop.run_in_executor(executor, scraper.process_page, html)
+                scrapers.append(scraper)
+            except Exception as e:
+                errors[url] = str(e)
+            finally:
+                pages.task_done()
 
-    @abc.abstractmethod
-    def process_page(self):
-        returnh
+    workers = [asyncio.ensure_future(processor()) for _ in range(processors)]
+    try:
+        await asyncio.gather(*(fetcher() for _ in range(concurrency)))
+        await pages.join()
+    finally:
+        for w in workers:
+            w.cancel()
+        executor.shutdown(wait=False)
+        pool.close()
+    return scrapers, errors
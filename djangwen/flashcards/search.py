@@ -0,0 +1,88 @@
+import re
+import unicodedata
+
+HANZI = re.compile(u'[\u4E00-\u9FA5]')  # same range as helpers.get_chinese
+SYLLABLE = re.compile(r'([a-zv]+)([1-5]?)')
+ENGLISH_WORD = re.compile(r"[a-z0-9']+")
+TERM_LENGTH = 64
+
+
+def strip_tones(pinyin):
+    """
+    nǐhǎo -> nihao, lǜ -> lv
+    """
+    decomposed = unicodedata.normalize('NFD', pinyin.lower())
+    decomposed = decomposed.replace('u\u0308', 'v')
+    return ''.join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def normalize_pinyin(pinyin):
+    return strip_tones(pinyin).replace('u:', 'v')
+
+
+def normalize_tone_marks(pinyin):
+    return unicodedata.normalize('NFC', pinyin.lower().replace(' ', ''))
+
+
+def pinyin_terms(pinyin_number, pinyin_tone):
+    """
+    terms for the syllables of a reading with and without their tone
+    numbers, and for the whole reading numbered, toneless and tone-marked
+    """
+    numbered = normalize_pinyin(pinyin_number).replace(' ', '')
+    syllables = SYLLABLE.findall(numbered)
+    terms = set()
+    for letters, tone in syllables:
+        terms.add(letters)
+        terms.add(letters + tone)
+    terms.add(''.join(letters for letters, _ in syllables))
+    terms.add(''.join(letters + tone for letters, tone in syllables))
+    if pinyin_tone:
+        terms.add(normalize_tone_marks(pinyin_tone))
+    return {'p:' + t for t in terms if t}
+
+
+def hanzi_terms(*texts):
+    terms = set()
+    for text in texts:
+        chars = HANZI.findall(text)
+        terms.update('h:' + c for c in chars)
+        terms.update('h:' + a + b for a, b in zip(chars, chars[1:]))
+    return terms
+
+
+def english_terms(english):
+    return {'e:' + w for w in ENGLISH_WORD.findall(english.lower())}
+
+
+def get_terms(card):
+    """
+    the search terms of a Word, Character or Sentence
+    """
+    terms = hanzi_terms(card.zi_simp, card.zi_trad)
+    terms |= pinyin_terms(card.pinyin_number, card.pinyin_tone)
+    terms |= english_terms(card.english)
+    return {t[:TERM_LENGTH] for t in terms}
+
+
+def get_query_terms(query):
+    """
+    splits a query into groups of terms: a card matches a group when it
+    has every term in it and matches the query when it matches any group
+    """
+    query = query.strip()
+    chars = HANZI.findall(query)
+    if chars:
+        if len(chars) == 1:
+            return [['h:' + chars[0]]]
+        return [['h:' + a + b for a, b in zip(chars, chars[1:])]]
+
+    groups = []
+    compact = normalize_tone_marks(query)
+    if strip_tones(compact) != compact:
+        return [['p:' + compact[:TERM_LENGTH - 2]]]
+    groups.append(['p:' + normalize_pinyin(compact)])
+    words = ENGLISH_WORD.findall(query.lower())
+    if words:
+        groups.append(['e:' + w for w in words])
+    return [[t[:TERM_LENGTH] for t in group] for group in groups]
@@ -0,0 +1,146 @@
+import math
+import re
+from django.conf import settings
+from flashcards.lexicon import get_lexicon
+
+CHINESE = re.compile(u'[\u4E00-\u9FA5]+')  # same range as helpers.get_chinese
+
+
+class Segmenter():
+    """
+    Chinese word segmenter over a prefix dictionary: every word and every
+    prefix of a word is a key, prefixes that are not words map to 0. Each
+    run of Chinese characters is split along the most probable path through
+    the DAG of dictionary words it contains, so with no frequencies at all
+    it falls back to the segmentation with the fewest words.
+    """
+
+    def __init__(self, words=()):
+        self.freq = {}
+        self.total = 0
+        self.max_len = 1
+        for word, frequency in words:
+            self.add(word, frequency)
+
+    def __len__(self):
+        return sum(1 for f in self.freq.values() if f)
+
+    def __contains__(self, word):
+        return self.freq.get(word, 0) > 0
+
+    def add(self, word, frequency=0):
+        if not word:
+            return
+        count = max(frequency, 0) + 1
+        self.total += count - self.freq.get(word, 0)
+        self.freq[word] = count
+        for i in range(1, len(word)):
+            self.freq.setdefault(word[:i], 0)
+        self.max_len = max(self.max_len, len(word))
+
+    @classmethod
+    def from_db(cls):
+        from flashcards.models import Character, Word
+        words = []
+        for model in (Word, Character):
+            words.extend(model.objects.values_list('zi_simp', 'frequency').iterator())
+        return cls(words)
+
+    @classmethod
+    def from_lexicon(cls, lexicon):
+        return cls(lexicon.words())
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, encoding='utf-8') as f:
+            return cls(
+                (word, int(frequency))
+                for word, frequency in (l.rstrip('\n').split('\t') for l in f if l.strip())
+            )
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for word, count in self.freq.items():
+                if count:
+                    f.write('{}\t{}\n'.format(word, count - 1))
+
+    def cut_run(self, run):
+        n = len(run)
+        log_total = math.log(self.total or 1)
+        route = [(0.0, 0)] * (n + 1)
+        for i in range(n - 1, -1, -1):
+            best = None
+            j = i + 1
+            while j <= n and j - i <= self.max_len:
+                count = self.freq.get(run[i:j])
+                if count is None:
+                    break
+                if count or j == i + 1:
+                    score = math.log(count or 1) - log_total + route[j][0]
+                    if best is None or score > best[0]:
+                        best = (score, j)
+                j += 1
+            if best is None:
+                best = (-log_total + route[i + 1][0], i + 1)
+            route[i] = best
+        i = 0
+        while i < n:
+            j = route[i][1]
+            yield run[i:j]
+            i = j
+
+    def segment(self, text):
+        for run in CHINESE.findall(text):
+            yield from self.cut_run(run)
+
+    def segment_chunks(self, chunks, buffer_size=4096):
+        """
+        segments text arriving in chunks (e.g. a file or a response body)
+        holding back at most the unfinished run of Chinese characters
+        """
+        tail = ''
+        for chunk in chunks:
+            text = tail + chunk
+            runs = list(CHINESE.finditer(text))
+            tail = ''
+            if runs and runs[-1].end() == len(text):
+                tail = runs.pop().group()
+            for run in runs:
+                yield from self.cut_run(run.group())
+            if len(tail) > buffer_size:
+                # keep back only the words that could still grow
+                words = list(self.cut_run(tail))
+                held, size = [], 0
+                while words and size < self.max_len:
+                    held.insert(0, words.pop())
+                    size += len(held[0])
+                yield from words
+                tail = ''.join(held)
+        yield from self.cut_run(tail)
+
+
+_segmenter = None
+
+
+def get_segmenter():
+    """
+    the process-wide segmenter, loaded from FLASHCARDS_SEGMENTER_PATH or
+    the lexicon when either is there and built from the Word and Character
+    tables otherwise
+    """
+    global _segmenter
+    if _segmenter is None:
+        path = getattr(settings, 'FLASHCARDS_SEGMENTER_PATH', None)
+        lexicon = get_lexicon()
+        if path:
+            _segmenter = Segmenter.from_file(path)
+        elif lexicon is not None:
+            _segmenter = Segmenter.from_lexicon(lexicon)
+        else:
+            _segmenter = Segmenter.from_db()
+    return _segmenter
+
+
+def reset_segmenter():
+    global _segmenter
+    _segmenter = None
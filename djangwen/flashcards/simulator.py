@@ -0,0 +1,222 @@
+"""
+offline simulator of the scheduler: UserCard.known/unknown and
+UserDeck.shuffle re-implemented as array operations over learners x cards,
+so parameter sweeps run without the database
+"""
+import copy
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+PARAMETERS = ('multiplier', 'entry_interval', 'card_number', 'new_card_number')
+DEFAULTS = {'multiplier': 2, 'entry_interval': 5, 'card_number': 20, 'new_card_number': 10}
+
+
+class Learners():
+    """
+    the scheduling state of every card of every virtual learner, one row per
+    learner and one column per card in deck order, plus the hidden memory
+    model that decides their answers: a card is recalled with probability
+    exp(-days since last seen / stability), stability grows by growth on a
+    right answer and is halved on a wrong one, and a card seen for the first
+    time is already known with probability prior
+    """
+
+    def __init__(self, learners, cards, seed=0, prior=0.2, stability=1.0, growth=2.5):
+        self.rng = np.random.default_rng(seed)
+        shape = (learners, cards)
+        self.ease = np.ones(shape, dtype=np.int64)
+        self.priority = np.zeros(shape, dtype=bool)
+        self.learning = np.zeros(shape, dtype=bool)
+        self.to_study = np.ones(shape, dtype=bool)
+        # last is only meaningful where shown: days before the start are negative
+        self.shown = np.zeros(shape, dtype=bool)
+        self.last = np.zeros(shape, dtype=np.int64)
+        self.due = np.full(shape, np.inf)
+        self.last_intake = np.full(learners, -np.inf)
+        # cards come in in deck order, so only the first width columns
+        # can hold cards that have been seen or are learning
+        self.width = 0
+
+        self.prior = prior
+        self.growth = growth
+        # some learners and some cards are easier than others
+        skill = self.rng.lognormal(0, 0.3, size=(learners, 1))
+        easiness = self.rng.lognormal(0, 0.5, size=(1, cards))
+        self.stability = stability * skill * easiness
+
+    @classmethod
+    def from_user_cards(cls, rows, today, **kwargs):
+        """
+        starts from real decks: rows holds one list per deck of (ease,
+        priority, learning, to_study, days since last seen or None, days
+        until due or None), padded to the longest deck with unseen cards
+        """
+        cards = max(len(r) for r in rows)
+        learners = cls(len(rows), cards, **kwargs)
+        for i, deck in enumerate(rows):
+            for j, (ease, priority, learning, to_study, ago, due_in) in enumerate(deck):
+                learners.ease[i, j] = ease
+                learners.priority[i, j] = priority
+                learners.learning[i, j] = learning
+                learners.to_study[i, j] = to_study
+                if ago is not None:
+                    learners.shown[i, j] = True
+                    learners.last[i, j] = today - ago
+                if due_in is not None:
+                    learners.due[i, j] = today + due_in
+        learners.width = cards
+        return learners
+
+    @property
+    def seen(self):
+        return self.shown[:, :self.width]
+
+    def recall_probability(self, rows, cols, day):
+        """
+        the chance of recalling the cards at (rows, cols) on day
+        """
+        last = self.last[rows, cols]
+        seen = self.shown[rows, cols]
+        elapsed = np.where(seen, day - last, 0)
+        p = np.exp(-elapsed / self.stability[rows, cols])
+        return np.where(seen, p, self.prior)
+
+    def retention(self, day):
+        """
+        the mean chance each learner has of recalling the cards they have seen
+        """
+        rows, cols = np.nonzero(self.seen)
+        learners = self.ease.shape[0]
+        recalled = np.bincount(rows, self.recall_probability(rows, cols, day), minlength=learners)
+        return recalled / np.maximum(np.bincount(rows, minlength=learners), 1)
+
+    def shuffle(self, rows, day, params):
+        """
+        UserDeck.shuffle for the learners in rows, which have no card
+        learning; new cards only come in every entry_interval days
+        """
+        width = min(
+            self.ease.shape[1],
+            self.width + max(params['card_number'], params['new_card_number'])
+        )
+        seen = self.shown[rows, :width]
+        unseen = ~seen
+        learning = np.zeros_like(seen)
+        fresh = ~seen.any(axis=1)
+
+        # first session: the first card_number cards of the deck
+        learning[fresh] = take_first(unseen[fresh], params['card_number'])
+
+        old = ~fresh
+        if old.any():
+            to_study = self.to_study[rows[old], :width]
+            # the card_number seen cards due first, ties in deck order
+            r, c = np.nonzero(seen[old] & to_study)
+            order = np.lexsort((c, self.due[rows[old][r], c], r))
+            r, c = r[order], c[order]
+            rank = np.arange(len(r)) - np.searchsorted(r, r)
+            picked = np.zeros_like(to_study)
+            picked[r[rank < params['card_number']], c[rank < params['card_number']]] = True
+
+            intake = day - self.last_intake[rows[old]] >= params['entry_interval']
+            new = take_first(unseen[old] & to_study, params['new_card_number'])
+            new &= intake[:, None]
+            learning[old] = picked | new
+            self.last_intake[rows[old][new.any(axis=1)]] = day
+
+        self.last_intake[rows[fresh]] = day
+        self.learning[rows, :width] = learning
+        columns = np.nonzero(learning.any(axis=0))[0]
+        if len(columns):
+            self.width = max(self.width, columns[-1] + 1)
+
+    def answer(self, day, params):
+        """
+        one session: every learner answers all of their learning cards once;
+        returns how many cards each answered and how many they got right
+        """
+        rows, cols = np.nonzero(self.learning[:, :self.width])
+        right = self.rng.random(len(rows)) < self.recall_probability(rows, cols, day)
+        multiplier = params['multiplier']
+
+        # UserCard.known
+        r, c = rows[right], cols[right]
+        self.ease[r, c] *= multiplier
+        done = ~self.priority[r, c]
+        self.learning[r[done], c[done]] = False
+        self.priority[r, c] = False
+        self.stability[r, c] *= self.growth
+
+        # UserCard.unknown
+        r, c = rows[~right], cols[~right]
+        self.ease[r, c] = np.maximum(self.ease[r, c] // multiplier, 1)
+        self.priority[r, c] = True
+        self.stability[r, c] = np.maximum(self.stability[r, c] / 2, 1)
+
+        self.shown[rows, cols] = True
+        self.last[rows, cols] = day
+        self.due[rows, cols] = day + self.ease[rows, cols]
+        learners = self.ease.shape[0]
+        return np.bincount(rows, minlength=learners), np.bincount(rows[right], minlength=learners)
+
+
+def take_first(mask, n):
+    """
+    the first n True of each row of mask
+    """
+    return mask & (np.cumsum(mask, axis=1) <= n)
+
+
+def simulate(params=None, learners=1000, cards=2000, days=90, seed=0, state=None, **model):
+    """
+    runs one session a day for days days and returns the daily curves,
+    averaged over learners: cards reviewed, share answered right, expected
+    retention of the cards seen so far and number of cards seen
+    """
+    params = dict(DEFAULTS, **(params or {}))
+    if state is None:
+        state = Learners(learners, cards, seed=seed, **model)
+    else:
+        state = copy.deepcopy(state)
+    rows = np.arange(state.ease.shape[0])
+    curves = {'workload': [], 'accuracy': [], 'retention': [], 'seen': []}
+    for day in range(days):
+        idle = rows[~state.learning.any(axis=1)]
+        if len(idle):
+            state.shuffle(idle, day, params)
+        shown, right = state.answer(day, params)
+
+        curves['workload'].append(float(shown.mean()))
+        curves['accuracy'].append(float(right.sum() / max(shown.sum(), 1)))
+        curves['retention'].append(float(state.retention(day + 1).mean()))
+        curves['seen'].append(float(state.seen.sum(axis=1).mean()))
+    return {
+        'params': params,
+        'curves': curves,
+        'workload': float(np.mean(curves['workload'])),
+        'retention': curves['retention'][-1],
+        'seen': curves['seen'][-1],
+    }
+
+
+def _simulate(args):
+    params, kwargs = args
+    return simulate(params, **kwargs)
+
+
+def sweep(grid, jobs=1, **kwargs):
+    """
+    simulates every combination of the values in grid ({parameter: values})
+    across jobs processes, every run with the same learners and seed
+    """
+    names = [p for p in PARAMETERS if p in grid]
+    combinations = [
+        dict(zip(names, values))
+        for values in itertools.product(*(grid[p] for p in names))
+    ]
+    tasks = [(params, kwargs) for params in combinations]
+    if jobs <= 1:
+        return [_simulate(t) for t in tasks]
+    with ProcessPoolExecutor(jobs) as executor:
+        return list(executor.map(_simulate, tasks))
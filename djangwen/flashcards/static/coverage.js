@@ -0,0 +1,17 @@
+$(document).ready(function(){
+  var rows = $('tr[data-deck-id]');
+  if (rows.length === 0) {
+    return;
+  }
+  var ids = rows.map(function () { return $(this).data('deck-id'); }).get();
+  fetch($('#coverage-url').text() + '?decks=' + ids.join(','), {credentials: "same-origin"})
+    .then(response => response.json())
+    .then(coverage => {
+      rows.each(function () {
+        var deck = coverage.decks[$(this).data('deck-id')];
+        if (deck) {
+          $(this).find('.deck-coverage').text(deck.percent_known + '% (' + deck.new + ' new)');
+        }
+      });
+    });
+});
@@ -1,90 +1,151 @@
-function showDiv(data) {
-    $("#ele-" + data).show();
-    hideElement(exit_integer, data);
+var PAGE_SIZE = 20;
+var PREFETCH_AT = 5;
+var BATCH_SIZE = 5;
+
+var cards = [], counter = 0, total = 0;
+var next = null, loading = null;
+var run = Date.now().toString(36) + Math.random().toString(36).slice(2);
+var seq = 0, batch = {}, batchLength = 0;
+var sending = Promise.resolve();
+var pendingKey;
+
+function getCookie(name) {
+  var match = document.cookie.match(new RegExp('(^|;\\s*)' + name + '=([^;]*)'));
+  return match ? decodeURIComponent(match[2]) : null;
+}
+
+function loadPage(after) {
+  var url = new URL($('#session-url').text(), window.location.href);
+  url.searchParams.set('limit', PAGE_SIZE);
+  if (after) {
+    url.searchParams.set('after', after);
   }
+  loading = fetch(url, {credentials: "same-origin"})
+    .then(response => response.json())
+    .then(page => {
+      cards = cards.concat(page.cards);
+      total = total || page.total;
+      next = page.next;
+      loading = null;
+    });
+  return loading;
+}
+
+function showCard(i) {
+  var card = cards[i];
+  $("#card-progress").text(i + "/" + total);
+  $("#card-question-0").text(card.questions[0]);
+  $("#card-question-1").text(card.questions[1]);
+  var answers = $("#card-answers").empty();
+  card.answers.forEach(function (a) {
+    answers.append($("<li>").text(a));
+  });
+  $("#card-answer").hide();
+  $("#card").show();
+}
 
-  function hideElement(total, active) {
-    for (i = 0; i <= total; i++) {
-      if (i != active)
-        $("#ele-" + i).hide();
+// answered batches stay in localStorage until the server acknowledges
+// them, so a closed tab or a lost connection only delays them
+function getPending() {
+  return JSON.parse(localStorage.getItem(pendingKey) || '[]');
+}
+
+function setPending(batches) {
+  localStorage.setItem(pendingKey, JSON.stringify(batches));
+}
+
+function postBatch(b, keepalive) {
+  return fetch($('#redirect-url').text(), {
+    method: "POST",
+    keepalive: keepalive,
+    credentials: "same-origin",
+    headers: {
+      'Accept': 'application/json',
+      'Content-Type': 'application/json',
+      'X-CSRFToken': getCookie('csrftoken')
+    },
+    body: JSON.stringify(b)
+  })
+  .then(response => {
+    if (!response.ok) {
+      throw new Error(response.status + " url: " + $('#redirect-url').text());
     }
+    return response.json();
+  })
+  .then(ack => {
+    setPending(getPending().filter(p => !(p.run === b.run && p.seq === ack.seq)));
+  });
+}
+
+function sendOutcomes(keepalive) {
+  if (batchLength > 0) {
+    seq++;
+    setPending(getPending().concat([{run: run, seq: seq, outcomes: batch}]));
+    batch = {};
+    batchLength = 0;
+  }
+  if (keepalive) {
+    // the page is going away: no time to wait for earlier posts
+    getPending().forEach(b => postBatch(b, true).catch(() => {}));
+    return sending;
   }
+  sending = sending.then(() => getPending().reduce(
+    (chain, b) => chain.then(() => postBatch(b, false)), Promise.resolve()
+  )).catch(err => console.info(err));
+  return sending;
+}
 
-  function hideAnswers(total, active) {
-    for (i = 0; i <= total; i++) {
-      if (i != active)
-        $("#card-answer-" + i).hide();
+function advance() {
+  if (counter < cards.length) {
+    showCard(counter);
+    if (next && !loading && cards.length - counter <= PREFETCH_AT) {
+      loadPage(next);
     }
-    $("div[id*='card-answer']").each(function (i, el) {
-         $('#'+el.id).hide()
-     });
+  } else if (loading) {
+    loading.then(advance);
+  } else if (next) {
+    loadPage(next).then(advance);
+  } else {
+    $("#card").hide();
+    sendOutcomes(false).then(() => {
+      window.location.href = $('#done-url').text();
+    });
   }
+}
 
-  $(document).ready(function(){
-    showDiv(counter);
-});
-
-var dict, exit_integer;
-window.addEventListener("load", function(){
-  dict = {"deck_id": $('#deck-id').text()}
-  exit_integer = parseInt(
-    $("#exit-integer").text()
-  )
-  console.log(exit_integer)
+$(document).ready(function(){
+  pendingKey = 'flash-outcomes:' + $('#redirect-url').text();
+  sendOutcomes(false);
+  loadPage(null).then(() => {
+    if (cards.length === 0) {
+      window.location.href = $('#done-url').text();
+    } else {
+      advance();
+    }
+  });
 });
 
-var counter = 0
-var shown = false
 document.addEventListener("keypress", function onPress(event) {
-  console.log(counter)
-  if (event.key === "z") {
-      id = $("#card-id-" + counter).text()
-      counter++;
-      dict[counter] = {id: id, result: 'z'}
-      console.log(dict);
-      $('#card-answer-' + counter).hide();
-      showDiv(counter);
-  } else if (event.key === "x") {
-      id = $("#card-id-" + counter).text()
-      counter++;
-      dict[counter] = {id: id, result: 'x'}
-      console.log(dict);
-      $('#card-answer-'+counter).hide();
-      showDiv(counter);
-  } else if (event.key === "s") {
-      $('#card-answer-'+counter).show()
+  if (counter >= cards.length) {
+    return;
   }
-  if (counter === exit_integer) {
-    fetch(
-      $('#redirect-url').text(), {
-      method: "POST",
-      headers: {
-        'Accept': 'application/json',
-        'Content-Type': 'application/json'
-      },
-      body: JSON.stringify(dict)
-    }).then(response => {
-        if (response.redirected) {
-            window.location.href = response.url;
-        }
-    })
-    .catch(function(err) {
-        console.info(err + " url: " + url);
-    });
+  if (event.key === "z" || event.key === "x") {
+    batchLength++;
+    batch[batchLength] = {id: cards[counter].id, result: event.key};
+    counter++;
+    if (batchLength >= BATCH_SIZE) {
+      sendOutcomes(false);
+    }
+    advance();
+  } else if (event.key === "s") {
+    $('#card-answer').show();
   }
 });
 
+window.addEventListener("online", function() {
+  sendOutcomes(false);
+});
 
-
-window.onbeforeunload = function() {
-  fetch(
-    $('#redirect-url').text(), {
-      method: "POST",
-      headers: {
-        'Accept': 'application/json',
-        'Content-Type': 'application/json'
-      },
-      body: JSON.stringify(dict)
-    })
-return;
-}
+window.addEventListener("pagehide", function() {
+  sendOutcomes(true);
+});
@@ -1,9 +1,48 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from unittest import skipIf
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection, connections, transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from . import benchmark, bitsets, jobs, metrics, reviews
+from .backends.sqlite3.base import DatabaseWrapper
+from .caching import set_user_deck_session
+from .frequency import count_frequencies
+from .lexicon import Lexicon, get_lexicon, reset_lexicon
+try:
+    import numpy as np
+    from . import simulator
+except ImportError:
+    simulator = None
+from .routers import ReadReplicaRouter
+from .scraper import ConnectionPool, Scraper, scrape
+from .segmenter import Segmenter, get_segmenter, reset_segmenter
 from .models import(
     User,
     UserCard,
+    ArticleDeck,
     Card,
+    CardFace,
+    ClipDeck,
+    Deck,
+    Job,
+    ReviewEvent,
+    SearchTerm,
     UserDeck,
+    UserVocabulary,
+    Word,
 )
 
 
@@ -66,3 +105,1219 @@ class UserDeckTests(TestCase):
         self.assertEqual(len(ud.seen_cards), 0)
         self.assertEqual(len(ud.unseen_cards), 1)
         self.assertEqual(len(ud.learning_cards), 0)
+
+
+def make_user_deck(n, username='learner'):
+    u = User(username=username)
+    u.save()
+    ud = UserDeck(user=u)
+    ud.save()
+    for i in range(n):
+        c = Card()
+        c.save()
+        uc = UserCard(user=u, card=c)
+        uc.save()
+        ud.cards.add(uc)
+    return ud
+
+
+class HSKTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('populate', stdout=StringIO())
+
+    def setUp(self):
+        cache.clear()
+
+
+class ShuffleTests(TestCase):
+
+    def test_known_schedules_due_date(self):
+        ud = make_user_deck(1)
+        uc = ud.cards.get()
+        uc.known(2)
+        self.assertEqual(uc.ease, 2)
+        self.assertEqual(uc.due_at, uc.last_time + timedelta(days=2))
+        uc.unknown(2)
+        self.assertEqual(uc.due_at, uc.last_time + timedelta(days=1))
+
+    def test_first_shuffle_persists_learning(self):
+        ud = make_user_deck(30)
+        ud.shuffle()
+        self.assertEqual(ud.cards.filter(learning=True).count(), 20)
+
+    def test_shuffle_picks_due_and_new_cards(self):
+        ud = make_user_deck(40)
+        ud.card_number = 5
+        ud.new_card_number = 3
+        now = timezone.now()
+        seen = list(ud.cards.order_by('id')[:10])
+        for i, uc in enumerate(seen):
+            uc.last_time = now
+            uc.due_at = now + timedelta(days=i)
+            uc.learning = True
+            uc.save()
+
+        with self.assertNumQueries(10):
+            ud.shuffle()
+
+        learning = set(ud.cards.filter(learning=True).values_list('id', flat=True))
+        unseen = ud.cards.filter(last_time__isnull=True).order_by('id')
+        expected = {uc.id for uc in seen[:5]}
+        expected |= set(unseen.values_list('id', flat=True)[:3])
+        self.assertEqual(learning, expected)
+
+    def test_shuffle_keeps_priority_cards(self):
+        ud = make_user_deck(3)
+        ud.card_number = 1
+        ud.new_card_number = 0
+        cards = list(ud.cards.order_by('id'))
+        for uc in cards:
+            uc.learning = True
+            uc.unknown(ud.multiplier)
+            uc.save()
+        cards[0].known(ud.multiplier)
+        cards[0].known(ud.multiplier)
+        cards[0].save()
+        ud.shuffle()
+        self.assertFalse(ud.cards.get(id=cards[0].id).learning)
+        self.assertTrue(ud.cards.get(id=cards[2].id).learning)
+
+
+class OutcomeTests(TestCase):
+
+    def outcomes(self, ids, result):
+        outcomes = {'deck_id': '1'}
+        for i, card_id in enumerate(ids):
+            outcomes[str(i + 1)] = {'id': str(card_id), 'result': result}
+        return outcomes
+
+    def test_play_outcomes_in_constant_queries(self):
+        ud = make_user_deck(50)
+        ids = list(ud.cards.values_list('id', flat=True))
+        with self.assertNumQueries(10):
+            ud.play_outcomes(self.outcomes(ids, 'z'))
+        self.assertEqual(ud.cards.filter(ease=2, due_at__isnull=False).count(), 50)
+
+    def test_unknown_outcome(self):
+        ud = make_user_deck(2)
+        ids = list(ud.cards.values_list('id', flat=True))
+        ud.play_outcomes(self.outcomes(ids, 'x'))
+        self.assertEqual(ud.cards.filter(priority=True).count(), 2)
+
+    def test_process_sort(self):
+        ud = make_user_deck(2)
+        first, second = ud.cards.values_list('id', flat=True)
+        outcomes = self.outcomes([first], 'z')
+        outcomes['2'] = {'id': str(second), 'result': 'x'}
+        ud.process_sort(outcomes)
+        self.assertFalse(ud.cards.get(id=first).to_study)
+        self.assertTrue(ud.cards.get(id=second).to_study)
+        self.assertEqual(ud.cards.filter(sorted=True).count(), 2)
+
+    def test_rejects_cards_from_other_decks(self):
+        ud = make_user_deck(1)
+        other = make_user_deck(1, username='other')
+        ids = list(other.cards.values_list('id', flat=True))
+        with self.assertRaises(ValueError):
+            ud.play_outcomes(self.outcomes(ids, 'z'))
+        self.assertIsNone(other.cards.get().last_time)
+
+    def test_outcomes_view(self):
+        ud = make_user_deck(3)
+        ids = list(ud.cards.values_list('id', flat=True))
+        self.client.force_login(ud.user)
+        response = self.client.post(
+            '/user-decks/{}/outcomes'.format(ud.id),
+            json.dumps(self.outcomes(ids, 'z')),
+            content_type='application/json'
+        )
+        self.assertEqual(response.json(), {'cards': 3})
+        response = self.client.post(
+            '/user-decks/{}/outcomes'.format(ud.id),
+            'not json',
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class PopulateTests(TestCase):
+
+    def write_hsk(self, directory, hsk, lines):
+        path = os.path.join(directory, 'HSK{}.txt'.format(hsk))
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join('\t'.join(l) for l in lines))
+
+    def test_populate_all_hsk_files(self):
+        out = StringIO()
+        start = time.monotonic()
+        call_command('populate', stdout=out)
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertEqual(Deck.objects.count(), 6)
+        self.assertEqual(Word.objects.count(), 5001)
+        hsk1 = Deck.objects.get(name='HSK 1')
+        self.assertEqual(hsk1.cards.count(), 150)
+        w = Word.objects.get(zi_simp='你', hsk=1)
+        self.assertEqual(w.pinyin_tone, 'nǐ')
+        self.assertEqual(w.get_answers(), ('nǐ', 'you (singular)'))
+
+        call_command('populate', stdout=out)
+        self.assertIn('HSK decks already exist', out.getvalue())
+
+    def test_upsert(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.write_hsk(directory, 1, [
+                ('你', '你', 'ni3', 'nǐ', 'you'),
+                ('好', '好', 'hao3', 'hǎo', 'good'),
+            ])
+            call_command('populate', path=directory, stdout=StringIO())
+            self.write_hsk(directory, 1, [
+                ('你', '你', 'ni3', 'nǐ', 'you (singular)'),
+                ('好', '好', 'hao3', 'hǎo', 'good'),
+                ('我', '我', 'wo3', 'wǒ', 'I; me'),
+            ])
+            call_command(
+                'populate', path=directory, upsert=True, jobs=2,
+                stdout=StringIO()
+            )
+        deck = Deck.objects.get(name='HSK 1')
+        self.assertEqual(Deck.objects.count(), 1)
+        self.assertEqual(deck.cards.count(), 3)
+        self.assertEqual(Word.objects.get(zi_simp='你').english, 'you (singular)')
+
+
+class CloneDeckTests(HSKTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User(username='learner')
+        self.user.save()
+
+    def test_populate_in_constant_queries(self):
+        deck = Deck.objects.get(name='HSK 6')
+        ud = UserDeck(user=self.user)
+        with self.assertNumQueries(7):
+            ud.populate(deck)
+        self.assertEqual(ud.name, 'HSK 6')
+        self.assertEqual(ud.cards.count(), 2500)
+        uc = ud.cards.first()
+        self.assertEqual((uc.ease, uc.to_study, uc.learning), (1, True, False))
+        self.assertEqual(uc.user, self.user)
+
+    def test_skips_owned_cards(self):
+        deck = Deck.objects.get(name='HSK 1')
+        for c in deck.cards.order_by('id')[:5]:
+            UserCard(user=self.user, card=c, ease=4).save()
+        ud = UserDeck(user=self.user)
+        ud.populate(deck)
+        self.assertEqual(UserCard.objects.filter(user=self.user).count(), 150)
+        self.assertEqual(ud.cards.count(), 150)
+        self.assertEqual(ud.cards.filter(ease=4).count(), 5)
+
+    def test_incremental_populate(self):
+        deck = Deck.objects.get(name='HSK 1')
+        ud = UserDeck(user=self.user)
+        ud.populate(deck)
+        deck.cards.add(*Deck.objects.get(name='HSK 2').cards.all()[:3])
+        ud.populate()
+        ud.populate()
+        self.assertEqual(ud.cards.count(), 153)
+
+    def test_several_decks(self):
+        hsk1 = UserDeck(user=self.user)
+        hsk1.populate(Deck.objects.get(name='HSK 1'))
+        hsk2 = UserDeck(user=self.user)
+        hsk2.populate(Deck.objects.get(name='HSK 2'))
+        self.assertEqual(self.user.userdeck_set.count(), 2)
+        self.assertEqual(hsk1.cards.count(), 150)
+        self.assertEqual(hsk2.cards.count(), hsk2.deck.cards.count())
+
+        # a card belongs to one deck of its user
+        overlap = UserDeck(user=self.user)
+        overlap.populate(Deck.objects.get(name='HSK 1'))
+        self.assertEqual(overlap.cards.count(), 0)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            UserCard.objects.create(user=self.user, card=hsk1.cards.first().card)
+
+
+class StatsTests(TestCase):
+
+    def test_stats_in_one_query(self):
+        ud = make_user_deck(6)
+        cards = list(ud.cards.order_by('id'))
+        cards[0].to_study = False
+        cards[0].last_time = timezone.now()
+        cards[1].to_study = False
+        cards[2].learning = True
+        cards[3].sorted = True
+        UserCard.objects.bulk_update(cards, ['to_study', 'last_time', 'learning', 'sorted'])
+        with self.assertNumQueries(1):
+            stats = ud.get_stats()
+        self.assertEqual(stats, {
+            'total': 6, 'seen': 1, 'to_study': 4, 'learning': 1, 'unsorted': 5
+        })
+        self.assertEqual(ud.card_total, 6)
+        self.assertEqual(ud.seen_total, 1)
+        self.assertEqual(ud.to_study_total, 4)
+
+    def test_counters_follow_reviews(self):
+        ud = make_user_deck(30)
+        ud.shuffle()
+        ud = UserDeck.objects.get(id=ud.id)
+        self.assertEqual((ud.total_count, ud.learning_count), (30, 20))
+        outcomes = {'1': {'id': ud.cards.filter(learning=True).first().id, 'result': 'z'}}
+        ud.process_sort(outcomes)
+        ud = UserDeck.objects.get(id=ud.id)
+        self.assertEqual((ud.to_study_count, ud.unsorted_count), (29, 29))
+
+        # answers move the counters without counting the deck again
+        ids = list(ud.cards.filter(learning=True).order_by('id').values_list('id', flat=True))
+        with CaptureQueriesContext(connection) as queries:
+            ud.play_outcomes({
+                str(i + 1): {'id': card_id, 'result': 'zx'[i % 2]} for i, card_id in enumerate(ids)
+            })
+        self.assertFalse([q for q in queries if 'COUNT(' in q['sql']])
+        stats = ud.get_stats()
+        ud = UserDeck.objects.get(id=ud.id)
+        self.assertEqual(
+            {name: getattr(ud, '{}_count'.format(name)) for name in stats}, stats
+        )
+
+
+class CatalogueTests(HSKTestCase):
+
+    def setUp(self):
+        super().setUp()
+        ArticleDeck(name='News', url='https://example.com/news').save()
+        ClipDeck(name='Clip', text='你好').save()
+
+    def test_get_all_json(self):
+        decks = Deck.get_all_json()
+        self.assertEqual(sorted(decks), ['article', 'clip', 'deck'])
+        self.assertEqual(len(decks['deck']), 6)
+        self.assertEqual(decks['deck'][0]['card_count'], 150)
+        self.assertEqual(decks['article'][0]['url'], 'https://example.com/news')
+
+    def test_deck_list_counts_in_one_query(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/')
+        self.assertContains(response, '<td>2500</td>')
+        with self.assertNumQueries(1):
+            self.client.get('/')
+
+    def test_deck_list_etag_follows_login(self):
+        response = self.client.get('/')
+        self.assertNotContains(response, 'Known')
+        self.assertFalse(response.has_header('Last-Modified'))
+        etag = response['ETag']
+        self.assertEqual(self.client.get('/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.client.force_login(User.objects.create(username='known'))
+        response = self.client.get('/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Known')
+
+    def test_catalogue_is_cached_until_decks_change(self):
+        response = self.client.get('/decks.json')
+        self.assertEqual(len(response.json()['deck']), 6)
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get('/decks.json')
+            self.client.get('/decks.json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response['ETag'], etag)
+        response = self.client.get('/decks.json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        Deck.objects.get(name='HSK 1').cards.add(Card.objects.create())
+        response = self.client.get('/decks.json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        counts = {d['name']: d['card_count'] for d in response.json()['deck']}
+        self.assertEqual(counts['HSK 1'], 151)
+
+
+class DeckWordsTests(HSKTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.deck = Deck.objects.get(name='HSK 6')
+        self.url = '/deck-words/{}'.format(self.deck.id)
+
+    @override_settings(CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+    })
+    def test_keyset_pages(self):
+        response = self.client.get(self.url)
+        words = response.context['word_list']
+        self.assertEqual(len(words), 100)
+        cursor = response.context['next_cursor']
+        response = self.client.get(self.url, {'after': cursor})
+        next_words = response.context['word_list']
+        self.assertEqual(next_words[0].id, words[-1].id + 1)
+        self.assertEqual(self.client.get(self.url, {'after': 'x'}).status_code, 404)
+
+        seen = 0
+        cursor = ''
+        while cursor is not None:
+            response = self.client.get(self.url, {'after': cursor})
+            seen += len(response.context['word_list'])
+            cursor = response.context.get('next_cursor')
+        self.assertEqual(seen, 2500)
+
+    def test_pages_cached_until_membership_changes(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertContains(response, 'Next')
+
+        w = Word.objects.filter(deck=self.deck).order_by('id').first()
+        w.english = 'changed'
+        w.save()
+        self.assertContains(self.client.get(self.url), 'changed')
+
+        self.deck.cards.remove(w)
+        self.assertNotContains(self.client.get(self.url), 'changed')
+
+    def test_pages_follow_counted_frequencies(self):
+        deck = Deck.objects.get(name='HSK 1')
+        url = '/deck-words/{}'.format(deck.id)
+        first = self.client.get(url).context['word_list'][0]
+        word = Word.objects.filter(deck=deck).exclude(id=first.id).order_by('-id').first()
+        ClipDeck(name='Clip', text=word.zi_simp * 3).save()
+        count_frequencies()
+        response = self.client.get(url)
+        self.assertEqual(response.context['word_list'][0].id, word.id)
+
+
+class CardFaceTests(TestCase):
+
+    def test_face_follows_saves(self):
+        w = Word(zi_simp='你', zi_trad='你', pinyin_number='ni3', english='you')
+        w.save()
+        self.assertEqual(w.face.kind, 'word')
+        self.assertEqual(w.face.answers, ['ni3', 'you'])
+        w.pinyin_tone = 'nǐ'
+        w.save()
+        self.assertEqual(CardFace.objects.get(card=w).answers, ['nǐ', 'you'])
+
+    def test_bulk_loads_build_faces(self):
+        call_command('populate', stdout=StringIO())
+        self.assertEqual(CardFace.objects.count(), Word.objects.count())
+        face = Word.objects.get(zi_simp='我', hsk=1).face
+        self.assertEqual(face.questions, ['我', '我'])
+
+    def test_flash_cards_in_one_join(self):
+        call_command('populate', stdout=StringIO())
+        user = User(username='learner')
+        user.save()
+        ud = UserDeck(user=user)
+        ud.populate(Deck.objects.get(name='HSK 1'))
+        ud.shuffle()
+        with self.assertNumQueries(2):
+            cards = ud.get_flash_cards()
+        self.assertEqual(len(cards), 20)
+        self.assertEqual(cards[0]['i'], 0)
+        self.assertEqual(cards[0]['questions'], ['的', '的'])
+        self.assertEqual(cards[0]['kind'], 'word')
+        uc = ud.cards.get(id=cards[0]['id'])
+        self.assertEqual(uc.get_answers(), cards[0]['answers'])
+
+
+class SessionTests(HSKTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User(username='learner')
+        self.user.save()
+        self.ud = UserDeck(user=self.user)
+        self.ud.populate(Deck.objects.get(name='HSK 1'))
+        self.url = '/user-decks/{}/session.json'.format(self.ud.id)
+        self.client.force_login(self.user)
+
+    def test_session_payload_is_cached_until_outcomes(self):
+        session = self.client.get(self.url).json()
+        self.assertEqual(len(session['cards']), 20)
+        self.assertEqual(session['cards'][0]['questions'], ['的', '的'])
+
+        # session and user lookups of the login only
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url)
+        self.assertEqual(response.json(), session)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        card = session['cards'][0]
+        self.client.post(
+            '/user-decks/{}/outcomes'.format(self.ud.id),
+            json.dumps({'1': {'id': card['id'], 'result': 'z'}}),
+            content_type='application/json'
+        )
+        response = self.client.get(self.url)
+        self.assertEqual(response.json()['session'], session['session'] + 1)
+        self.assertEqual(len(response.json()['cards']), 19)
+
+    def test_sort_session_and_gzip(self):
+        response = self.client.get(self.url, {'sort': '1'}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        session = json.loads(gzip.decompress(response.content))
+        self.assertTrue(session['sorting'])
+        self.assertEqual((len(session['cards']), session['total']), (50, 150))
+
+    def test_cursor_pages(self):
+        ids, after = [], ''
+        while after is not None:
+            page = self.client.get(self.url, {'sort': '1', 'limit': 40, 'after': after}).json()
+            ids.extend(c['id'] for c in page['cards'])
+            after = page['next']
+        self.assertEqual(len(ids), 150)
+        self.assertEqual(ids, sorted(set(ids)))
+
+    def test_outcome_batches_are_idempotent(self):
+        cards = self.client.get(self.url, {'limit': 2}).json()['cards']
+        batch = json.dumps({'run': 'abc', 'seq': 1, 'outcomes': {
+            str(i + 1): {'id': c['id'], 'result': 'z'} for i, c in enumerate(cards)
+        }})
+        url = '/user-decks/{}/outcomes'.format(self.ud.id)
+        for _ in range(2):
+            response = self.client.post(url, batch, content_type='application/json')
+            self.assertEqual(response.json(), {'cards': 2, 'seq': 1})
+        self.assertEqual(ReviewEvent.objects.count(), 2)
+        self.assertEqual(UserCard.objects.get(id=cards[0]['id']).ease, 2)
+
+    def test_other_users_get_404(self):
+        other = User(username='other')
+        other.save()
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_play_page(self):
+        response = self.client.get('/user-decks/{}/play'.format(self.ud.id))
+        self.assertContains(response, self.url)
+        self.assertNotContains(response, '的')
+
+
+class SegmenterTests(TestCase):
+
+    def setUp(self):
+        self.segmenter = Segmenter([
+            ('我们', 0), ('中国', 0), ('中国人', 0), ('人', 0), ('是', 0),
+            ('研究', 0), ('研究生', 0), ('生命', 0), ('起源', 0),
+        ])
+
+    def test_fewest_words_without_frequencies(self):
+        words = list(self.segmenter.segment('我们是中国人。'))
+        self.assertEqual(words, ['我们', '是', '中国人'])
+
+    def test_frequencies_pick_the_path(self):
+        self.assertEqual(len(list(self.segmenter.segment('研究生命起源'))), 3)
+        self.segmenter.add('生命', 100)
+        self.segmenter.add('研究', 100)
+        self.assertEqual(
+            list(self.segmenter.segment('研究生命起源')),
+            ['研究', '生命', '起源']
+        )
+
+    def test_chunks_do_not_split_words(self):
+        text = '我们是中国人' * 1000
+        chunks = [text[i:i + 7] for i in range(0, len(text), 7)]
+        words = Counter(self.segmenter.segment_chunks(chunks, buffer_size=16))
+        self.assertEqual(words, {'我们': 1000, '是': 1000, '中国人': 1000})
+
+    def test_scraper_counts_words_from_db(self):
+        call_command('populate', stdout=StringIO())
+        reset_segmenter()
+        scraper = Scraper()
+        scraper.count_words('我们是中国人, 我们爱中国。')
+        self.assertEqual(scraper.words['我们'], 2)
+        self.assertEqual(scraper.words['中国'], 2)
+        self.assertEqual(scraper.words['人'], 1)
+        reset_segmenter()
+
+    def test_build_from_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'segmenter.tsv')
+            self.segmenter.save(path)
+            segmenter = Segmenter.from_file(path)
+        self.assertEqual(len(segmenter), 9)
+        self.assertIn('研究生', segmenter)
+        self.assertNotIn('研', segmenter)
+
+
+ARTICLES = {
+    '/a': '<html><head><title>我们</title><script>var 中国 = 1;</script></head>'
+          '<body><p>我们是中国人。</p><p>我们爱中国。</p></body></html>',
+    '/b': '<html><head><title>你好</title></head><body>你好！你好吗？</body></html>',
+    '/bogus': '<html><head><title>中国</title></head><body>中国</body></html>',
+}
+CHARSETS = {'/bogus': 'x-bogus'}
+
+
+class ArticleHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    ports = set()
+
+    def do_GET(self):
+        self.ports.add(self.client_address[1])
+        body = ARTICLES.get(self.path)
+        if body is None:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset={}'.format(
+            CHARSETS.get(self.path, 'utf-8')
+        ))
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ArticleImportTests(HSKTestCase):
+
+    def setUp(self):
+        super().setUp()
+        reset_segmenter()
+        ArticleHandler.ports = set()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), ArticleHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base = 'http://127.0.0.1:{}'.format(self.server.server_port)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        reset_segmenter()
+
+    def test_scrape_with_one_pooled_connection(self):
+        urls = [self.base + '/a', self.base + '/b', self.base + '/missing'] * 3
+        scrapers, errors = scrape(urls, concurrency=4, per_host=1)
+        self.assertEqual(len(ArticleHandler.ports), 1)
+        self.assertEqual(list(errors), [self.base + '/missing'])
+        a = next(s for s in scrapers if s.url.endswith('/a'))
+        self.assertEqual(a.title, '我们')
+        self.assertEqual(a.words['我们'], 2)
+        self.assertNotIn('var', a.text)
+
+    def test_public_only_and_size_limit(self):
+        scrapers, errors = scrape([self.base + '/a'], public_only=True)
+        self.assertEqual(scrapers, [])
+        self.assertIn('not a public address', errors[self.base + '/a'])
+        with self.assertRaisesRegex(ValueError, 'larger than'):
+            ConnectionPool(max_bytes=10).fetch(self.base + '/a')
+        with self.assertRaisesRegex(ValueError, 'not an http'):
+            ConnectionPool().fetch('file:///etc/passwd')
+
+    def test_unknown_charset_read_as_utf8(self):
+        scrapers, errors = scrape([self.base + '/bogus', self.base + '/b'])
+        self.assertEqual(errors, {})
+        self.assertEqual({s.title for s in scrapers}, {'中国', '你好'})
+
+    def test_import_articles(self):
+        ni3 = Word.objects.get(zi_simp='你')
+        call_command(
+            'import_articles', self.base + '/a', self.base + '/b', stdout=StringIO()
+        )
+        decks = {d.name: d for d in ArticleDeck.objects.all()}
+        self.assertEqual(sorted(decks), ['你好', '我们'])
+        self.assertTrue(all(d.counted for d in decks.values()))
+        self.assertIn(ni3, Word.objects.filter(deck=decks['你好']))
+        self.assertEqual(Card.objects.get(id=ni3.id).frequency, 2)
+
+        call_command('import_articles', self.base + '/b', stdout=StringIO())
+        self.assertEqual(ArticleDeck.objects.count(), 2)
+        self.assertEqual(Card.objects.get(id=ni3.id).frequency, 2)
+        self.assertEqual(decks['你好'].cards.count(), 3)
+
+
+class FrequencyTests(HSKTestCase):
+
+    def setUp(self):
+        super().setUp()
+        reset_segmenter()
+        for i in range(5):
+            ClipDeck(name='Clip {}'.format(i), text='我们爱中国。你好吗？' * (i + 1)).save()
+
+    def tearDown(self):
+        reset_segmenter()
+
+    def frequency(self, zi_simp):
+        return Word.objects.get(zi_simp=zi_simp, hsk=1).frequency
+
+    def test_counts_each_text_once(self):
+        self.assertEqual(count_frequencies(batch_size=2), 5)
+        self.assertEqual(self.frequency('我们'), 15)
+        self.assertEqual(self.frequency('中国'), 15)
+        self.assertFalse(ClipDeck.objects.filter(counted=False).exists())
+
+        self.assertEqual(count_frequencies(), 0)
+        ClipDeck(name='More', text='我们').save()
+        out = StringIO()
+        call_command('count_frequencies', stdout=out)
+        self.assertIn('1 decks counted', out.getvalue())
+        self.assertEqual(self.frequency('我们'), 16)
+
+    def test_counts_in_worker_processes(self):
+        self.assertEqual(count_frequencies(jobs=2, shard_size=1), 5)
+        self.assertEqual(self.frequency('吗'), 15)
+
+
+class JobTests(HSKTestCase):
+
+    def setUp(self):
+        super().setUp()
+        reset_segmenter()
+        self.client.force_login(User.objects.create(username='jobs'))
+
+    def tearDown(self):
+        reset_segmenter()
+
+    def test_deck_processed_in_background(self):
+        response = self.client.post(
+            '/decks/new', json.dumps({'name': 'Clip', 'text': '我们爱中国。你好吗？'}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 202)
+        deck = ClipDeck.objects.get(id=response.json()['id'])
+        self.assertEqual(deck.status, 'queued')
+        self.assertEqual(deck.cards.count(), 0)
+        self.assertEqual(self.client.get(response.json()['status_url']).json()['status'], 'queued')
+
+        out = StringIO()
+        call_command('run_jobs', '--once', stdout=out)
+        self.assertIn('1 jobs done', out.getvalue())
+        deck.refresh_from_db()
+        self.assertEqual((deck.status, deck.counted), ('ready', True))
+        self.assertIn(Word.objects.get(zi_simp='中国', hsk=1), Word.objects.filter(deck=deck))
+        self.assertEqual(Word.objects.get(zi_simp='我们', hsk=1).frequency, 1)
+        status = self.client.get('/decks/{}/status.json'.format(deck.id)).json()
+        self.assertEqual((status['status'], status['job']['status']), ('ready', 'done'))
+
+        # running it again links nothing new and counts nothing twice
+        cards = deck.cards.count()
+        jobs.enqueue('clipdeck', deck)
+        self.assertEqual(jobs.run_worker(once=True), {'done': 1})
+        self.assertEqual(deck.cards.count(), cards)
+        self.assertEqual(Word.objects.get(zi_simp='我们', hsk=1).frequency, 1)
+
+    def test_article_job_refreshes_its_own_deck(self):
+        url = 'https://example.com/news'
+        first = ArticleDeck(type='article', name=url, url=url)
+        first.save()
+        second = ArticleDeck(type='article', name=url, url=url)
+        second.save()
+        scraper = Scraper(url).process_page(ARTICLES['/b'])
+        ArticleDeck.save_scrapers([scraper], decks=[second])
+        second.refresh_from_db()
+        first.refresh_from_db()
+        self.assertEqual((second.name, second.cards.count()), ('你好', 3))
+        self.assertEqual((first.name, first.text, first.cards.count()), (url, '', 0))
+
+    def test_rejects_private_urls(self):
+        for url in (
+            'ftp://example.com/a', 'http://127.0.0.1/a', 'http://localhost:8000/',
+            'http://169.254.169.254/latest/meta-data', 'http://10.0.0.1/', 'http://[::1]/',
+        ):
+            response = self.client.post(
+                '/decks/new', json.dumps({'url': url}), content_type='application/json'
+            )
+            self.assertEqual(response.status_code, 400, url)
+        self.assertFalse(ArticleDeck.objects.exists())
+
+    @override_settings(FLASHCARDS_JOB_RETRY_SECONDS=0)
+    def test_retries_then_fails(self):
+        deck = ArticleDeck(type='article', name='Gone', url='http://127.0.0.1:1/gone')
+        deck.save()
+        self.assertEqual(jobs.run_worker(once=True), {'queued': 2, 'failed': 1})
+        job = Job.objects.get(deck=deck)
+        self.assertEqual((job.status, job.attempts), ('failed', 3))
+        self.assertIn('JobError', job.error)
+        deck.refresh_from_db()
+        self.assertEqual((deck.status, deck.counted), ('failed', False))
+
+    def test_claimed_once(self):
+        ClipDeck(type='clip', name='Clip', text='你好').save()
+        self.assertEqual(len(jobs.claim('a', 10)), 1)
+        self.assertEqual(jobs.claim('b', 10), [])
+        # a worker that died leaves its job to the others
+        Job.objects.update(started_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(jobs.release_stale(timedelta(minutes=30)), 1)
+        self.assertEqual(jobs.claim('b', 10)[0].attempts, 2)
+
+
+class SearchTests(HSKTestCase):
+
+    def search(self, query, **kwargs):
+        return [tuple(f.questions) for f in SearchTerm.search(query, **kwargs)]
+
+    def test_pinyin_with_and_without_tones(self):
+        for query in ('ni3', 'nǐ', 'ni', 'NI3'):
+            self.assertIn(('你', '你'), self.search(query, limit=100), query)
+        self.assertIn(('中国', '中國'), self.search('zhong1 guo2'))
+        self.assertIn(('中国', '中國'), self.search('Zhōngguó'))
+        self.assertNotIn(('你', '你'), self.search('ni2', limit=100))
+
+    def test_hanzi_substring_and_english(self):
+        self.assertEqual(self.search('中国')[0], ('中国', '中國'))
+        self.assertIn(('中国', '中國'), self.search('國'))
+        self.assertIn(('我', '我'), self.search('me', limit=100))
+        self.assertEqual(self.search('xyzzy'), [])
+
+    def test_ranked_by_frequency_then_hsk(self):
+        Word.objects.filter(zi_simp='国家').update(frequency=10)
+        results = self.search('国', limit=5)
+        self.assertEqual(results[0], ('国家', '國家'))
+
+    def test_index_follows_saves(self):
+        w = Word(zi_simp='电脑', zi_trad='電腦', pinyin_number='dian4nao3', english='xylophone')
+        w.save()
+        self.assertEqual(self.search('xylophone'), [('电脑', '電腦')])
+        w.english = 'laptop'
+        w.save()
+        self.assertEqual(self.search('xylophone'), [])
+
+    def test_search_view(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/search.json', {'q': 'nǐ'})
+        self.assertEqual(response.json()['cards'][0]['questions'], ['你', '你'])
+        for limit in ('0', '-5'):
+            response = self.client.get('/search.json', {'q': 'ni', 'limit': limit})
+            self.assertEqual(len(response.json()['cards']), 1)
+
+
+class CoverageTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.ud = make_user_deck(4)
+        self.cards = list(self.ud.cards.order_by('id'))
+        self.deck = Deck.objects.create(name='article')
+        self.deck.cards.add(*[c.card_id for c in self.cards[:3]], Card.objects.create())
+
+    def test_bitsets(self):
+        bits = bitsets.from_ids([0, 9, 17])
+        self.assertEqual(len(bits), 3)
+        self.assertEqual(bitsets.ids(bitsets.update(bits, add=[3], remove=[9])), [0, 3, 17])
+        self.assertEqual(bitsets.count(bitsets.to_int(bits)), 3)
+
+    def test_follows_outcomes(self):
+        first, second, third, fourth = self.cards
+        self.ud.process_sort({'1': {'id': str(first.id), 'result': 'z'}})
+        self.ud.play_outcomes({'1': {'id': str(second.id), 'result': 'x'}})
+        coverage = UserVocabulary.for_user(self.ud.user_id).coverage([self.deck.id])
+        self.assertEqual(coverage[self.deck.id], {
+            'total': 4, 'known': 1, 'learning': 1, 'new': 2, 'percent_known': 25.0,
+        })
+        self.assertEqual(
+            UserVocabulary.rebuild(self.ud.user_id).coverage([self.deck.id]), coverage
+        )
+
+    def test_deck_bitsets_follow_membership(self):
+        UserVocabulary.rebuild(self.ud.user_id)
+        self.ud.process_sort({'1': {'id': str(self.cards[3].id), 'result': 'z'}})
+        vocabulary = UserVocabulary.for_user(self.ud.user_id)
+        self.assertEqual(vocabulary.coverage([self.deck.id])[self.deck.id]['known'], 0)
+        self.deck.cards.add(self.cards[3].card_id)
+        self.assertEqual(vocabulary.coverage([self.deck.id])[self.deck.id]['known'], 1)
+
+    def test_coverage_view(self):
+        self.client.force_login(self.ud.user)
+        with self.assertNumQueries(4):
+            response = self.client.get('/decks/coverage.json', {'decks': self.deck.id})
+        self.assertEqual(response.json()['decks'][str(self.deck.id)]['new'], 4)
+        response = self.client.get('/decks/coverage.json', {'decks': 'x'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ReviewLogTests(TestCase):
+
+    def setUp(self):
+        reviews.reset_buffer()
+        self.addCleanup(reviews.reset_buffer)
+        self.ud = make_user_deck(2)
+        self.ids = list(self.ud.cards.order_by('id').values_list('id', flat=True))
+
+    def answer(self, result):
+        return self.ud.play_outcomes({
+            str(i + 1): {'id': str(card_id), 'result': result}
+            for i, card_id in enumerate(self.ids)
+        })
+
+    def test_events_written_with_outcomes(self):
+        self.answer('z')
+        self.answer('z')
+        events = ReviewEvent.objects.filter(user_card_id=self.ids[0]).order_by('created_at')
+        self.assertEqual([e.ease for e in events], [2, 4])
+
+    @override_settings(FLASHCARDS_REVIEW_WRITE_BEHIND=True)
+    def test_write_behind_in_memory(self):
+        with self.assertNumQueries(1):
+            self.answer('z')
+        self.answer('x')
+        self.assertFalse(ReviewEvent.objects.exists())
+        self.assertEqual(self.ud.cards.get(id=self.ids[0]).ease, 1)
+        self.assertEqual(reviews.flush(), 4)
+        card = self.ud.cards.get(id=self.ids[0])
+        self.assertEqual((card.ease, card.priority), (1, True))
+        self.assertEqual(reviews.flush(), 0)
+
+    def test_write_behind_spool_survives_restart(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'reviews.jsonl')
+            with override_settings(
+                FLASHCARDS_REVIEW_WRITE_BEHIND=True, FLASHCARDS_REVIEW_SPOOL=path
+            ):
+                events = self.answer('z')
+                reviews.reset_buffer()
+                self.assertEqual(reviews.flush(), 2)
+                self.assertFalse(os.path.exists(path))
+                # a spool replayed after a crash is not applied twice
+                ReviewEvent.apply(events, skip_recorded=True)
+        self.assertEqual(self.ud.cards.get(id=self.ids[0]).ease, 2)
+        self.assertEqual(ReviewEvent.objects.count(), 2)
+
+    def test_session_flushes_only_its_deck(self):
+        other = make_user_deck(1, username='other')
+        other_id = other.cards.get().id
+        self.client.force_login(self.ud.user)
+        url = '/user-decks/{}/session.json'.format(self.ud.id)
+        with tempfile.TemporaryDirectory() as directory:
+            for spool in (None, os.path.join(directory, 'reviews.jsonl')):
+                with self.subTest(spool=spool), override_settings(
+                    FLASHCARDS_REVIEW_WRITE_BEHIND=True, FLASHCARDS_REVIEW_SPOOL=spool
+                ):
+                    reviews.reset_buffer()
+                    session = self.client.get(url).json()['session']
+                    written = ReviewEvent.objects.count()
+                    self.answer('z')
+                    other.play_outcomes({'1': {'id': str(other_id), 'result': 'z'}})
+                    self.assertGreater(self.client.get(url).json()['session'], session)
+                    self.assertEqual(ReviewEvent.objects.count(), written + 2)
+                    self.assertEqual(reviews.get_buffer().peek(self.ud.id), [])
+                    self.assertTrue(reviews.get_buffer().peek(other.id))
+                    # the next GET has nothing to write
+                    self.assertEqual(reviews.flush_user_deck(self.ud.id), 0)
+
+    @override_settings(FLASHCARDS_REVIEW_WRITE_BEHIND=True, FLASHCARDS_REVIEW_FLUSH_SIZE=3)
+    def test_flushes_when_full(self):
+        self.answer('z')
+        self.assertFalse(ReviewEvent.objects.exists())
+        self.answer('z')
+        self.assertEqual(ReviewEvent.objects.count(), 4)
+
+
+@skipIf(simulator is None, 'numpy is not installed')
+class SimulatorTests(TestCase):
+
+    def test_matches_the_models(self):
+        # everything is recalled, so both sides answer z to every card
+        params = dict(simulator.DEFAULTS, entry_interval=0)
+        learners = simulator.Learners(1, 40, prior=1, stability=1e9)
+        ud = make_user_deck(40)
+        ids = list(ud.cards.order_by('id').values_list('id', flat=True))
+        for day in range(3):
+            learners.shuffle(np.arange(1), day, params)
+            ud.shuffle()
+            learning = list(ud.cards.filter(learning=True).order_by('id').values_list('id', flat=True))
+            self.assertEqual(
+                [ids[i] for i in np.nonzero(learners.learning[0])[0]], learning
+            )
+            learners.answer(day, params)
+            ud.play_outcomes({
+                str(i + 1): {'id': str(card_id), 'result': 'z'} for i, card_id in enumerate(learning)
+            })
+            self.assertEqual(
+                list(learners.ease[0]), list(ud.cards.order_by('id').values_list('ease', flat=True))
+            )
+
+    def test_from_user_cards(self):
+        learners = simulator.Learners.from_user_cards([[
+            (2, False, True, True, 1, 1),
+            (4, False, False, True, 3, 1),
+            (1, False, False, True, None, None),
+        ]], 0, prior=0, stability=1e9)
+        self.assertEqual(list(learners.seen[0]), [True, True, False])
+        self.assertEqual(list(learners.last[0, :2]), [-1, -3])
+        self.assertAlmostEqual(learners.retention(0)[0], 1.0)
+
+    def test_sweep(self):
+        results = simulator.sweep(
+            {'multiplier': [2, 3], 'card_number': [10, 20]},
+            learners=50, cards=200, days=30,
+        )
+        self.assertEqual(len(results), 4)
+        self.assertEqual(results[3]['params']['multiplier'], 3)
+        self.assertEqual(len(results[0]['curves']['retention']), 30)
+        self.assertGreater(results[1]['seen'], results[0]['seen'])
+
+
+class PrebuildTests(TestCase):
+
+    def make_deck(self, username):
+        ud = make_user_deck(40, username=username)
+        ud.card_number = 5
+        ud.new_card_number = 3
+        ud.save()
+        now = timezone.now()
+        for i, uc in enumerate(ud.cards.order_by('id')[:12]):
+            uc.last_time = now
+            uc.due_at = now + timedelta(days=i % 4)
+            uc.learning = i < 8
+            uc.priority = i % 3 == 0
+            uc.to_study = i != 2
+            uc.save()
+        return ud
+
+    def positions(self, ud):
+        return [c.learning for c in ud.cards.order_by('id')]
+
+    def test_matches_shuffle(self):
+        shuffled = self.make_deck('shuffled')
+        prebuilt = self.make_deck('prebuilt')
+        shuffled.shuffle()
+        call_command('prebuild_sessions', stdout=StringIO())
+        prebuilt.refresh_from_db()
+        self.assertEqual(self.positions(prebuilt), self.positions(shuffled))
+        self.assertEqual(prebuilt.learning_count, shuffled.learning_count)
+        self.assertEqual(prebuilt.seen_count, shuffled.seen_count)
+        self.assertEqual(prebuilt.last_date, timezone.localdate())
+
+    def test_sessions_roll_over(self):
+        ud = self.make_deck('learner')
+        UserDeck.prebuild([ud.id])
+        ud.refresh_from_db()
+        learning = self.positions(ud)
+        with self.assertNumQueries(2):
+            ud.get_flash_cards()
+
+        yesterday = timezone.localdate() - timedelta(days=1)
+        UserDeck.objects.filter(id=ud.id).update(last_date=yesterday)
+        ud.refresh_from_db()
+        session = ud.session
+        ud.get_flash_cards()
+        self.assertEqual(ud.last_date, timezone.localdate())
+        self.assertEqual(ud.session, session + 1)
+        self.assertEqual(self.positions(ud), learning)
+
+    def test_session_view_rolls_over(self):
+        ud = self.make_deck('viewer')
+        self.client.force_login(ud.user)
+        url = '/user-decks/{}/session.json'.format(ud.id)
+        UserDeck.prebuild([ud.id])
+        first = self.client.get(url).json()
+
+        # yesterday's session, still cached, when prebuild_sessions did not run
+        yesterday = timezone.localdate() - timedelta(days=1)
+        UserDeck.objects.filter(id=ud.id).update(last_date=yesterday)
+        ud.refresh_from_db()
+        set_user_deck_session(ud)
+        session = self.client.get(url).json()
+        self.assertEqual(session['session'], first['session'] + 1)
+        ud.refresh_from_db()
+        self.assertEqual(ud.last_date, timezone.localdate())
+        self.assertEqual(self.client.get(url).json(), session)
+
+
+class LexiconTests(HSKTestCase):
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'lexicon.bin')
+        call_command('build_lexicon', self.path, stdout=StringIO())
+        self.lexicon = Lexicon(self.path)
+        self.addCleanup(self.lexicon.close)
+
+    def test_lookups_without_queries(self):
+        word = Word.objects.get(zi_simp='中国')
+        with self.assertNumQueries(0):
+            entries = self.lexicon.lookup('中国')
+            self.assertEqual(self.lexicon.lookup_traditional('中國'), entries)
+            self.assertEqual(self.lexicon.lookup('xyz'), [])
+            self.assertNotIn('中国人民', self.lexicon)
+        self.assertEqual(entries[0].card_id, word.id)
+        self.assertEqual(entries[0].english, word.english)
+        self.assertEqual(entries[0].hsk, 1)
+        self.assertEqual(len(self.lexicon), Word.objects.count())
+
+    def test_segmenter_from_lexicon(self):
+        text = '我们是中国人。'
+        with override_settings(FLASHCARDS_LEXICON_PATH=self.path):
+            reset_segmenter()
+            self.addCleanup(reset_segmenter)
+            self.addCleanup(reset_lexicon)
+            self.assertIsNotNone(get_lexicon())
+            with self.assertNumQueries(0):
+                words = list(get_segmenter().segment(text))
+        self.assertEqual(words, list(Segmenter.from_db().segment(text)))
+
+
+class TransferTests(HSKTestCase):
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'decks.jsonl.gz')
+        user = User(username='learner')
+        user.save()
+        self.ud = UserDeck(user=user)
+        self.ud.populate(Deck.objects.get(name='HSK 1'))
+        self.ud.ingest_outcomes({
+            str(i): {'id': c['id'], 'result': 'z' if i % 2 else 'x'}
+            for i, c in enumerate(self.ud.get_flash_cards()[:10])
+        })
+        self.ud.cards.filter(id__in=self.ud.cards.order_by('id')[:5].values('id')).update(ease=32)
+        UserVocabulary.rebuild(user.id)
+
+    def state(self, ud):
+        return sorted(ud.cards.values_list(
+            'card_id', 'ease', 'last_time', 'priority', 'learning', 'to_study', 'due_at'
+        ))
+
+    def test_round_trip(self):
+        expected = self.state(self.ud)
+        call_command('export_user_decks', self.path, stdout=StringIO())
+        with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+            lines = f.read().replace('"learner"', '"copy"')
+        with open(self.path[:-3], 'w', encoding='utf-8') as f:
+            f.write(lines)
+
+        out = StringIO()
+        call_command('import_user_decks', self.path[:-3], batch_size=100, stdout=out)
+        self.assertIn('1 decks, {} cards loaded'.format(len(expected)), out.getvalue())
+        copy = UserDeck.objects.get(user__username='copy')
+        self.assertEqual(self.state(copy), expected)
+        self.assertEqual(copy.deck, self.ud.deck)
+        self.assertEqual(copy.seen_count, self.ud.seen_count)
+        known = UserVocabulary.for_user(copy.user_id).known
+        self.assertEqual(bitsets.count(bitsets.to_int(known)), 5)
+        self.assertEqual(
+            UserVocabulary.for_user(copy.user_id).known,
+            UserVocabulary.for_user(self.ud.user_id).known,
+        )
+
+    def test_import_owned_cards(self):
+        expected = self.state(self.ud)
+        n = len(expected)
+        call_command('export_user_decks', self.path, stdout=StringIO())
+        loose = self.ud.cards.order_by('id')[:3]
+        UserCard.objects.filter(id__in=loose.values('id')).update(user_deck=None)
+        wiped = dict(ease=1, last_time=None, learning=False, due_at=None)
+        self.ud.cards.update(**wiped)
+        UserCard.objects.filter(user_deck=None).update(**wiped)
+        self.ud.refresh_counters()
+
+        out = StringIO()
+        call_command('import_user_decks', self.path, stdout=out)
+        self.assertIn('1 decks, 3 cards loaded', out.getvalue())
+        self.assertIn('{} cards not found'.format(n - 3), out.getvalue())
+        copy = UserDeck.objects.exclude(id=self.ud.id).get()
+        self.assertEqual(self.state(copy), expected[:3])
+
+        call_command('import_user_decks', self.path, overwrite=True, stdout=StringIO())
+        self.assertEqual(self.state(self.ud), expected[3:])
+        self.ud.refresh_from_db()
+        self.assertGreater(self.ud.learning_count, 0)
+        self.assertEqual(self.ud.learning_count, self.ud.get_stats()['learning'])
+        self.assertEqual(UserCard.objects.filter(user=self.ud.user).count(), n)
+
+
+@override_settings(FLASHCARDS_METRICS=True, FLASHCARDS_METRICS_SLOW_SECONDS=0)
+class MetricsTests(HSKTestCase):
+
+    def setUp(self):
+        super().setUp()
+        metrics.reset_metrics()
+        self.addCleanup(metrics.reset_metrics)
+        self.user = User.objects.create(username='learner', is_staff=True)
+        self.ud = UserDeck(user=self.user)
+        self.ud.populate(Deck.objects.get(name='HSK 1'))
+        self.client.force_login(self.user)
+
+    def test_requests_and_spans(self):
+        self.client.get('/')
+        self.client.get('/user-decks/{}/session.json'.format(self.ud.id))
+        text = self.client.get('/metrics').content.decode()
+        self.assertIn('flashcards_request_seconds_count{view="DeckListView"} 1', text)
+        self.assertIn('flashcards_request_seconds_bucket{view="DeckListView",le="+Inf"} 1', text)
+        self.assertIn('flashcards_span_seconds_count{span="shuffle"} 1', text)
+
+        snapshot = self.client.get('/metrics', {'format': 'json'}).json()
+        session = snapshot['requests']['UserDeckSessionView']
+        self.assertGreater(session['queries'], 0)
+        self.assertEqual(snapshot['spans']['get_flash_cards']['count'], 1)
+        slow = snapshot['slow_requests'][0]
+        self.assertEqual((slow['view'], slow['status']), ('DeckListView', 200))
+        self.assertLessEqual(len(slow['slowest_queries']), 5)
+
+    def test_staff_only(self):
+        self.client.logout()
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+
+    @override_settings(FLASHCARDS_METRICS=False)
+    def test_disabled(self):
+        self.client.get('/')
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+        self.assertEqual(metrics.get_metrics().snapshot()['requests'], {})
+
+
+class BenchmarkTests(TestCase):
+
+    def test_generate_and_run(self):
+        data = benchmark.generate(400, seed=1)
+        self.assertEqual((data['user_cards'], data['users'], data['decks']), (400, 1, 2))
+        ud = UserDeck.objects.get(id=data['user_deck_ids'][0])
+        self.assertEqual(ud.total_count, 400)
+        self.assertTrue(ud.cards.filter(last_time__isnull=False, ease__gt=1).exists())
+        self.assertEqual(ClipDeck.objects.count(), 1)
+
+        results = benchmark.run_benchmarks(data, repeat=1)
+        self.assertEqual(set(results['results']), {
+            'populate', 'populate_incremental', 'shuffle', 'prebuild',
+            'ingest_outcomes', 'stats', 'deck_list', 'deck_words',
+        })
+        self.assertGreater(results['results']['populate']['queries'], 0)
+        rows = benchmark.compare(results, results)
+        self.assertTrue(all(speedup == 1 and queries == 0 for _, _, _, speedup, queries in rows))
+
+
+class ProductionDatabaseTests(SimpleTestCase):
+
+    def test_pragmas_and_immediate_transactions(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_dict = dict(
+            connections['default'].settings_dict,
+            NAME=os.path.join(directory.name, 'db.sqlite3'),
+            OPTIONS={'pragmas': {'journal_mode': 'WAL', 'synchronous': 'NORMAL'}, 'immediate': True},
+        )
+        wrapper = DatabaseWrapper(settings_dict, alias='production')
+        self.addCleanup(wrapper.close)
+        with wrapper.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+        other = sqlite3.connect(settings_dict['NAME'], timeout=0)
+        self.addCleanup(other.close)
+        # what atomic() runs: the write lock is taken at BEGIN, before any write
+        wrapper._start_transaction_under_autocommit()
+        with self.assertRaises(sqlite3.OperationalError):
+            other.execute('BEGIN IMMEDIATE')
+        wrapper.connection.rollback()
+
+    @override_settings(FLASHCARDS_READ_DATABASE='replica')
+    def test_catalogue_reads_go_to_the_replica(self):
+        router = ReadReplicaRouter()
+        self.assertEqual(router.db_for_read(Word), 'replica')
+        self.assertEqual(router.db_for_read(Deck.cards.through), 'replica')
+        self.assertEqual(router.db_for_read(UserCard), 'default')
+        self.assertEqual(router.db_for_write(Word), 'default')
+        self.assertFalse(router.allow_migrate('replica', 'flashcards'))
+        self.assertTrue(router.allow_migrate('default', 'flashcards'))
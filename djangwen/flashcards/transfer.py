@@ -0,0 +1,234 @@
+"""
+user decks and the state of their cards as JSON lines: a header, one
+user_deck line per deck and then one user_card line per card. Cards are
+named by their natural key, [kind, zi_simp, hsk], so a file can be loaded
+into a database whose card ids differ.
+"""
+import gzip
+import io
+import json
+import sys
+from collections import defaultdict
+from datetime import date
+from contextlib import contextmanager
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils.dateparse import parse_date, parse_datetime
+from flashcards.bulk import bulk_create_with_ids, chunked
+from flashcards.models import Character, Deck, Sentence, UserCard, UserDeck, UserVocabulary, Word
+
+VERSION = 1
+DECK_FIELDS = (
+    'name', 'card_number', 'new_card_number', 'card_counter', 'multiplier',
+    'entry_interval', 'last_date',
+)
+CARD_FIELDS = ('ease', 'last_time', 'priority', 'learning', 'sorted', 'to_study', 'due_at')
+CARD_KINDS = (('word', Word), ('character', Character), ('sentence', Sentence))
+
+
+@contextmanager
+def open_stream(path, mode):
+    """
+    path as a text stream, gzipped when it ends in .gz; - is stdin or stdout
+    """
+    if path == '-':
+        yield sys.stdin if mode == 'r' else sys.stdout
+    elif path.endswith('.gz'):
+        with gzip.open(path, mode + 't', encoding='utf-8') as f:
+            yield f
+    else:
+        with io.open(path, mode, encoding='utf-8') as f:
+            yield f
+
+
+def card_key_fields(model):
+    return ('zi_simp', 'hsk') if hasattr(model, 'hsk') else ('zi_simp',)
+
+
+def isoformat(value):
+    # unlike DjangoJSONEncoder, keeps the microseconds of due_at and last_time
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError('{!r} is not JSON serializable'.format(value))
+
+
+def dumps(row):
+    return json.dumps(row, default=isoformat, ensure_ascii=False, separators=(',', ':'))
+
+
+def export_user_decks(out, usernames=None, chunk_size=2000):
+    """
+    streams the user decks of usernames (all of them by default) to out
+    with server-side cursors; returns the number of decks and cards written
+    """
+    user_decks = UserDeck.objects.order_by('id')
+    if usernames:
+        user_decks = user_decks.filter(user__username__in=usernames)
+    out.write(dumps({'type': 'header', 'version': VERSION}) + '\n')
+
+    decks = cards = 0
+    rows = user_decks.values_list('id', 'user__username', 'deck__name', *DECK_FIELDS)
+    for user_deck_id, username, deck, *values in rows.iterator(chunk_size=chunk_size):
+        row = {'type': 'user_deck', 'id': user_deck_id, 'user': username, 'deck': deck}
+        row.update(zip(DECK_FIELDS, values))
+        out.write(dumps(row) + '\n')
+        decks += 1
+
+    key_fields = [
+        ['card__{}__{}'.format(kind, f) for f in card_key_fields(model)]
+        for kind, model in CARD_KINDS
+    ]
+    rows = UserCard.objects.filter(
+        user_deck_id__in=user_decks.values('id')
+    ).order_by('user_deck_id', 'id').values_list(
+        'user_deck_id', *CARD_FIELDS, *sum(key_fields, [])
+    )
+    for user_deck_id, *values in rows.iterator(chunk_size=chunk_size):
+        state, keys = values[:len(CARD_FIELDS)], values[len(CARD_FIELDS):]
+        card = None
+        for (kind, _), fields in zip(CARD_KINDS, key_fields):
+            key, keys = keys[:len(fields)], keys[len(fields):]
+            if card is None and key[0] is not None:
+                card = [kind, key[0], key[1] if len(key) > 1 else None]
+        if card is None:
+            continue
+        row = {'type': 'user_card', 'user_deck': user_deck_id, 'card': card}
+        row.update(zip(CARD_FIELDS, state))
+        out.write(dumps(row) + '\n')
+        cards += 1
+    return decks, cards
+
+
+class CardKeys():
+    """
+    card ids by natural key, looked up a batch at a time and remembered
+    """
+
+    def __init__(self):
+        self.ids = {}
+
+    def resolve(self, keys):
+        missing = {tuple(k) for k in keys} - set(self.ids)
+        for kind, model in CARD_KINDS:
+            simps = {zi_simp for k, zi_simp, _ in missing if k == kind}
+            if not simps:
+                continue
+            for batch in chunked(simps, 500):
+                rows = model.objects.filter(zi_simp__in=batch).order_by('-id')
+                for zi_simp, *hsk, card_id in rows.values_list(*card_key_fields(model), 'id'):
+                    self.ids[kind, zi_simp, hsk[0] if hsk else None] = card_id
+        for key in missing - set(self.ids):
+            self.ids[key] = None
+
+    def __getitem__(self, key):
+        return self.ids[tuple(key)]
+
+
+def import_user_decks(lines, batch_size=2000, overwrite=False):
+    """
+    loads what export_user_decks wrote, batch_size lines per transaction,
+    creating missing users. Cards the user already owns are not duplicated:
+    they move into the imported deck, taking the exported state, unless
+    another deck holds them; with overwrite those take the exported state
+    too but stay where they are. Returns the number of decks and cards
+    imported and the number of cards skipped.
+    """
+    rows = (json.loads(l) for l in lines if l.strip())
+    header = next(rows, None)
+    if not header or header.get('type') != 'header' or header.get('version') != VERSION:
+        raise ValueError('Not a version {} user deck export'.format(VERSION))
+
+    user_decks, users, card_keys = {}, {}, CardKeys()
+    held = set()
+    cards = skipped = 0
+    for batch in chunked(rows, batch_size):
+        with transaction.atomic():
+            for row in batch:
+                if row['type'] == 'user_deck':
+                    user_decks[row['id']] = import_user_deck(row, users)
+            card_rows = [r for r in batch if r['type'] == 'user_card']
+            card_keys.resolve(r['card'] for r in card_rows)
+            imported, changed = import_user_cards(
+                card_rows, user_decks, card_keys, batch_size, overwrite
+            )
+            cards += imported
+            skipped += len(card_rows) - imported
+            held |= changed
+
+    held -= {d.id for d in user_decks.values()}
+    for user_deck in [*user_decks.values(), *UserDeck.objects.filter(id__in=held)]:
+        user_deck.refresh_counters()
+    for user_id in {d.user_id for d in user_decks.values()}:
+        UserVocabulary.rebuild(user_id)
+    return len(user_decks), cards, skipped
+
+
+def import_user_deck(row, users):
+    if row['user'] not in users:
+        user = User.objects.filter(username=row['user']).first()
+        if user is None:
+            user = User(username=row['user'])
+            user.set_unusable_password()
+            user.save()
+        users[row['user']] = user.id
+    fields = {f: row[f] for f in DECK_FIELDS}
+    fields['last_date'] = fields['last_date'] and parse_date(fields['last_date'])
+    user_deck = UserDeck(
+        user_id=users[row['user']],
+        deck=Deck.objects.filter(name=row['deck']).first() if row['deck'] else None,
+        **fields
+    )
+    user_deck.save()
+    return user_deck
+
+
+def card_state(row):
+    return {
+        f: parse_datetime(row[f]) if f in ('last_time', 'due_at') and row[f] else row[f]
+        for f in CARD_FIELDS
+    }
+
+
+def import_user_cards(rows, user_decks, card_keys, batch_size, overwrite=False):
+    """
+    returns the number of cards imported and the ids of the other decks
+    whose cards took the exported state
+    """
+    rows = [
+        (user_decks[r['user_deck']], card_keys[r['card']], r) for r in rows
+        if r['user_deck'] in user_decks and card_keys[r['card']] is not None
+    ]
+    owned = {}
+    for user_id in {d.user_id for d, _, _ in rows}:
+        card_ids = [c for d, c, _ in rows if d.user_id == user_id]
+        for batch in chunked(card_ids, 500):
+            owned.update(
+                ((user_id, card_id), (user_card_id, user_deck_id))
+                for card_id, user_card_id, user_deck_id in UserCard.objects.filter(
+                    user_id=user_id, card_id__in=batch
+                ).values_list('card_id', 'id', 'user_deck_id')
+            )
+
+    new_cards, updated, held, imported = [], [], set(), set()
+    for user_deck, card_id, row in rows:
+        key = (user_deck.user_id, card_id)
+        user_card_id, user_deck_id = owned.get(key, (None, None))
+        if key in imported:
+            continue
+        if user_card_id is None:
+            new_cards.append(UserCard(
+                user_id=user_deck.user_id, card_id=card_id, user_deck_id=user_deck.id,
+                **card_state(row)
+            ))
+        elif user_deck_id is None or overwrite:
+            updated.append(UserCard(
+                id=user_card_id, user_deck_id=user_deck_id or user_deck.id, **card_state(row)
+            ))
+            if user_deck_id is not None:
+                held.add(user_deck_id)
+        else:
+            continue
+        imported.add(key)
+    bulk_create_with_ids(UserCard, new_cards, batch_size)
+    UserCard.objects.bulk_update(updated, ('user_deck',) + CARD_FIELDS, batch_size)
+    return len(new_cards) + len(updated), held
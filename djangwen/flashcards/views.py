@@ -1,25 +1,349 @@
-from django.shortcuts import render
+import json
+from django.conf import settings
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.core.cache import cache
+from django.db import DatabaseError, transaction
+from django.db.models import Q
+from django.http import (
+    Http404, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, JsonResponse
+)
+from django.shortcuts import get_object_or_404, render
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.decorators import method_decorator
+from django.utils.http import quote_etag
+from django.views import View
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import condition
+from django.views.generic import TemplateView
+from flashcards import metrics, reviews
+from flashcards.caching import (
+    catalogue_etag,
+    catalogue_last_modified,
+    deck_list_etag,
+    get_catalogue_version,
+    get_deck_version,
+    get_user_deck_session,
+    session_payload_key,
+    set_user_deck_session
+)
 from flashcards.models import (
+    ArticleDeck,
+    ClipDeck,
     Deck,
+    Job,
+    SearchTerm,
+    UserDeck,
+    UserVocabulary,
     Word
 )
+from flashcards.scraper import check_url
 from django.views.generic.list import ListView
 
 
+catalogue_condition = method_decorator(
+    condition(etag_func=catalogue_etag, last_modified_func=catalogue_last_modified),
+    name='get'
+)
+# no Last-Modified, which cannot tell a logged out page from a logged in one
+deck_list_condition = method_decorator(condition(etag_func=deck_list_etag), name='get')
+
+
+@deck_list_condition
 class DeckListView(ListView):
     model = Deck
     template_name = 'deck_list.html'
     paginate_by = 12
 
+    def get_queryset(self):
+        return Deck.get_catalogue()
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['catalogue_version'] = get_catalogue_version().timestamp()
+        return context
+
+
+@catalogue_condition
+class DeckCatalogueView(View):
+
+    def get(self, request):
+        key = 'catalogue:json:{}'.format(get_catalogue_version().timestamp())
+        content = cache.get(key)
+        if content is None:
+            content = json.dumps(Deck.get_all_json(), separators=(',', ':'))
+            cache.set(key, content, 24 * 60 * 60)
+        return HttpResponse(content, content_type='application/json')
+
+
+class DeckCoverageView(LoginRequiredMixin, View):
+    """
+    how much of each deck the user knows: ?decks=1,2,3 or every deck
+    """
+
+    def get(self, request):
+        if request.GET.get('decks'):
+            try:
+                deck_ids = [int(d) for d in request.GET['decks'].split(',')]
+            except ValueError:
+                return HttpResponseBadRequest('decks must be comma separated ids')
+        else:
+            deck_ids = list(Deck.objects.values_list('id', flat=True))
+        coverage = UserVocabulary.for_user(request.user.id).coverage(deck_ids)
+        return JsonResponse({'decks': coverage})
+
+
+class DeckCreateView(LoginRequiredMixin, View):
+    """
+    creates a ClipDeck from {"name": ..., "text": ...} or an ArticleDeck
+    from {"url": ...} and answers 202 at once; run_jobs processes the deck
+    and DeckStatusView reports how far it got
+    """
+
+    def post(self, request):
+        try:
+            body = json.loads(request.body)
+            if body.get('url'):
+                check_url(str(body['url']), public_only=True)
+                deck = ArticleDeck(type='article', name=str(body['url'])[:64], url=str(body['url'])[:512])
+            elif body.get('text'):
+                text = str(body['text'])
+                deck = ClipDeck(type='clip', name=str(body.get('name') or text)[:64], text=text)
+            else:
+                raise ValueError('Either url or text is required')
+        except (AttributeError, TypeError, ValueError) as e:
+            return HttpResponseBadRequest(str(e))
+        with transaction.atomic():
+            deck.save()
+        return JsonResponse({
+            'id': deck.id,
+            'status': deck.status,
+            'status_url': reverse('deck-status', args=[deck.id]),
+        }, status=202)
+
+
+class DeckStatusView(View):
+
+    def get(self, request, deck_id):
+        # the status changes as the job runs, so it is read from the primary
+        deck = get_object_or_404(
+            Deck.objects.using('default').values('articledeck__status', 'clipdeck__status'),
+            id=deck_id,
+        )
+        job = Job.objects.filter(deck_id=deck_id).order_by('-id').values(
+            'status', 'attempts', 'run_after'
+        ).first()
+        return JsonResponse({
+            'id': deck_id,
+            'status': deck['articledeck__status'] or deck['clipdeck__status'] or 'ready',
+            'job': job,
+        })
+
 
 class DeckWordsListView(ListView):
     model = Word
     template_name = 'browse_deck.html'
+    context_object_name = 'word_list'
+    page_size = 100
+    fields = (
+        'zi_simp', 'zi_trad', 'pinyin_number', 'pinyin_tone', 'english', 'frequency'
+    )
+
+    def get(self, request, *args, **kwargs):
+        deck_id = self.kwargs.get('deck_id')
+        key = 'deck-words:{}:{}:{}'.format(
+            deck_id,
+            get_deck_version(deck_id).timestamp(),
+            request.GET.get('after', '')
+        )
+        content = cache.get(key)
+        if content is None:
+            self.deck = get_object_or_404(Deck.objects.only('id', 'name'), id=deck_id)
+            response = super().get(request, *args, **kwargs)
+            content = response.render().content
+            cache.set(key, content, 24 * 60 * 60)
+        return HttpResponse(content)
+
+    def get_cursor(self):
+        after = self.request.GET.get('after')
+        if not after:
+            return None
+        try:
+            frequency, card_id = after.split('.')
+            return int(frequency), int(card_id)
+        except ValueError:
+            raise Http404('Invalid cursor "{}"'.format(after))
+
+    def get_queryset(self):
+        words = Word.objects.filter(deck__id=self.kwargs.get('deck_id'))
+        words = words.only(*self.fields).order_by('-frequency', 'id')
+        cursor = self.get_cursor()
+        if cursor is not None:
+            frequency, card_id = cursor
+            words = words.filter(
+                Q(frequency__lt=frequency) | Q(frequency=frequency, id__gt=card_id)
+            )
+        return words
+
+    def get_context_data(self, **kwargs):
+        words = list(self.object_list[:self.page_size + 1])
+        context = super().get_context_data(object_list=words[:self.page_size], **kwargs)
+        context['deck'] = self.deck
+        if len(words) > self.page_size:
+            last = words[self.page_size - 1]
+            context['next_cursor'] = '{}.{}'.format(last.frequency, last.id)
+        return context
+
+
+class UserDeckOutcomesView(LoginRequiredMixin, View):
+    """
+    takes either every outcome of a session at once or numbered batches of
+    them, {"run": ..., "seq": ..., "outcomes": {...}}, which can be retried
+    """
+    sorting = False
+
+    def post(self, request, user_deck_id):
+        user_deck = get_object_or_404(
+            UserDeck, id=user_deck_id, user=request.user
+        )
+        try:
+            body = json.loads(request.body)
+            batch = None
+            if 'seq' in body:
+                batch = (str(body['run'])[:64], int(body['seq']))
+                body = body['outcomes']
+            events = user_deck.ingest_outcomes(body, sorting=self.sorting, batch=batch)
+        except (AttributeError, KeyError, TypeError, ValueError) as e:
+            return HttpResponseBadRequest(str(e))
+        response = {'cards': len(events)}
+        if batch is not None:
+            response['seq'] = batch[1]
+        return JsonResponse(response)
+
+
+@method_decorator(gzip_page, name='get')
+class UserDeckSessionView(LoginRequiredMixin, View):
+    """
+    the cards of the session, a page at a time: ?limit= cards with ids
+    after ?after=, and the cursor of the next page in "next"
+    """
+    page_size = 50
+    max_page_size = 200
+
+    def get_page(self):
+        try:
+            after = self.request.GET.get('after')
+            after = int(after) if after else None
+            limit = min(int(self.request.GET.get('limit', self.page_size)), self.max_page_size)
+        except ValueError:
+            raise Http404('Invalid cursor')
+        return after, max(limit, 1)
+
+    def get_state(self, user_deck_id):
+        state = get_user_deck_session(user_deck_id)
+        if state is None:
+            state = set_user_deck_session(get_object_or_404(UserDeck, id=user_deck_id))
+        return state
+
+    def get(self, request, user_deck_id):
+        sorting = request.GET.get('sort') == '1'
+        after, limit = self.get_page()
+        page = '{}-{}'.format(after or '', limit)
+        user_id, session, last_date = self.get_state(user_deck_id)
+        if user_id != request.user.id:
+            raise Http404('No user deck {}'.format(user_deck_id))
+        if reviews.write_behind():
+            # the session has to start from the answers given to this deck;
+            # if they cannot be written now they wait for the next flush
+            try:
+                flushed = reviews.flush_user_deck(user_deck_id)
+            except DatabaseError:
+                flushed = 0
+            if flushed:
+                user_id, session, last_date = self.get_state(user_deck_id)
+
+        today = timezone.localdate()
+        content = None
+        if last_date == today:
+            content = cache.get(session_payload_key(user_deck_id, session, today, sorting, page))
+        if content is None:
+            # on a new day get_flash_cards shuffles the deck into a new session
+            user_deck = get_object_or_404(UserDeck, id=user_deck_id, user=request.user)
+            cards = user_deck.get_flash_cards(sorting, after=after, limit=limit + 1)
+            session = user_deck.session
+            content = json.dumps({
+                'user_deck': user_deck.id,
+                'session': session,
+                'sorting': sorting,
+                'total': user_deck.unsorted_count if sorting else user_deck.learning_count,
+                'cards': cards[:limit],
+                'next': cards[limit - 1]['id'] if len(cards) > limit else None,
+            }, ensure_ascii=False, separators=(',', ':')).encode()
+            cache.set(
+                session_payload_key(user_deck_id, session, today, sorting, page), content, 24 * 60 * 60
+            )
+
+        etag = quote_etag('session-{}-{}-{}-{}-{}'.format(
+            user_deck_id, session, today.isoformat(), int(sorting), page
+        ))
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(content, content_type='application/json; charset=utf-8')
+        response['ETag'] = etag
+        return response
+
+
+class UserDeckPlayView(LoginRequiredMixin, TemplateView):
+    template_name = 'flash.html'
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['deck'] = Deck.objects.get(id=self.kwargs.get('deck_id'))
+        user_deck = get_object_or_404(
+            UserDeck.objects.only('id', 'user'), id=kwargs['user_deck_id'], user=self.request.user
+        )
+        sorting = self.request.GET.get('sort') == '1'
+        session_url = reverse('user-deck-session', kwargs={'user_deck_id': user_deck.id})
+        outcomes_url = 'user-deck-sort' if sorting else 'user-deck-outcomes'
+        context['deck_id'] = user_deck.id
+        context['session_url'] = session_url + ('?sort=1' if sorting else '')
+        context['redirect_url'] = reverse(outcomes_url, kwargs={'user_deck_id': user_deck.id})
+        context['done_url'] = reverse('deck-list')
         return context
 
-    def get_queryset(self):
-        return Word.objects.filter(deck__id=self.kwargs.get('deck_id'))
+
+class SearchView(View):
+
+    def get(self, request):
+        try:
+            limit = min(int(request.GET.get('limit', 20)), 100)
+        except ValueError:
+            return HttpResponseBadRequest('limit must be an integer')
+        faces = SearchTerm.search(request.GET.get('q', ''), limit=max(limit, 1))
+        return JsonResponse({'cards': [{
+            'id': f.card_id,
+            'kind': f.kind,
+            'questions': f.questions,
+            'answers': f.answers,
+            'hsk': f.hsk,
+            'frequency': f.card.frequency,
+        } for f in faces]}, json_dumps_params={'ensure_ascii': False})
+
+
+class MetricsView(View):
+    """
+    this process's flashcards.metrics, as Prometheus text or with
+    ?format=json as JSON with the slow request samples; for staff and
+    INTERNAL_IPS only
+    """
+
+    def get(self, request):
+        if not metrics.enabled():
+            raise Http404('Metrics are disabled')
+        if not request.user.is_staff and request.META.get('REMOTE_ADDR') not in settings.INTERNAL_IPS:
+            return HttpResponseForbidden()
+        if request.GET.get('format') == 'json':
+            return JsonResponse(metrics.get_metrics().snapshot())
+        return HttpResponse(
+            metrics.get_metrics().prometheus(), content_type='text/plain; version=0.0.4'
+        )